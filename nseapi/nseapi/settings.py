@@ -185,6 +185,67 @@ CACHES = {
 # Cache stock data for 1 hour
 STOCK_CACHE_TIMEOUT = 60 * 60
 
+# Quotes are reused for this many seconds within an NseService refresh
+QUOTE_CACHE_TTL = 5 * 60
+QUOTE_CACHE_SIZE = 5000
+
+# Read endpoints serve a per-process snapshot of market data and check the
+# data version for changes at most this often (seconds)
+MARKET_SNAPSHOT_POLL_INTERVAL = 1.0
+
+# Fundamentals (market cap, P/E, sector, name) are refetched once they are
+# older than this; prices are refreshed on every cycle
+FUNDAMENTALS_TTL = timedelta(hours=24)
+
+# Upstream market-data ingestion: requests per second, burst size and the
+# maximum number of fetches in flight at once
+INGESTION_RATE_LIMIT = 5
+INGESTION_BURST = 10
+INGESTION_MAX_IN_FLIGHT = 10
+
+# Concurrency adapts between these bounds (AIMD): it is halved when the
+# provider throttles us (401/429/timeouts) and grows back on success. If it
+# keeps throttling at the minimum, the circuit breaker opens after
+# INGESTION_BREAKER_THRESHOLD throttled requests in a row and rejects upstream
+# calls for INGESTION_BREAKER_RESET seconds.
+INGESTION_MIN_IN_FLIGHT = 1
+INGESTION_BREAKER_THRESHOLD = 5
+INGESTION_BREAKER_RESET = 30
+
+# `manage.py run_scheduler` refresh cadence during market hours: the hot tier
+# (watchlisted symbols plus the SCHEDULER_HOT_SIZE largest by market cap)
+# every SCHEDULER_HOT_INTERVAL seconds, everything else every
+# SCHEDULER_COLD_INTERVAL seconds. Outside market hours it only checks
+# whether the market has opened, every SCHEDULER_IDLE_INTERVAL seconds.
+SCHEDULER_HOT_SIZE = 100
+SCHEDULER_HOT_INTERVAL = 5
+SCHEDULER_COLD_INTERVAL = 5 * 60
+SCHEDULER_COLD_BATCH = 200
+SCHEDULER_IDLE_INTERVAL = 60
+# While the market is open, sector performance is recomputed from the stored
+# prices at most every SCHEDULER_SECTOR_INTERVAL seconds, once prices changed
+SCHEDULER_SECTOR_INTERVAL = 60
+
+# Background jobs queued through the API (stocks.jobs). Jobs run on a pool of
+# JOB_WORKERS threads in the web process unless JOB_RUN_IN_PROCESS is off, in
+# which case `manage.py run_job_worker` must be running. Running jobs without
+# a heartbeat for JOB_TIMEOUT are marked failed.
+JOB_WORKERS = 2
+JOB_RUN_IN_PROCESS = os.environ.get('JOB_RUN_IN_PROCESS', 'True') == 'True'
+JOB_TIMEOUT = timedelta(minutes=30)
+
+# Market data provider used by ingestion: 'yfinance' (live) or 'local'
+# (offline replay of files generated by `manage.py seed_market_replay`)
+MARKET_DATA_PROVIDER = os.environ.get('MARKET_DATA_PROVIDER', 'yfinance')
+MARKET_DATA_REPLAY_DIR = BASE_DIR / 'replay_data'
+MARKET_DATA_PROVIDER_OPTIONS = {
+    'local': {'latency': 0.0, 'error_rate': 0.0},
+}
+
+# On-disk cache for upstream downloads (conditional GETs) and parsed listings
+HTTP_CACHE_DIR = BASE_DIR / '.cache' / 'http'
+LISTING_CACHE_DIR = BASE_DIR / '.cache' / 'listings'
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
@@ -63,7 +63,7 @@ const App = () => {
         setError(null);
 
         // Fetch all stocks
-        const stocksResponse = await axios.get(`${API_BASE_URL}/stocks/`);
+        const stocksResponse = await axios.get(`${API_BASE_URL}/stocks/?all=1`);
         console.log('Raw stocks response:', stocksResponse);
 
         // Validate stocks data
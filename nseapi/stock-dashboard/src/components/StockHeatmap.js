@@ -98,6 +98,8 @@ const StockHeatmap = () => {
     return matchesSearch && matchesPerformance;
   });
 
+  const matchingSymbols = new Set(filteredStocks.map(stock => stock.symbol));
+
   const handleRetry = () => {
     setRetryCount(prev => prev + 1);
   };
@@ -272,31 +274,41 @@ const StockHeatmap = () => {
         )}
       </div>
 
-      <div className="heatmap-grid">
-        {filteredStocks.length === 0 ? (
+      {/* Tile rectangles are laid out by the server as fractions of a 2:1 canvas */}
+      <div className="heatmap-treemap">
+        {filteredStocks.length === 0 && (
           <div className="no-results">
             <i className="fas fa-search"></i>
             <p>No stocks match your current filters. Try adjusting your search criteria.</p>
           </div>
-        ) : (
-          filteredStocks.map(stock => (
+        )}
+        {stocks.map(stock => {
+          const change = stock.percent_change;
+          const hasChange = change !== null && change !== undefined;
+          return (
             <div 
               key={stock.symbol}
-              className="heatmap-tile"
+              className={`treemap-tile ${matchingSymbols.has(stock.symbol) ? '' : 'dimmed'}`}
+              title={`${stock.name} (${stock.sector}): ${hasChange ? `${change.toFixed(2)}%` : 'no change data'}`}
               style={{ 
-                backgroundColor: getColorByPerformance(stock.percent_change),
-                borderColor: stock.percent_change >= 0 ? '#269f42' : '#e34c26'
+                left: `${stock.x * 100}%`,
+                top: `${stock.y * 100}%`,
+                width: `${stock.w * 100}%`,
+                height: `${stock.h * 100}%`,
+                backgroundColor: hasChange ? getColorByPerformance(change) : '#c5c5c5'
               }}
             >
-              <div className="tile-symbol">{stock.symbol}</div>
-              <div className="tile-price">₹{stock.price.toFixed(2)}</div>
-              <div className={`tile-change ${stock.percent_change >= 0 ? 'positive' : 'negative'}`}>
-                {stock.percent_change >= 0 ? '+' : ''}{stock.percent_change.toFixed(2)}%
-              </div>
-              <div className="tile-sector">{stock.sector || 'Unknown'}</div>
+              {stock.w * stock.h > 0.0004 && (
+                <>
+                  <div className="tile-symbol">{stock.symbol}</div>
+                  <div className="tile-change">
+                    {hasChange ? `${change >= 0 ? '+' : ''}${change.toFixed(2)}%` : '–'}
+                  </div>
+                </>
+              )}
             </div>
-          ))
-        )}
+          );
+        })}
       </div>
     </div>
   );
@@ -1,9 +1,12 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
-from .models import Stock, TopSector, User
+from .models import DataVersion, IngestionJob, IngestionRun, IngestionSymbol, Stock, TopSector, User
 
 admin.site.register(Stock)
 admin.site.register(TopSector)
 admin.site.register(User, UserAdmin)
-
+admin.site.register(IngestionRun)
+admin.site.register(IngestionSymbol)
+admin.site.register(IngestionJob)
+admin.site.register(DataVersion)
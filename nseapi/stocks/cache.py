@@ -0,0 +1,171 @@
+"""Caches for upstream market data."""
+
+import hashlib
+import json
+import pickle
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from pathlib import Path
+
+import requests
+
+# ``validators`` holds the ETag and Last-Modified of a fresh download until
+# HttpCache.commit() stores them
+CachedResponse = namedtuple('CachedResponse', ['content', 'sha256', 'not_modified', 'validators'], defaults=[None])
+
+
+class QuoteCache:
+    """Thread-safe quote cache bounded by age and size.
+
+    Entries expire ``ttl`` seconds after they were stored and the least
+    recently used entry is evicted once ``maxsize`` is reached. Hit and miss
+    counters make it easy to report how much upstream traffic was saved.
+    """
+
+    def __init__(self, ttl=60, maxsize=5000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Return counters describing cache effectiveness."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._entries),
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+class HttpCache:
+    """On-disk cache for upstream downloads using conditional requests.
+
+    The body of each URL is stored with its ``ETag`` and ``Last-Modified``
+    headers. Later requests send ``If-None-Match``/``If-Modified-Since`` and
+    a 304 answer is served from disk without transferring the body again.
+
+    A fresh download is only stored by ``commit()``, which the caller makes
+    once it has processed the body. If processing fails, the next ``get()``
+    downloads the body again instead of being told it has not changed.
+    """
+
+    def __init__(self, directory, timeout=15):
+        self.directory = Path(directory)
+        self.timeout = timeout
+
+    def _paths(self, url):
+        key = hashlib.sha1(url.encode()).hexdigest()
+        return self.directory / f"{key}.json", self.directory / f"{key}.body"
+
+    def get(self, url, force=False):
+        """Fetch ``url``, revalidating any cached copy.
+
+        Args:
+            url (str): URL to download
+            force (bool): Ignore the cached validators and download the body
+
+        Returns:
+            CachedResponse: Body, its SHA-256, whether the server answered 304
+                and the validators to ``commit()``
+        """
+        meta_path, body_path = self._paths(url)
+        meta = {}
+        if not force and meta_path.exists() and body_path.exists():
+            meta = json.loads(meta_path.read_text())
+
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+        response = requests.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and meta:
+            return CachedResponse(body_path.read_bytes(), meta['sha256'], True)
+        response.raise_for_status()
+
+        content = response.content
+        return CachedResponse(content, hashlib.sha256(content).hexdigest(), False, {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        })
+
+    def commit(self, url, response):
+        """Store a downloaded body and its validators for later revalidation.
+
+        Args:
+            url (str): URL the body was downloaded from
+            response (CachedResponse): Result of ``get(url)``; 304 answers are
+                already stored and are ignored
+        """
+        if response.not_modified:
+            return
+        meta_path, body_path = self._paths(url)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        body_path.write_bytes(response.content)
+        meta_path.write_text(json.dumps({
+            'url': url,
+            **(response.validators or {}),
+            'sha256': response.sha256,
+        }))
+
+
+class ParsedCache:
+    """Stores parsed objects as pickles keyed by the hash of their source."""
+
+    def __init__(self, directory, prefix):
+        self.directory = Path(directory)
+        self.prefix = prefix
+
+    def _path(self, content_hash):
+        return self.directory / f"{self.prefix}-{content_hash}.pickle"
+
+    def get(self, content_hash):
+        path = self._path(content_hash)
+        if not path.exists():
+            return None
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def set(self, content_hash, value):
+        """Store ``value`` and drop entries for older content."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for stale in self.directory.glob(f"{self.prefix}-*.pickle"):
+            stale.unlink()
+        with open(self._path(content_hash), 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
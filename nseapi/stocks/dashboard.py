@@ -0,0 +1,65 @@
+"""Shared aggregation for the dashboard endpoints.
+
+Every dashboard view builds its numbers here so they agree with each other
+and stay within a fixed number of queries regardless of how many stocks are
+listed:
+
+- ``market_breadth``: 1 query (total, gainers and losers counted together
+  with conditional aggregates)
+- ``top_lists``: 1 query per list (gainers, losers, most active), each an
+  indexed ``ORDER BY ... LIMIT``
+- ``top_sectors``: 1 query
+
+The query budgets below are enforced by the tests in ``stocks/tests.py``.
+"""
+
+from django.db.models import Count, Q
+from django.db.models.functions import Abs
+
+from .models import Stock, TopSector
+
+# Queries needed by market_breadth() and by a full dashboard payload
+BREADTH_QUERIES = 1
+DASHBOARD_QUERIES = 5
+
+# Columns the dashboard lists serialize (see StockSerializer)
+LIST_FIELDS = [
+    'id', 'symbol', 'name', 'sector', 'current_price', 'change_percentage',
+    'high_52w', 'low_52w', 'market_cap', 'pe_ratio'
+]
+
+
+def market_breadth():
+    """Count all, advancing and declining stocks in a single query.
+
+    Returns:
+        dict: ``total_stocks``, ``gainers_count`` and ``losers_count``
+    """
+    return Stock.objects.aggregate(
+        total_stocks=Count('id'),
+        gainers_count=Count('id', filter=Q(change_percentage__gt=0)),
+        losers_count=Count('id', filter=Q(change_percentage__lt=0)),
+    )
+
+
+def top_lists(limit=5):
+    """Return the top gainers, top losers and largest stocks by market cap.
+
+    Each list is evaluated once (no extra ``.count()`` queries) and only
+    loads the columns the dashboard serializes.
+
+    Returns:
+        dict: ``top_gainers``, ``top_losers`` and ``most_active`` -> list of Stock
+    """
+    stocks = Stock.objects.only(*LIST_FIELDS)
+    return {
+        'top_gainers': list(stocks.filter(change_percentage__gt=0).order_by('-change_percentage')[:limit]),
+        'top_losers': list(stocks.filter(change_percentage__lt=0).order_by('change_percentage')[:limit]),
+        'most_active': list(stocks.exclude(market_cap__isnull=True).order_by('-market_cap')[:limit]),
+    }
+
+
+def top_sectors(limit=5):
+    """Return the ``limit`` sectors that moved most, best performing first."""
+    movers = TopSector.objects.order_by(Abs('performance').desc(), 'name')[:limit]
+    return sorted(movers, key=lambda sector: sector.change_percentage, reverse=True)
@@ -0,0 +1,165 @@
+"""Negotiated encodings for the bulk market data endpoints.
+
+The heatmap and the full stock listing send every stock in one response.
+Besides the default JSON list of objects they can be sent columnar (one
+array per field, so keys are not repeated per row) as MessagePack, and
+compressed with gzip or brotli:
+
+- ``Accept: application/msgpack`` (or ``?format=msgpack``) selects the
+  columnar MessagePack body
+- ``Accept-Encoding: br`` / ``gzip`` compresses it
+
+Each body is encoded once per data version and kept in the market
+snapshot, so the cost of compressing is not paid per request. msgpack and
+brotli are in requirements.txt; if either is missing, JSON or gzip is used.
+"""
+
+import gzip
+
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from .snapshot import drf_json
+
+try:
+    import msgpack
+except ImportError:  # in requirements.txt; without it the columnar format is not offered
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # in requirements.txt; without it gzip is used instead
+    brotli = None
+
+JSON = 'json'
+MSGPACK = 'msgpack'
+
+CONTENT_TYPES = {
+    JSON: 'application/json',
+    MSGPACK: 'application/msgpack',
+}
+MSGPACK_MEDIA_TYPES = ('application/msgpack', 'application/x-msgpack')
+
+GZIP_LEVEL = 6
+# Quality 5 compresses better than gzip -9 at a fraction of the time of quality 11
+BROTLI_QUALITY = 5
+
+
+def columns(rows):
+    """Turn a list of dicts sharing the same keys into ``{field: [values]}``."""
+    if not rows:
+        return {}
+    return {field: [row[field] for row in rows] for field in rows[0]}
+
+
+def encode(rows, fmt):
+    """Encode ``rows`` as the JSON list of objects or columnar MessagePack."""
+    if fmt == MSGPACK:
+        return msgpack.packb(columns(rows))
+    return drf_json(rows)
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+
+def available_formats():
+    return [JSON, MSGPACK] if msgpack else [JSON]
+
+
+def available_encodings():
+    return (['br'] if brotli else []) + ['gzip', 'identity']
+
+
+def _parse_accept(header):
+    """Split an Accept or Accept-Encoding header into ``(value, quality)`` pairs.
+
+    Items keep their order; an unparsable q-value counts as 0 (refused).
+    """
+    items = []
+    for item in header.split(','):
+        value, *params = [part.strip() for part in item.split(';')]
+        quality = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if value:
+            items.append((value.lower(), quality))
+    return items
+
+
+def _accepted_codings(header):
+    """Return the codings of an Accept-Encoding header that are not refused (q=0)."""
+    return {coding for coding, quality in _parse_accept(header) if quality > 0}
+
+
+def _preferred_format(header):
+    """Pick JSON or MSGPACK from an Accept header, honoring q-values and order."""
+    # sorted() is stable, so equal q-values keep the client's order
+    for media_type, quality in sorted(_parse_accept(header), key=lambda item: -item[1]):
+        if quality <= 0:
+            break
+        if media_type in MSGPACK_MEDIA_TYPES:
+            return MSGPACK
+        if media_type in ('application/json', 'application/*', '*/*'):
+            return JSON
+    return JSON
+
+
+def negotiate(request):
+    """Pick the body format and content coding for ``request``.
+
+    Returns:
+        tuple: (JSON or MSGPACK, 'br', 'gzip' or 'identity')
+    """
+    fmt = JSON
+    if msgpack:
+        if request.GET.get('format') == MSGPACK:
+            fmt = MSGPACK
+        else:
+            fmt = _preferred_format(request.META.get('HTTP_ACCEPT', ''))
+
+    codings = _accepted_codings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    for encoding in available_encodings():
+        if encoding in codings or (encoding != 'identity' and '*' in codings):
+            return fmt, encoding
+    return fmt, 'identity'
+
+
+def bulk_body(market, name, rows, fmt, encoding, cache=True):
+    """Return the body of the bulk view ``name`` in ``fmt`` and ``encoding``.
+
+    The body is encoded once per version, or on every call without ``cache``.
+    """
+    if not cache:
+        return compress(encode(rows(), fmt), encoding)
+    body = market.view(f"{name}:{fmt}", lambda: encode(rows(), fmt))
+    if encoding != 'identity':
+        body = market.view(f"{name}:{fmt}:{encoding}", lambda: compress(body, encoding))
+    return body
+
+
+def bulk_response(request, market, name, rows, cache=True):
+    """Serve the bulk view ``name`` of ``market`` in the negotiated encoding.
+
+    Args:
+        request: The request, for its Accept and Accept-Encoding headers
+        market (MarketSnapshot): Snapshot that caches the encoded bodies
+        name (str): Snapshot view name of the endpoint
+        rows (callable): Returns the rows as a list of dicts
+        cache (bool): Keep the encoded body in the snapshot
+    """
+    fmt, encoding = negotiate(request)
+    body = bulk_body(market, name, rows, fmt, encoding, cache)
+    response = HttpResponse(body, content_type=CONTENT_TYPES[fmt])
+    if encoding != 'identity':
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+    return response
@@ -0,0 +1,46 @@
+"""Field-level refresh policy for Stock rows.
+
+Prices are refreshed on every ingestion cycle. Fundamentals (market cap,
+P/E ratio, sector, company name) change slowly and come from the expensive
+``info`` call, so they are only refetched once they are older than
+``settings.FUNDAMENTALS_TTL``.
+"""
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Stock
+
+FUNDAMENTAL_FIELDS = ['name', 'sector', 'market_cap', 'pe_ratio', 'fundamentals_updated_at']
+
+
+def fundamentals_cutoff(now=None):
+    """Fundamentals refreshed before this moment are due again."""
+    return (now or timezone.now()) - settings.FUNDAMENTALS_TTL
+
+
+def stale_fundamentals(symbols, now=None):
+    """Return the subset of symbols whose fundamentals need refreshing.
+
+    Symbols without a Stock row are treated as stale.
+    """
+    symbols = set(symbols)
+    fresh = Stock.objects.filter(
+        symbol__in=symbols,
+        fundamentals_updated_at__gte=fundamentals_cutoff(now)
+    ).values_list('symbol', flat=True)
+    return symbols - set(fresh)
+
+
+def fresh_fundamentals(symbols, now=None):
+    """Return stored fundamentals for symbols that are still within the TTL.
+
+    Returns:
+        dict: symbol -> dict of FUNDAMENTAL_FIELDS values
+    """
+    rows = Stock.objects.filter(
+        Q(symbol__in=list(symbols)) &
+        Q(fundamentals_updated_at__gte=fundamentals_cutoff(now))
+    ).values('symbol', *FUNDAMENTAL_FIELDS)
+    return {row.pop('symbol'): row for row in rows}
@@ -0,0 +1,249 @@
+"""Server-side treemap layout for the stock heatmap.
+
+Stocks are grouped by sector and laid out as a squarified treemap (Bruls,
+Huizing and van Wijk): sectors share the canvas in proportion to their
+total market cap, and each sector's rectangle is split between its stocks
+the same way. Every stock gets ``x``, ``y``, ``w`` and ``h`` as fractions
+of a canvas ``ASPECT_RATIO`` times wider than it is tall, so clients only
+scale and draw. A sector's rectangle is the bounding box of its tiles.
+
+Stocks are weighted like sector performance (see stocks/sectors.py): by
+market cap, or ``current_price * 1M`` without one. Stocks without a price
+cannot be sized and are left out.
+
+Layouts are market snapshot views, computed once per data version and per
+filter combination. Only known sectors are accepted as filters, and at most
+``MAX_FILTERED_VIEWS`` filtered layouts are kept per version; further
+combinations are laid out per request. Refresh jobs run in the web process
+(``settings.JOB_RUN_IN_PROCESS``) build the unfiltered one with
+``warm_heatmap()`` so the first viewer after them reads it from memory.
+Snapshots live in each process's memory, so after a refresh by a management
+command (``update_nse_data``, ``run_scheduler``) the first request lays it
+out instead.
+"""
+
+import threading
+
+from . import encodings
+from .sectors import PRICE_WEIGHT
+from .snapshot import get_snapshot
+
+# Width / height of the canvas the layout fills
+ASPECT_RATIO = 2.0
+# Market cap rank bands, as used for large, mid and small cap classification
+SIZE_BANDS = {
+    'large': (0, 100),
+    'mid': (100, 250),
+    'small': (250, None),
+}
+UNKNOWN_SECTOR = 'Unknown'
+# Decimal places of the tile coordinates; enough for sub-pixel placement on 4K screens
+PRECISION = 5
+# Filtered layouts cached per data version; the unfiltered one is always cached
+MAX_FILTERED_VIEWS = 32
+
+_filters_lock = threading.Lock()
+
+
+def _worst(total, smallest, largest, side):
+    """Worst aspect ratio of a row of areas laid along ``side``."""
+    side_sq = side * side
+    total_sq = total * total
+    return max(side_sq * largest / total_sq, total_sq / (side_sq * smallest))
+
+
+def squarify(values, x, y, width, height):
+    """Split a rectangle into one rectangle per value, areas proportional to the values.
+
+    Args:
+        values (list): Positive sizes, largest first
+        x, y, width, height (float): The rectangle to fill
+
+    Returns:
+        list: ``(x, y, width, height)`` per value, in the same order
+    """
+    total = sum(values)
+    if not values or total <= 0:
+        return []
+    scale = width * height / total
+    areas = [value * scale for value in values]
+
+    rects = []
+    start = 0
+    while start < len(areas):
+        side = min(width, height)
+        # Grow the row while adding the next area does not make its worst tile worse
+        end = start + 1
+        row_total = smallest = largest = areas[start]
+        while end < len(areas):
+            area = areas[end]
+            grown = _worst(row_total + area, min(smallest, area), max(largest, area), side)
+            if grown > _worst(row_total, smallest, largest, side):
+                break
+            row_total += area
+            smallest = min(smallest, area)
+            largest = max(largest, area)
+            end += 1
+
+        if width >= height:
+            # Column along the left edge
+            row_width = row_total / height if height else 0
+            offset = y
+            for area in areas[start:end]:
+                tile_height = area / row_width if row_width else 0
+                rects.append((x, offset, row_width, tile_height))
+                offset += tile_height
+            x += row_width
+            width -= row_width
+        else:
+            # Row along the top edge
+            row_height = row_total / width if width else 0
+            offset = x
+            for area in areas[start:end]:
+                tile_width = area / row_height if row_height else 0
+                rects.append((offset, y, tile_width, row_height))
+                offset += tile_width
+            y += row_height
+            height -= row_height
+        start = end
+    return rects
+
+
+def stock_weight(row):
+    """Market cap, or ``current_price * 1M`` without one; None for unpriced stocks."""
+    if row['market_cap']:
+        return row['market_cap']
+    if row['current_price'] and row['current_price'] > 0:
+        return row['current_price'] * PRICE_WEIGHT
+    return None
+
+
+def sector_of(row):
+    return (row['sector'] or '').strip() or UNKNOWN_SECTOR
+
+
+def known_sectors(market):
+    """Sectors that have at least one tile at this data version."""
+    return market.view(
+        'heatmap_sectors',
+        lambda: frozenset(sector_of(row) for row in market.stock_rows() if stock_weight(row))
+    )
+
+
+def parse_filters(params, sectors):
+    """Read the ``sectors`` and ``size`` query parameters.
+
+    Args:
+        params: Query parameters
+        sectors (set): Sector names that may be requested
+
+    Returns:
+        tuple: (sorted tuple of sector names or None, size band or None)
+
+    Raises:
+        ValueError: If a sector is unknown or ``size`` is not one of SIZE_BANDS
+    """
+    requested = {name.strip() for name in params.get('sectors', '').split(',') if name.strip()}
+    unknown = requested - sectors
+    if unknown:
+        raise ValueError(f"Unknown sectors: {', '.join(sorted(unknown))}")
+    size = params.get('size') or None
+    if size is not None and size not in SIZE_BANDS:
+        raise ValueError(f"size must be one of: {', '.join(SIZE_BANDS)}")
+    return tuple(sorted(requested)) or None, size
+
+
+def build_heatmap(rows, sectors=None, size=None):
+    """Lay out stocks as a sector-grouped treemap.
+
+    Args:
+        rows (list): Stock dicts as returned by serializers.stock_rows
+        sectors (iterable): Only include these sectors
+        size (str): Only include this market cap band (see SIZE_BANDS)
+
+    Returns:
+        list: One dict per tile (symbol, name, sector, price, percent_change,
+            market_cap, x, y, w, h), sector by sector, largest first
+    """
+    weighted = []
+    for row in rows:
+        weight = stock_weight(row)
+        if weight:
+            weighted.append((weight, row))
+    weighted.sort(key=lambda item: (-item[0], item[1]['symbol']))
+    if size:
+        first, last = SIZE_BANDS[size]
+        weighted = weighted[first:last]
+
+    wanted = set(sectors) if sectors else None
+    groups = {}
+    for weight, row in weighted:
+        sector = sector_of(row)
+        if wanted is None or sector in wanted:
+            groups.setdefault(sector, []).append((weight, row))
+
+    # Largest sector first; stocks within a group are already largest first
+    ordered = sorted(groups.items(), key=lambda group: -sum(weight for weight, _ in group[1]))
+    sector_rects = squarify(
+        [sum(weight for weight, _ in members) for _, members in ordered], 0.0, 0.0, ASPECT_RATIO, 1.0
+    )
+
+    tiles = []
+    for (sector, members), sector_rect in zip(ordered, sector_rects):
+        for (weight, row), (x, y, w, h) in zip(members, squarify([weight for weight, _ in members], *sector_rect)):
+            tiles.append({
+                'symbol': row['symbol'],
+                'name': row['name'],
+                'sector': sector,
+                'price': row['current_price'],
+                'percent_change': row['change_percentage'],
+                'market_cap': row['market_cap'],
+                'x': round(x / ASPECT_RATIO, PRECISION),
+                'y': round(y, PRECISION),
+                'w': round(w / ASPECT_RATIO, PRECISION),
+                'h': round(h, PRECISION),
+            })
+    return tiles
+
+
+def view_name(sectors=None, size=None):
+    """Snapshot view name of the heatmap for these filters."""
+    return f"heatmap:{','.join(sectors or ())}:{size or ''}"
+
+
+def cacheable(market, sectors=None, size=None):
+    """Whether the layout for these filters may be kept in the snapshot.
+
+    The first MAX_FILTERED_VIEWS filter combinations of a data version are
+    admitted, so clients cannot grow the snapshot without bound.
+    """
+    if not sectors and not size:
+        return True
+    name = view_name(sectors, size)
+    admitted = market.view('heatmap_filters', set)
+    with _filters_lock:
+        if name in admitted:
+            return True
+        if len(admitted) < MAX_FILTERED_VIEWS:
+            admitted.add(name)
+            return True
+    return False
+
+
+def heatmap_rows(market, sectors=None, size=None, cache=True):
+    """The layout for these filters, built once per data version when ``cache`` is set."""
+    if not cache:
+        return build_heatmap(market.stock_rows(), sectors, size)
+    return market.view(
+        f"{view_name(sectors, size)}:layout",
+        lambda: build_heatmap(market.stock_rows(), sectors, size)
+    )
+
+
+def warm_heatmap():
+    """Build the unfiltered layout, its JSON body and validators for the current data version."""
+    market = get_snapshot()
+    market.last_modified()
+    rows = heatmap_rows(market)
+    encodings.bulk_body(market, view_name(), lambda: rows, encodings.JSON, 'identity')
+    return rows
@@ -0,0 +1,104 @@
+"""Local OHLCV history used to keep 52-week statistics current.
+
+Instead of downloading a full year of daily bars on every refresh, callers
+look up what is already stored, fetch only the most recent sessions and let
+the database compute the rolling 52-week high and low.
+"""
+
+import math
+from collections import namedtuple
+from datetime import timedelta
+
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import PriceBar
+
+# Length of the rolling window used for 52-week statistics
+WINDOW_DAYS = 365
+
+# Stored sessions re-fetched on every refresh. This refreshes a session that
+# was still trading when it was stored and guarantees a previous close.
+OVERLAP_DAYS = 5
+
+StoredHistory = namedtuple('StoredHistory', ['last_date', 'high_52w', 'low_52w'])
+
+
+def window_start(today=None):
+    """First date inside the rolling 52-week window."""
+    today = today or timezone.localdate()
+    return today - timedelta(days=WINDOW_DAYS)
+
+
+def fetch_start(stored):
+    """Date to request bars from, or None when a full year is needed."""
+    if stored is None:
+        return None
+    return stored.last_date - timedelta(days=OVERLAP_DAYS)
+
+
+def stored_history(symbols):
+    """Summarise the stored bars of each symbol in a single grouped query.
+
+    Returns:
+        dict: symbol -> StoredHistory for symbols that have bars in the window
+    """
+    rows = PriceBar.objects.filter(
+        symbol__in=list(symbols),
+        date__gte=window_start()
+    ).values('symbol').annotate(
+        last_date=Max('date'),
+        high_52w=Max('high'),
+        low_52w=Min('low')
+    )
+    return {
+        row['symbol']: StoredHistory(row['last_date'], row['high_52w'], row['low_52w'])
+        for row in rows
+    }
+
+
+def bars_from_history(symbol, hist):
+    """Convert a yfinance history frame into unsaved PriceBar objects."""
+    bars = []
+    if hist is None or hist.empty:
+        return bars
+
+    for index, row in hist.iterrows():
+        if math.isnan(row['Close']):
+            continue
+        bars.append(PriceBar(
+            symbol=symbol,
+            date=index.date(),
+            open=_clean(row.get('Open')),
+            high=_clean(row.get('High')),
+            low=_clean(row.get('Low')),
+            close=_clean(row['Close']),
+            volume=int(row['Volume']) if not math.isnan(row.get('Volume', math.nan)) else None
+        ))
+    return bars
+
+
+def save_bars(bars, batch_size=1000):
+    """Insert bars, overwriting sessions that are already stored."""
+    if not bars:
+        return 0
+    PriceBar.objects.bulk_create(
+        bars,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['symbol', 'date'],
+        update_fields=['open', 'high', 'low', 'close', 'volume']
+    )
+    return len(bars)
+
+
+def prune_bars():
+    """Delete bars that have fallen out of the rolling window."""
+    deleted, _ = PriceBar.objects.filter(date__lt=window_start()).delete()
+    return deleted
+
+
+def _clean(value):
+    if value is None or math.isnan(value):
+        return None
+    return round(float(value), 2)
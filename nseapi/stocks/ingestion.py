@@ -0,0 +1,334 @@
+"""Asyncio ingestion engine shared by every upstream fetch path.
+
+Blocking fetch functions (yfinance calls) run on a bounded thread pool while
+an event loop streams work items to a fixed number of workers. Every request
+first takes a token from a shared token bucket, so throughput is governed by
+the configured upstream rate rather than by fixed sleeps.
+
+Every provider call additionally goes through an UpstreamGuard: an AIMD
+concurrency limit that shrinks when the provider throttles us and grows back
+on success, plus a circuit breaker that stops calling a provider that keeps
+throttling.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from yfinance.exceptions import YFRateLimitError
+
+from .providers import ThrottledError
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token-bucket rate limiter usable from any thread or event loop.
+
+    Tokens refill continuously at ``rate`` per second up to ``capacity``.
+    Callers reserve a token up front and sleep until it becomes available,
+    so concurrent callers are spaced out instead of bursting together.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        # Total time callers were asked to wait, i.e. how much we held back
+        self.waited = 0.0
+
+    def _reserve(self):
+        """Take a token and return how long the caller must wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            delay = -self._tokens / self.rate
+            self.waited += delay
+            return delay
+
+    async def acquire(self):
+        delay = self._reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+    def acquire_sync(self):
+        delay = self._reserve()
+        if delay:
+            time.sleep(delay)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the provider while the circuit breaker is open."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Upstream circuit open, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+def is_throttled(error):
+    """Return True if an upstream error means we are sending too much traffic.
+
+    401 (how Yahoo answers when it throttles), 429 and 503 responses, rate
+    limit errors and timeouts count; anything else is a per-symbol failure.
+    """
+    if isinstance(error, (ThrottledError, YFRateLimitError, requests.exceptions.Timeout, TimeoutError)):
+        return True
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return error.response.status_code in (401, 429, 503)
+    return False
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on the number of upstream requests in flight.
+
+    Each successful request raises the limit by ``1 / limit`` (about one slot
+    per round of requests); a throttled request multiplies it by ``backoff``.
+    Requests that were already in flight when the limit was cut do not cut it
+    again, so a burst of throttled responses only halves the limit once.
+
+    Args:
+        maximum (int): Upper bound for the limit, and its starting value
+        minimum (int): Lower bound for the limit
+        backoff (float): Factor applied to the limit on throttling
+    """
+
+    def __init__(self, maximum, minimum=1, backoff=0.5):
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.backoff = backoff
+        self.limit = float(self.maximum)
+        self.in_flight = 0
+        self.decreases = 0
+        self._epoch = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Block until a slot is free; returns a token to pass to ``release``."""
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+            return self._epoch
+
+    def at_minimum(self):
+        return self.limit <= self.minimum
+
+    def release(self, token, throttled=False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                if token == self._epoch:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self._epoch += 1
+                    self.decreases += 1
+                    logger.warning(f"Upstream throttled, concurrency reduced to {int(self.limit)}")
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+class CircuitBreaker:
+    """Stops calling a provider that keeps throttling us.
+
+    After ``threshold`` failed requests in a row the breaker opens and
+    rejects calls for ``reset_timeout`` seconds. It then lets a single probe
+    through (half-open); the probe's outcome closes or reopens it.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, threshold=5, reset_timeout=30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.rejections = 0
+        self.trips = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a call may go to the provider now."""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() >= self._opened_at + self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejections += 1
+            return False
+
+    def retry_after(self):
+        """Seconds until a rejected caller should try again."""
+        with self._lock:
+            if self.state == self.OPEN:
+                return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+            return 0.1
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != self.CLOSED:
+                self.state = self.CLOSED
+                logger.info("Upstream circuit closed")
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.threshold):
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self.trips += 1
+                logger.warning(f"Upstream circuit opened for {self.reset_timeout:g}s after {self.failures} failed requests")
+
+
+class UpstreamGuard:
+    """Adaptive concurrency and circuit breaking around provider calls.
+
+    Wrap every upstream request in ``call`` so all fetch paths share one view
+    of how much traffic the provider currently accepts.
+    """
+
+    def __init__(self, concurrency, breaker):
+        self.concurrency = concurrency
+        self.breaker = breaker
+        self.throttled = 0
+
+    @classmethod
+    def from_settings(cls, max_in_flight=None):
+        return cls(
+            AdaptiveConcurrency(
+                max_in_flight or settings.INGESTION_MAX_IN_FLIGHT,
+                minimum=settings.INGESTION_MIN_IN_FLIGHT
+            ),
+            CircuitBreaker(settings.INGESTION_BREAKER_THRESHOLD, settings.INGESTION_BREAKER_RESET)
+        )
+
+    def call(self, fn, *args, block=True, **kwargs):
+        """Call ``fn`` once the breaker and the concurrency limit allow it.
+
+        Args:
+            block (bool): Wait while the breaker is open instead of raising
+                CircuitOpenError; batch ingestion waits, request paths fail fast
+
+        Raises:
+            CircuitOpenError: If the breaker is open and ``block`` is False
+        """
+        while not self.breaker.allow():
+            if not block:
+                raise CircuitOpenError(self.breaker.retry_after())
+            time.sleep(max(0.05, self.breaker.retry_after()))
+
+        token = self.concurrency.acquire()
+        throttled = False
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            throttled = is_throttled(e)
+            raise
+        finally:
+            self.concurrency.release(token, throttled)
+            if throttled:
+                self.throttled += 1
+                # Lowering concurrency is the first response; the breaker only
+                # counts throttling that persists at the minimum concurrency
+                if self.concurrency.at_minimum():
+                    self.breaker.record_failure()
+            else:
+                # Any answer that is not throttling shows the provider is serving us
+                self.breaker.record_success()
+
+    def stats(self):
+        """Return the current limits and counters."""
+        return {
+            'concurrency': int(self.concurrency.limit),
+            'max_concurrency': self.concurrency.maximum,
+            'in_flight': self.concurrency.in_flight,
+            'decreases': self.concurrency.decreases,
+            'throttled': self.throttled,
+            'breaker': self.breaker.state,
+            'breaker_trips': self.breaker.trips,
+            'rejections': self.breaker.rejections,
+        }
+
+
+class IngestionEngine:
+    """Run a blocking fetch function over many items with bounded concurrency.
+
+    Items are pulled lazily from the iterable by ``max_in_flight`` workers,
+    so no more than that many fetches are ever pending. ``on_result`` and
+    ``on_error`` run on the event loop thread and must not block; hand
+    results to a queue (for example StockBatchWriter) rather than writing to
+    the database there. An item whose fetch or ``on_result`` raises counts
+    as failed and is passed to ``on_error`` (logged without one); the other
+    items keep going.
+
+    Args:
+        fetch (callable): Blocking ``fetch(item)`` returning a result
+        limiter (TokenBucket): Rate limiter shared with other fetch paths
+        max_in_flight (int): Maximum number of concurrent fetches
+    """
+
+    def __init__(self, fetch, limiter=None, max_in_flight=None):
+        self.fetch = fetch
+        self.limiter = limiter or upstream_limiter
+        self.max_in_flight = max(1, max_in_flight or settings.INGESTION_MAX_IN_FLIGHT)
+        self.completed = 0
+        self.failed = 0
+        self.elapsed = 0.0
+
+    def run(self, items, on_result=None, on_error=None):
+        """Process every item and block until done; returns the engine."""
+        asyncio.run(self.run_async(items, on_result, on_error))
+        return self
+
+    async def run_async(self, items, on_result=None, on_error=None):
+        started = time.perf_counter()
+        iterator = iter(items)
+        loop = asyncio.get_running_loop()
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='ingestion') as executor:
+            async def worker():
+                # Pulling from the shared iterator never awaits, so each item
+                # is handed to exactly one worker
+                for item in iterator:
+                    await self.limiter.acquire()
+                    try:
+                        result = await loop.run_in_executor(executor, self.fetch, item)
+                        if on_result:
+                            on_result(item, result)
+                    except Exception as e:
+                        self.failed += 1
+                        if on_error:
+                            on_error(item, e)
+                        else:
+                            logger.error(f"Ingestion failed for {item}: {str(e)}")
+                        continue
+                    self.completed += 1
+
+            await asyncio.gather(*(worker() for _ in range(self.max_in_flight)))
+
+        self.elapsed = time.perf_counter() - started
+        return self
+
+
+upstream_limiter = TokenBucket(settings.INGESTION_RATE_LIMIT, settings.INGESTION_BURST)
+upstream_guard = UpstreamGuard.from_settings()
@@ -0,0 +1,174 @@
+"""DB-backed queue for background refresh jobs.
+
+API requests only insert an IngestionJob row; a pool of worker threads
+claims queued jobs with a conditional update and runs the registered
+handler, recording progress, timings and errors on the row. Workers run
+inside the web process (``settings.JOB_RUN_IN_PROCESS``) or in a separate
+``manage.py run_job_worker`` process; both can share the same queue.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .models import IngestionJob
+from .services import NseService
+
+logger = logging.getLogger(__name__)
+
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    """Register ``handler(job, progress)`` as the runner for a job kind."""
+    def register(handler):
+        JOB_HANDLERS[kind] = handler
+        return handler
+    return register
+
+
+@job_handler('nse_update')
+def run_nse_update(job, progress):
+    NseService().update_stock_data(progress=progress)
+
+
+def enqueue(kind, **params):
+    """Queue a job unless one of the same kind is already queued or running.
+
+    Returns:
+        tuple: (IngestionJob, created) where ``created`` is False if the
+            request was attached to an existing active job
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    active = IngestionJob.objects.filter(kind=kind, status__in=IngestionJob.ACTIVE_STATUSES)
+    job = active.first()
+    if job:
+        return job, False
+    try:
+        with transaction.atomic():
+            return IngestionJob.objects.create(kind=kind, params=params), True
+    except IntegrityError:
+        # Another request queued the same kind between our check and insert
+        return active.get(), False
+
+
+class JobWorker:
+    """Claims queued jobs and runs them on a thread pool.
+
+    Args:
+        workers (int): Number of jobs run at the same time
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or settings.JOB_WORKERS
+        self.name = f"{socket.gethostname()}-{os.getpid()}"
+
+    def claim(self):
+        """Take the oldest queued job, or return None if there is none."""
+        queued = IngestionJob.objects.filter(status=IngestionJob.STATUS_QUEUED).order_by('created_at')
+        for job_id in queued.values_list('id', flat=True)[:10]:
+            now = timezone.now()
+            claimed = IngestionJob.objects.filter(id=job_id, status=IngestionJob.STATUS_QUEUED).update(
+                status=IngestionJob.STATUS_RUNNING,
+                worker=self.name,
+                started_at=now,
+                heartbeat_at=now
+            )
+            if claimed:
+                return IngestionJob.objects.get(id=job_id)
+        return None
+
+    def run(self, job):
+        """Run a claimed job and record its outcome."""
+        def progress(processed, total=None, message=''):
+            IngestionJob.objects.filter(pk=job.pk).update(
+                processed=processed,
+                total=total,
+                message=message[:255],
+                heartbeat_at=timezone.now()
+            )
+
+        logger.info(f"Running {job}")
+        try:
+            JOB_HANDLERS[job.kind](job, progress)
+        except Exception as e:
+            logger.error(f"{job} failed: {str(e)}")
+            outcome = {'status': IngestionJob.STATUS_FAILED, 'error': str(e)}
+        else:
+            outcome = {'status': IngestionJob.STATUS_SUCCEEDED}
+        IngestionJob.objects.filter(pk=job.pk).update(finished_at=timezone.now(), **outcome)
+
+    def run_pending(self):
+        """Run queued jobs until the queue is empty."""
+        try:
+            while True:
+                job = self.claim()
+                if job is None:
+                    break
+                self.run(job)
+        finally:
+            # Worker threads open their own connections; don't leak them
+            connection.close()
+
+    def reap(self):
+        """Fail running jobs whose worker stopped sending heartbeats.
+
+        This frees the kind for new submissions after a worker crash.
+        """
+        cutoff = timezone.now() - settings.JOB_TIMEOUT
+        return IngestionJob.objects.filter(
+            status=IngestionJob.STATUS_RUNNING,
+            heartbeat_at__lt=cutoff
+        ).update(
+            status=IngestionJob.STATUS_FAILED,
+            error="Worker stopped responding",
+            finished_at=timezone.now()
+        )
+
+    def run_forever(self, poll_interval=2.0):
+        """Poll the queue and keep up to ``workers`` jobs running."""
+        running = set()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='jobs') as executor:
+            while True:
+                reaped = self.reap()
+                if reaped:
+                    logger.warning(f"Marked {reaped} stalled jobs as failed")
+                running = {future for future in running if not future.done()}
+                while len(running) < self.workers:
+                    job = self.claim()
+                    if job is None:
+                        break
+                    running.add(executor.submit(self._run_in_thread, job))
+                time.sleep(poll_interval)
+
+    def _run_in_thread(self, job):
+        try:
+            self.run(job)
+        finally:
+            connection.close()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def dispatch():
+    """Drain the queue on this process's worker pool, if in-process workers are enabled."""
+    global _executor
+    if not settings.JOB_RUN_IN_PROCESS:
+        return
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.JOB_WORKERS, thread_name_prefix='jobs')
+    worker = JobWorker()
+    worker.reap()
+    _executor.submit(worker.run_pending)
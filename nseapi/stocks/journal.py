@@ -0,0 +1,164 @@
+"""Progress journal for ingestion runs.
+
+Every symbol of an IngestionRun has a row recording whether it is pending,
+claimed by a process, done or failed. Processes claim symbols in blocks
+before fetching them, so an interrupted run can be resumed without repeating
+finished work and several processes can share one run without fetching the
+same symbol twice.
+"""
+
+import threading
+import uuid
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import IngestionRun, IngestionSymbol
+
+# Failed symbols are retried on resume until they reach this many attempts
+MAX_ATTEMPTS = 3
+
+# Claims older than this belong to a process that died and may be taken over
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+class RunJournal:
+    """Claims symbols of a run and records their outcome.
+
+    ``mark_done`` and ``mark_failed`` only buffer results and are safe to
+    call from any thread; ``flush`` writes them and must run on a thread that
+    may use the database (for example the StockBatchWriter thread).
+    """
+
+    def __init__(self, run):
+        self.run = run
+        self.worker = uuid.uuid4().hex
+        self._done = set()
+        self._failed = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def start(cls, symbols, provider='', options=None):
+        """Create a run with every symbol pending."""
+        with transaction.atomic():
+            run = IngestionRun.objects.create(provider=provider, options=options or {})
+            IngestionSymbol.objects.bulk_create(
+                [IngestionSymbol(run=run, symbol=symbol) for symbol in symbols],
+                batch_size=1000
+            )
+        return cls(run)
+
+    @classmethod
+    def resume(cls, run_id=None, release_claims=False):
+        """Reopen a run so its unfinished symbols can be fetched again.
+
+        Args:
+            run_id (int): Run to resume; defaults to the latest unfinished run
+            release_claims (bool): The processes of the run are known to be
+                gone, so symbols they left claimed are queued again right away
+                instead of after CLAIM_TIMEOUT
+
+        Returns:
+            RunJournal: Journal for the run, or None if there is nothing to resume
+        """
+        runs = IngestionRun.objects.all()
+        if run_id:
+            run = runs.filter(pk=run_id).first()
+        else:
+            run = runs.exclude(status=IngestionRun.STATUS_COMPLETED).first()
+        if run is None:
+            return None
+
+        if release_claims:
+            run.symbols.filter(status=IngestionSymbol.STATUS_RUNNING).update(
+                status=IngestionSymbol.STATUS_PENDING,
+                claimed_by='',
+                updated_at=timezone.now()
+            )
+        # Failed symbols with attempts left go back to the queue
+        run.symbols.filter(
+            status=IngestionSymbol.STATUS_FAILED,
+            attempts__lt=MAX_ATTEMPTS
+        ).update(status=IngestionSymbol.STATUS_PENDING)
+        IngestionRun.objects.filter(pk=run.pk).update(status=IngestionRun.STATUS_RUNNING, finished_at=None)
+        run.refresh_from_db()
+        return cls(run)
+
+    def claim(self, limit):
+        """Claim up to ``limit`` unfinished symbols for this process.
+
+        Pending symbols and symbols whose claim has timed out are eligible.
+        The conditional update makes sure a symbol is only claimed once even
+        if several processes race for it.
+
+        Returns:
+            list: Symbols now owned by this process
+        """
+        available = Q(status=IngestionSymbol.STATUS_PENDING) | Q(
+            status=IngestionSymbol.STATUS_RUNNING,
+            updated_at__lt=timezone.now() - CLAIM_TIMEOUT
+        )
+        ids = list(self.run.symbols.filter(available).values_list('id', flat=True)[:limit])
+        if not ids:
+            return []
+
+        IngestionSymbol.objects.filter(Q(id__in=ids) & available).update(
+            status=IngestionSymbol.STATUS_RUNNING,
+            claimed_by=self.worker,
+            attempts=F('attempts') + 1,
+            updated_at=timezone.now()
+        )
+        return list(IngestionSymbol.objects.filter(
+            id__in=ids,
+            status=IngestionSymbol.STATUS_RUNNING,
+            claimed_by=self.worker
+        ).values_list('symbol', flat=True))
+
+    def mark_done(self, symbols):
+        with self._lock:
+            self._done.update(symbols)
+
+    def mark_failed(self, symbols, error):
+        with self._lock:
+            for symbol in symbols:
+                self._failed[symbol] = str(error)[:1000]
+
+    def flush(self):
+        """Write buffered outcomes to the journal."""
+        with self._lock:
+            done, self._done = self._done, set()
+            failed, self._failed = self._failed, {}
+
+        owned = self.run.symbols.filter(claimed_by=self.worker)
+        if done:
+            owned.filter(symbol__in=done).update(
+                status=IngestionSymbol.STATUS_DONE,
+                last_error='',
+                updated_at=timezone.now()
+            )
+        for symbol, error in failed.items():
+            owned.filter(symbol=symbol).update(
+                status=IngestionSymbol.STATUS_FAILED,
+                last_error=error,
+                updated_at=timezone.now()
+            )
+
+    def finish(self):
+        """Flush outstanding results and close the run if nothing is left."""
+        self.flush()
+        unfinished = self.run.symbols.filter(
+            status__in=[IngestionSymbol.STATUS_PENDING, IngestionSymbol.STATUS_RUNNING]
+        ).exists()
+        if unfinished:
+            # Another process still owns part of the run
+            return self.run.counts()
+
+        failed = self.run.symbols.filter(status=IngestionSymbol.STATUS_FAILED).exists()
+        IngestionRun.objects.filter(pk=self.run.pk).update(
+            status=IngestionRun.STATUS_FAILED if failed else IngestionRun.STATUS_COMPLETED,
+            finished_at=timezone.now()
+        )
+        self.run.refresh_from_db()
+        return self.run.counts()
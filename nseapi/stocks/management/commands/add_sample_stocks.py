@@ -1,5 +1,8 @@
 from django.core.management.base import BaseCommand
+from stocks.metrics import distance_from_high
 from stocks.models import Stock
+from stocks.sectors import refresh_sector_performance
+from stocks.snapshot import LISTINGS, bump_data_version
 
 class Command(BaseCommand):
     help = 'Adds sample stock data for testing'
@@ -64,10 +67,15 @@ class Command(BaseCommand):
         ]
 
         for stock_data in sample_stocks:
+            stock_data['distance_from_high'] = distance_from_high(stock_data['current_price'], stock_data['high_52w'])
             Stock.objects.get_or_create(
                 symbol=stock_data['symbol'],
                 defaults=stock_data
             )
             self.stdout.write(
                 self.style.SUCCESS(f'Successfully added/updated stock {stock_data["symbol"]}')
-            ) 
\ No newline at end of file
+            ) 
+
+        # Stores the sample sectors and bumps the market data version
+        refresh_sector_performance()
+        bump_data_version(LISTINGS)
@@ -0,0 +1,43 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from stocks.encodings import available_encodings, available_formats, compress, encode
+from stocks.heatmap import build_heatmap
+from stocks.models import Stock
+from stocks.serializers import stock_rows
+
+
+class Command(BaseCommand):
+    help = 'Measures encode time and payload size of every bulk response format and content coding'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Encodes per measurement (default: 5)'
+        )
+
+    def handle(self, *args, **options):
+        rows = stock_rows(Stock.objects.order_by('symbol'))
+        payloads = [
+            ('all_stocks_az', rows),
+            ('heatmap', build_heatmap(rows)),
+        ]
+        for name, rows in payloads:
+            self.stdout.write(f"{name}: {len(rows)} rows")
+            baseline = None
+            for fmt in available_formats():
+                for encoding in reversed(available_encodings()):
+                    timings = []
+                    for _ in range(options['repeat']):
+                        started = time.perf_counter()
+                        body = compress(encode(rows, fmt), encoding)
+                        timings.append(time.perf_counter() - started)
+                    baseline = baseline or len(body)
+                    self.stdout.write(
+                        f"  {fmt:<8} {encoding:<9} {len(body) / 1024:9.1f} KiB  "
+                        f"{baseline / len(body):5.1f}x smaller  encode {statistics.median(timings) * 1000:7.2f}ms"
+                    )
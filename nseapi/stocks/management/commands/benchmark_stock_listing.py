@@ -0,0 +1,67 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from stocks import snapshot
+from stocks.pagination import StockCursorPagination
+
+
+class Command(BaseCommand):
+    help = 'Compares response size and time to first byte of paginated and full stock listings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Requests per measurement (default: 20)'
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=StockCursorPagination.page_size,
+            help=f'Cursor page size (default: {StockCursorPagination.page_size})'
+        )
+        parser.add_argument(
+            '--url',
+            default='/api/stocks/',
+            help='Listing endpoint to benchmark (default: /api/stocks/)'
+        )
+
+    def handle(self, *args, **options):
+        # Requests are served in process, so the whole body is ready when
+        # the response object is returned: that time is the time to first byte
+        client = Client(HTTP_HOST='localhost')
+        url, repeat = options['url'], options['repeat']
+        first_page = f"{url}?page_size={options['page_size']}"
+
+        snapshot.reset()
+        self.report('Full dump, cold snapshot', client, f"{url}?all=1", 1)
+        self.report('Full dump, warm snapshot', client, f"{url}?all=1", repeat)
+        self.report('First cursor page', client, first_page, repeat)
+
+        pages = size = 0
+        started = time.perf_counter()
+        next_url = first_page
+        while next_url:
+            response = client.get(next_url)
+            pages += 1
+            size += len(response.content)
+            next_url = response.json()['next']
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{'All cursor pages':<28} {size / 1024:>9.1f} KiB in {pages} pages, {elapsed * 1000:.1f}ms in total"
+        )
+
+    def report(self, label, client, url, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append(time.perf_counter() - started)
+        self.stdout.write(
+            f"{label:<28} {len(response.content) / 1024:>9.1f} KiB, "
+            f"TTFB median {statistics.median(timings) * 1000:.2f}ms, max {max(timings) * 1000:.2f}ms"
+        )
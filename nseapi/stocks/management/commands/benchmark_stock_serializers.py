@@ -0,0 +1,64 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from stocks import renderers
+from stocks.models import Stock, TopSector
+from stocks.renderers import FastJSONRenderer
+from stocks.serializers import StockSerializer, TopSectorSerializer, sector_rows, stock_rows
+
+
+class Command(BaseCommand):
+    help = 'Compares DRF serializers with the values() fast path for the full stock universe'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=10,
+            help='Runs per measurement (default: 10)'
+        )
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        stocks = Stock.objects.order_by('symbol')
+        sectors = TopSector.objects.all()
+        self.stdout.write(
+            f"{stocks.count()} stocks, {sectors.count()} sectors; "
+            f"fast renderer uses {'orjson' if renderers.orjson else 'the json module (orjson not installed)'}"
+        )
+
+        cases = [
+            ('Stocks', stocks,
+             lambda qs: StockSerializer(qs, many=True).data, stock_rows),
+            ('Sectors', sectors,
+             lambda qs: TopSectorSerializer(qs, many=True).data, sector_rows),
+        ]
+        for label, queryset, drf_serialize, fast_serialize in cases:
+            drf = self.measure(repeat, queryset, drf_serialize, JSONRenderer())
+            fast = self.measure(repeat, queryset, fast_serialize, FastJSONRenderer())
+            for name, (serialize_s, render_s, body) in (('DRF serializer', drf), ('values() fast path', fast)):
+                self.stdout.write(
+                    f"{label:<8} {name:<20} serialize {serialize_s * 1000:8.2f}ms  "
+                    f"render {render_s * 1000:7.2f}ms  total {(serialize_s + render_s) * 1000:8.2f}ms  "
+                    f"{len(body) / 1024:.1f} KiB"
+                )
+            speedup = (drf[0] + drf[1]) / max(fast[0] + fast[1], 1e-9)
+            if drf[2] == fast[2]:
+                self.stdout.write(self.style.SUCCESS(f"{label}: identical bytes, {speedup:.1f}x faster"))
+            else:
+                self.stdout.write(self.style.ERROR(f"{label}: outputs differ"))
+
+    def measure(self, repeat, queryset, serialize, renderer):
+        """Median seconds to serialize (including the query) and to render."""
+        serialize_times, render_times = [], []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            data = serialize(queryset.all())
+            serialized = time.perf_counter()
+            body = renderer.render(data)
+            serialize_times.append(serialized - started)
+            render_times.append(time.perf_counter() - serialized)
+        return statistics.median(serialize_times), statistics.median(render_times), body
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from stocks.jobs import JobWorker
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs (e.g. refreshes requested through the API)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.JOB_WORKERS,
+            help='Number of jobs run at the same time (default: settings.JOB_WORKERS)'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Seconds between checks for new jobs (default: 2)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run the jobs currently queued and exit'
+        )
+
+    def handle(self, *args, **options):
+        worker = JobWorker(options['workers'])
+        if options['once']:
+            worker.reap()
+            worker.run_pending()
+            return
+        self.stdout.write(f"Job worker {worker.name} running {worker.workers} jobs at a time")
+        worker.run_forever(options['poll_interval'])
@@ -0,0 +1,197 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from django.utils import timezone
+
+from stocks.management.commands.update_nse_data import Command as UpdateCommand
+from stocks.models import Stock, Watchlist
+from stocks.providers import PROVIDERS
+from stocks.views import is_market_open
+from stocks.writers import StockBatchWriter
+
+logger = logging.getLogger(__name__)
+
+# How often due symbols are looked up while the market is open
+TICK_SECONDS = 1.0
+
+
+class Command(BaseCommand):
+    help = 'Continuously refreshes prices during market hours, watchlisted and large caps first'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hot-size',
+            type=int,
+            default=settings.SCHEDULER_HOT_SIZE,
+            help='Number of largest stocks by market cap in the hot tier, besides watchlisted ones'
+        )
+        parser.add_argument(
+            '--hot-interval',
+            type=float,
+            default=settings.SCHEDULER_HOT_INTERVAL,
+            help='Seconds between refreshes of a hot symbol (default: settings.SCHEDULER_HOT_INTERVAL)'
+        )
+        parser.add_argument(
+            '--cold-interval',
+            type=float,
+            default=settings.SCHEDULER_COLD_INTERVAL,
+            help='Seconds between refreshes of any other symbol (default: settings.SCHEDULER_COLD_INTERVAL)'
+        )
+        parser.add_argument(
+            '--cold-batch',
+            type=int,
+            default=settings.SCHEDULER_COLD_BATCH,
+            help='Maximum long-tail symbols refreshed per tick, oldest first'
+        )
+        parser.add_argument(
+            '--sector-interval',
+            type=float,
+            default=settings.SCHEDULER_SECTOR_INTERVAL,
+            help='Minimum seconds between sector performance updates during market hours'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=100,
+            help='Number of symbols per batched download (default: 100)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run a single tick and exit (for cron or testing)'
+        )
+        parser.add_argument(
+            '--ignore-market-hours',
+            action='store_true',
+            help='Refresh even when the market is closed (for testing with the local provider)'
+        )
+        parser.add_argument(
+            '--provider',
+            choices=sorted(PROVIDERS),
+            help='Market data provider (default: settings.MARKET_DATA_PROVIDER)'
+        )
+        parser.add_argument('--latency', type=float, help='Mean simulated latency (local provider only)')
+        parser.add_argument('--error-rate', type=float, help='Injected failure probability (local provider only)')
+        parser.add_argument('--capacity', type=int, help='Concurrent requests before throttling (local provider only)')
+        parser.add_argument('--rate', type=float, help='Upstream requests per second')
+        parser.add_argument('--max-in-flight', type=int, help='Maximum concurrent upstream requests')
+
+    def handle(self, *args, **options):
+        # Reuse the ingestion pipeline of update_nse_data for the actual fetching
+        self.updater = UpdateCommand(stdout=self.stdout, stderr=self.stderr)
+        self.updater.setup_upstream(options)
+        self.options = options
+        # When this process last queued each symbol; the writer may not have
+        # stored the new price_updated_at yet when the next tick runs
+        self.queued_at = {}
+        # When sector performance was last recomputed, and the writer's
+        # changed-row count at that moment
+        self.sectors_at = None
+        self.sectors_changed = 0
+        was_open = False
+
+        with StockBatchWriter(on_batch=self.updater.report_batch) as writer:
+            while True:
+                market_open = options['ignore_market_hours'] or is_market_open()
+                if market_open:
+                    started = time.monotonic()
+                    self.tick(writer)
+                    self.refresh_sectors(writer)
+                    pause = max(0.0, TICK_SECONDS - (time.monotonic() - started))
+                elif was_open:
+                    # One sweep after the bell so every symbol gets its closing price.
+                    # It has its own writer so all prices are stored before the
+                    # sector performance is recomputed from them.
+                    self.stdout.write("Market closed, refreshing closing prices")
+                    with StockBatchWriter(on_batch=self.updater.report_batch) as closing:
+                        self.refresh(list(Stock.objects.values_list('symbol', flat=True)), closing)
+                    self.updater.update_sector_performance()
+                    pause = settings.SCHEDULER_IDLE_INTERVAL
+                else:
+                    pause = settings.SCHEDULER_IDLE_INTERVAL
+                was_open = market_open
+
+                if options['once']:
+                    break
+                time.sleep(pause)
+
+        self.updater.report_upstream()
+
+    def hot_symbols(self):
+        """Watchlisted symbols plus the largest stocks by market cap."""
+        watched = set(Watchlist.objects.values_list('stock__symbol', flat=True))
+        largest = Stock.objects.exclude(market_cap=None).order_by('-market_cap')
+        return watched | set(largest.values_list('symbol', flat=True)[:self.options['hot_size']])
+
+    def due_symbols(self, now=None):
+        """Return (hot, cold) symbols whose price is older than their tier's interval.
+
+        Due-ness comes from ``Stock.price_updated_at``, so the schedule
+        survives restarts and runs alongside ``update_nse_data``. The long
+        tail is refreshed oldest first and at most ``--cold-batch`` per tick,
+        which spreads it evenly over the cold interval.
+        """
+        now = now or timezone.now()
+        hot = self.hot_symbols()
+
+        def older_than(seconds):
+            return Q(price_updated_at__lt=now - timedelta(seconds=seconds)) | Q(price_updated_at=None)
+
+        hot_due = Stock.objects.filter(older_than(self.options['hot_interval']), symbol__in=hot)
+        cold_due = Stock.objects.filter(older_than(self.options['cold_interval'])).exclude(
+            symbol__in=hot
+        ).order_by(F('price_updated_at').asc(nulls_first=True))
+        hot_due = [
+            symbol for symbol in hot_due.values_list('symbol', flat=True)
+            if not self.recently_queued(symbol, self.options['hot_interval'])
+        ]
+        cold_due = [
+            symbol for symbol in cold_due.values_list('symbol', flat=True)[:self.options['cold_batch'] * 2]
+            if not self.recently_queued(symbol, self.options['cold_interval'])
+        ]
+        return hot_due, cold_due[:self.options['cold_batch']]
+
+    def recently_queued(self, symbol, interval):
+        queued_at = self.queued_at.get(symbol)
+        return queued_at is not None and time.monotonic() - queued_at < interval
+
+    def tick(self, writer):
+        hot, cold = self.due_symbols()
+        if not hot and not cold:
+            return
+        self.stdout.write(f"Tick: {len(hot)} hot and {len(cold)} long-tail symbols due")
+        # Hot symbols go first so they get the upstream budget before the tail
+        self.refresh(hot, writer)
+        self.refresh(cold, writer)
+
+    def refresh_sectors(self, writer):
+        """Recompute sector performance if prices changed since the last time.
+
+        Runs at most every ``--sector-interval`` seconds. Rows still queued on
+        the writer are picked up by the next update.
+        """
+        if writer.rows_changed == self.sectors_changed:
+            return
+        now = time.monotonic()
+        if self.sectors_at is not None and now - self.sectors_at < self.options['sector_interval']:
+            return
+        self.sectors_at = now
+        self.sectors_changed = writer.rows_changed
+        self.updater.update_sector_performance()
+
+    def refresh(self, symbols, writer):
+        if not symbols:
+            return
+        now = time.monotonic()
+        self.queued_at.update((symbol, now) for symbol in symbols)
+        started = time.perf_counter()
+        engine = self.updater.refresh_symbols(
+            symbols, writer, batch=True, chunk_size=self.options['chunk_size']
+        )
+        self.updater.report_throughput("Refresh", len(symbols), time.perf_counter() - started)
+        if engine.failed:
+            logger.warning(f"{engine.failed} of the scheduler's chunk downloads failed")
@@ -0,0 +1,34 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from stocks.providers import LocalProvider
+
+
+class Command(BaseCommand):
+    help = 'Generates offline quotes and daily bars for the local market data provider'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--listing',
+            default=str(Path(__file__).resolve().parents[2] / 'data' / 'nse_stocks.csv'),
+            help='NSE equity listing CSV to seed symbols from (default: stocks/data/nse_stocks.csv)'
+        )
+        parser.add_argument(
+            '--output',
+            default=str(settings.MARKET_DATA_REPLAY_DIR),
+            help='Directory to write replay files to (default: settings.MARKET_DATA_REPLAY_DIR)'
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=260,
+            help='Number of daily bars to generate per symbol (default: 260)'
+        )
+
+    def handle(self, *args, **options):
+        count = LocalProvider.seed(options['output'], options['listing'], days=options['days'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {count} symbols with {options['days']} bars each in {options['output']}"
+        ))
@@ -1,17 +1,21 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from stocks.models import Stock, TopSector
-import requests
+from stocks.models import IngestionSymbol, Stock
+from stocks.ingestion import IngestionEngine, TokenBucket, UpstreamGuard, upstream_guard, upstream_limiter
+from stocks.freshness import stale_fundamentals
+from stocks.journal import RunJournal
+from stocks.history import bars_from_history, fetch_start, prune_bars, stored_history
+from stocks.metrics import compute_metrics, distance_from_high, metrics_by_symbol
+from stocks.cache import ParsedCache
+from stocks.providers import PROVIDERS, get_provider
+from stocks.sectors import refresh_sector_performance
+from stocks.snapshot import LISTINGS, bump_data_version
+from stocks.writers import StockBatchWriter
 import csv
-import yfinance as yf
 from io import StringIO
 from django.utils import timezone
-from datetime import timedelta
 import logging
-from django.db import models
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from tenacity import retry, wait_exponential, stop_after_attempt
 import time
-from time import sleep
 
 # Logger setup
 logger = logging.getLogger(__name__)
@@ -35,35 +39,229 @@ class Command(BaseCommand):
         'ELECTRIC': 'Utilities'
     }
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch',
+            action='store_true',
+            help='Download prices and history for chunks of symbols in one call instead of per symbol'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=100,
+            help='Number of symbols per batched download (default: 100)'
+        )
+        parser.add_argument(
+            '--write-batch-size',
+            type=int,
+            default=200,
+            help='Number of stock rows written per bulk update (default: 200)'
+        )
+        parser.add_argument(
+            '--resume',
+            nargs='?',
+            const=0,
+            type=int,
+            metavar='RUN_ID',
+            help='Continue the unfinished symbols of an ingestion run (default: the latest unfinished run). '
+                 'Giving the RUN_ID of a crashed run releases the symbols it left claimed at once; '
+                 'otherwise they wait for the claim timeout, as another process may still own them'
+        )
+        parser.add_argument(
+            '--claim-size',
+            type=int,
+            default=200,
+            help='Number of journal symbols claimed per block (default: 200)'
+        )
+        parser.add_argument(
+            '--force-listings',
+            action='store_true',
+            help='Download, parse and sync the NSE listing even if it has not changed'
+        )
+        parser.add_argument(
+            '--provider',
+            choices=sorted(PROVIDERS),
+            help='Market data provider (default: settings.MARKET_DATA_PROVIDER)'
+        )
+        parser.add_argument(
+            '--latency',
+            type=float,
+            help='Mean simulated latency per request in seconds (local provider only)'
+        )
+        parser.add_argument(
+            '--error-rate',
+            type=float,
+            help='Probability of an injected request failure (local provider only)'
+        )
+        parser.add_argument(
+            '--capacity',
+            type=int,
+            help='Concurrent requests served before the provider throttles (local provider only)'
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            help='Upstream requests per second (default: settings.INGESTION_RATE_LIMIT)'
+        )
+        parser.add_argument(
+            '--max-in-flight',
+            type=int,
+            help='Maximum concurrent upstream requests (default: settings.INGESTION_MAX_IN_FLIGHT)'
+        )
+
     def handle(self, *args, **options):
         try:
-            # Step 1: Update stock listings from NSE
-            self.stdout.write("Updating NSE listings...")
-            nse_stocks = self.fetch_nse_listings()
-            
-            # Step 2: Update database with basic stock info
-            updated_stocks = self.update_stock_listings(nse_stocks)
+            started = time.perf_counter()
+            self.setup_upstream(options)
+
+            if options['resume'] is not None:
+                # Resuming skips the listing steps; the run already has its symbols
+                journal = RunJournal.resume(options['resume'] or None, release_claims=bool(options['resume']))
+                if journal is None:
+                    self.stdout.write(self.style.WARNING("No unfinished ingestion run to resume"))
+                    return
+                counts = journal.run.counts()
+                self.stdout.write(f"Resuming ingestion run {journal.run.pk}: {counts}")
+                if counts.get(IngestionSymbol.STATUS_RUNNING):
+                    self.stdout.write(self.style.WARNING(
+                        f"{counts[IngestionSymbol.STATUS_RUNNING]} symbols are still claimed and are skipped "
+                        f"until their claim times out; pass --resume {journal.run.pk} if the run crashed"
+                    ))
+            else:
+                # Step 1: Update stock listings from NSE
+                self.stdout.write("Updating NSE listings...")
+                listing, nse_stocks = self.fetch_nse_listings(force=options['force_listings'])
+                
+                # Step 2: Update database with basic stock info
+                if nse_stocks is None:
+                    self.stdout.write("NSE listing not modified, skipping listing sync")
+                    updated_stocks = list(Stock.objects.values_list('symbol', flat=True))
+                else:
+                    updated_stocks = self.update_stock_listings(nse_stocks)
+                    # Only a synced listing may be answered with 304 next time
+                    self.provider.commit_listing(listing)
+
+                journal = RunJournal.start(updated_stocks, provider=self.provider.name, options={
+                    'batch': options['batch'],
+                    'chunk_size': options['chunk_size'],
+                    'max_in_flight': self.max_in_flight,
+                    'rate': self.limiter.rate
+                })
+                self.stdout.write(f"Started ingestion run {journal.run.pk} for {len(updated_stocks)} symbols")
             
-            # Step 3: Fetch detailed financial data concurrently
+            # Step 3: Fetch detailed financial data
             self.stdout.write("Updating market data...")
-            self.update_financial_data(updated_stocks)
+            market_started = time.perf_counter()
+            prune_bars()
+            processed = succeeded = failed = 0
+            with StockBatchWriter(
+                batch_size=options['write_batch_size'],
+                on_batch=self.report_batch,
+                journal=journal
+            ) as writer:
+                # Claim symbols in blocks so other processes resuming the
+                # same run pick up different symbols
+                while True:
+                    block = journal.claim(options['claim_size'])
+                    if not block:
+                        break
+                    engine = self.refresh_symbols(
+                        block, writer, options['batch'], options['chunk_size'], journal
+                    )
+                    processed += len(block)
+                    succeeded += engine.completed
+                    failed += engine.failed
+            counts = journal.finish()
+            self.stdout.write(
+                f"Upstream requests: {succeeded} succeeded, {failed} failed "
+                f"(max {self.max_in_flight} in flight, {self.limiter.rate:g} req/s)"
+            )
+            self.report_upstream()
+            self.stdout.write(
+                f"Wrote {writer.rows_written} rows in {writer.batches_written} batches "
+                f"({writer.write_seconds:.2f}s spent writing)"
+            )
+            self.stdout.write(
+                f"Changes: {writer.rows_changed} rows changed, "
+                f"{writer.rows_skipped} unchanged rows only marked as checked"
+            )
+            self.stdout.write(f"Ingestion run {journal.run.pk} is {journal.run.status}: {counts}")
+            self.report_throughput("Market data", processed, time.perf_counter() - market_started)
             
             # Step 4: Update sector performance
             self.stdout.write("Calculating sector performance...")
             self.update_sector_performance()
             
+            self.report_throughput("Stock update", processed, time.perf_counter() - started)
             self.stdout.write(self.style.SUCCESS("Stock update completed successfully"))
 
         except Exception as e:
             logger.error(f"Stock update failed: {str(e)}")
             self.stdout.write(self.style.ERROR(f"Error: {str(e)}"))
 
-    def fetch_nse_listings(self):
-        """Fetch current NSE listings from official source"""
-        url = "https://archives.nseindia.com/content/equities/EQUITY_L.csv"
-        response = requests.get(url, timeout=15)
-        response.raise_for_status()
-        return self.parse_nse_csv(response.text)
+    def setup_upstream(self, options):
+        """Build the provider, rate limiter and upstream guard from command options.
+
+        Expects the ``provider``, ``latency``, ``error_rate``, ``capacity``,
+        ``rate`` and ``max_in_flight`` options; other commands that refresh
+        prices through this one (e.g. run_scheduler) pass the same keys.
+        """
+        provider_options = {
+            key: options[key] for key in ('latency', 'error_rate', 'capacity') if options[key] is not None
+        }
+        self.provider = get_provider(options['provider'], **provider_options)
+        self.stdout.write(f"Using {self.provider.name} market data provider")
+        self.max_in_flight = options['max_in_flight'] or settings.INGESTION_MAX_IN_FLIGHT
+        if options['max_in_flight']:
+            self.guard = UpstreamGuard.from_settings(self.max_in_flight)
+        else:
+            self.guard = upstream_guard
+        if options['rate']:
+            self.limiter = TokenBucket(options['rate'], max(options['rate'], settings.INGESTION_BURST))
+        else:
+            self.limiter = upstream_limiter
+
+    def refresh_symbols(self, symbols, writer, batch=False, chunk_size=100, journal=None):
+        """Fetch market data for ``symbols`` and queue the updates on ``writer``.
+
+        Fundamentals are only fetched for symbols whose stored values are past
+        FUNDAMENTALS_TTL. When a journal is given, every symbol ends up marked
+        done or failed in it.
+
+        Returns:
+            IngestionEngine: The finished engine, for its counters
+        """
+        stored = stored_history(symbols)
+        self.stale = stale_fundamentals(symbols)
+        self.stdout.write(
+            f"Refreshing {len(symbols)} symbols: {len(stored)} with stored history, "
+            f"{len(self.stale)} with fundamentals due"
+        )
+        if batch:
+            return self.update_financial_data_batched(symbols, chunk_size, writer, stored, journal)
+        return self.update_financial_data(symbols, writer, stored, journal)
+
+    def fetch_nse_listings(self, force=False):
+        """Fetch current NSE listings from the market data provider.
+
+        The parsed listing is cached on disk by content hash, so an unchanged
+        listing is never parsed twice.
+
+        Returns:
+            tuple: (CachedResponse to pass to ``provider.commit_listing`` once
+                synced, parsed listing dict or None if the provider reports
+                it unchanged)
+        """
+        listing = self.provider.fetch_listing(force=force)
+        if listing.not_modified:
+            return listing, None
+
+        cache = ParsedCache(settings.LISTING_CACHE_DIR, 'nse-listing')
+        nse_stocks = None if force else cache.get(listing.sha256)
+        if nse_stocks is None:
+            nse_stocks = self.parse_nse_csv(listing.content.decode())
+            cache.set(listing.sha256, nse_stocks)
+        return listing, nse_stocks
 
     def parse_nse_csv(self, csv_content):
         """Parse NSE CSV data with sector detection"""
@@ -91,168 +289,245 @@ class Command(BaseCommand):
                 return sector
         return 'Other'
 
-    def update_stock_listings(self, nse_stocks):
-        """Update or create stock records in database with safe defaults"""
-        updated_symbols = []
-        stocks_to_update = []
-        
+    def update_stock_listings(self, nse_stocks, batch_size=500):
+        """Sync stock records with the NSE listing using set-based writes.
+
+        Existing rows are read in a single query and diffed against the
+        listing. New symbols are inserted in batches, only name and sector are
+        updated for rows whose listing details changed, and delisted symbols
+        are removed with one delete. Price fields are never touched.
+        """
+        existing = {
+            symbol: (name, sector)
+            for symbol, name, sector in Stock.objects.values_list('symbol', 'name', 'sector')
+        }
+
+        new_stocks = []
+        changed_stocks = []
         for symbol, data in nse_stocks.items():
-            # Default values for required fields
-            defaults = {
-                'name': data['name'],
-                'sector': data['sector'],
-                'current_price': 0.00,
-                'high_52w': 0.00,
-                'low_52w': 0.00,
-                'market_cap': 0.00,
-                'change_percentage': 0.00
-            }
-            
-            stock, created = Stock.objects.update_or_create(
-                symbol=symbol,
-                defaults=defaults
-            )
-            updated_symbols.append(symbol)
-        
+            listing = (data['name'], data['sector'])
+            if symbol not in existing:
+                new_stocks.append(Stock(symbol=symbol, name=data['name'], sector=data['sector']))
+            elif existing[symbol] != listing:
+                changed_stocks.append(Stock(symbol=symbol, name=data['name'], sector=data['sector']))
+
+        # Inserts and changed rows both go through the upsert so a symbol
+        # listed concurrently by another run cannot fail the batch
+        Stock.objects.bulk_create(
+            new_stocks + changed_stocks,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['symbol'],
+            update_fields=['name', 'sector']
+        )
+
         # Bulk delete delisted stocks
-        Stock.objects.exclude(symbol__in=updated_symbols).delete()
-        
-        return updated_symbols
+        delisted = [symbol for symbol in existing if symbol not in nse_stocks]
+        if delisted:
+            Stock.objects.filter(symbol__in=delisted).delete()
+        if new_stocks or changed_stocks or delisted:
+            bump_data_version()
+            # Rebuilds the search index
+            bump_data_version(LISTINGS)
 
-    @retry(wait=wait_exponential(multiplier=1, min=4, max=10), stop=stop_after_attempt(5))
-    def fetch_financial_data(self, symbol):
-        """Fetch financial data for a stock symbol with retry logic"""
-        try:
-            ticker = yf.Ticker(f"{symbol}.NS")
-            return ticker.info, ticker.history(period="1y")
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 401:
-                logger.error(f"401 Unauthorized: Too many requests for {symbol}. Retrying in 10 seconds.")
-                sleep(10)  # Retry after 10 seconds
-                return self.fetch_financial_data(symbol)  # Retry the function call
-            else:
-             raise
-    
-    
+        self.stdout.write(
+            f"Listings: {len(new_stocks)} new, {len(changed_stocks)} changed, "
+            f"{len(delisted)} delisted, {len(nse_stocks)} total"
+        )
+        return list(nse_stocks)
 
-    def update_financial_data(self, symbols):
-        """Fetch and update financial data concurrently"""
-        update_data = []
-        
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            future_to_symbol = {executor.submit(self.fetch_and_update_symbol, symbol): symbol for symbol in symbols}
-            for future in as_completed(future_to_symbol):
-                symbol = future_to_symbol[future]
-                try:
-                    future.result()
-                except Exception as e:
-                    logger.error(f"Failed to update {symbol}: {str(e)}")
-                    continue
-
-    def fetch_and_update_symbol(self, symbol):
-        """Fetch and update the stock data for a single symbol"""
-        try:
-            info, hist = self.fetch_financial_data(symbol)
+    def fetch_financial_data(self, symbol, start=None, fundamentals=True):
+        """Fetch financial data for a stock symbol.
 
-            sleep(1)  # Adjust the sleep time based on your requirements
-            
-            # Safely get values with fallbacks
-            current_price = info.get('currentPrice') or \
-                              info.get('regularMarketPrice') or \
-                              0.00
-            previous_close = info.get('regularMarketPreviousClose') or current_price
-            
-            # Check if the stock has no price data or delisted
-            if current_price == 0.00 or 'delisted' in info.get('longName', '').lower():
-                logger.warning(f"{symbol}: Delisted or missing data, skipping.")
-                return  # Skip this stock if no price data or it is delisted
-            
-            # Calculate 52-week values only if historical data is available
-            if not hist.empty:
-                high_52w = hist['High'].max()
-                low_52w = hist['Low'].min()
-            else:
-                high_52w = current_price
-                low_52w = current_price
-            
-            update_data = {
-                'current_price': current_price,
-                'high_52w': high_52w,
-                'low_52w': low_52w,
-                'market_cap': info.get('marketCap', 0.00),
-                'pe_ratio': info.get('trailingPE', None),
-                'change_percentage': ((current_price - previous_close) / previous_close * 100) if previous_close else 0.00,
-                'last_updated': timezone.now()
-            }
-            
-            # Remove None values to prevent null assignments
-            update_data = {k: v for k, v in update_data.items() if v is not None}
-            
-            # Update stock data in bulk (for now, it can be collected in a list for later bulk update)
-            Stock.objects.filter(symbol=symbol).update(**update_data)
-        except Exception as e:
-            logger.error(f"Error updating symbol {symbol}: {str(e)}")
-    
-    def update_sector_performance(self):
-        """Calculate and update top performing sectors using weighted averages"""
-        # Get all stocks with valid data
-        stocks = Stock.objects.filter(
-            sector__isnull=False,
-            change_percentage__isnull=False,
-            current_price__gt=0
-        ).exclude(
-            sector__in=['', 'Unknown', 'unknown']
+        History is fetched from ``start`` when given, otherwise for a full year.
+        The ``info`` request is only made when ``fundamentals`` is True;
+        otherwise an empty dict is returned in its place. There is no retry
+        here: throttling (401/429) is handled by the upstream guard, which
+        lowers concurrency for every worker and waits out an open circuit,
+        and failed symbols are recorded in the run journal for ``--resume``.
+        """
+        hist = self.guard.call(self.provider.get_history, symbol, start)
+        info = {}
+        if fundamentals:
+            # A second upstream request, so it needs its own token
+            self.limiter.acquire_sync()
+            info = self.guard.call(self.provider.get_info, symbol)
+        return info, hist
+
+    def fetch_history_batch(self, symbols, start=None):
+        """Download daily bars for several symbols in a single provider call.
+
+        Bars are fetched from ``start`` when given, otherwise for a full year.
+
+        Returns:
+            dict: symbol -> history DataFrame (only symbols with data are included)
+        """
+        return self.guard.call(self.provider.download, symbols, start)
+
+    def update_financial_data_batched(self, symbols, chunk_size, writer, stored, journal=None):
+        """Download price data in chunks on the ingestion engine and queue the updates"""
+        chunk_size = max(1, chunk_size)
+        chunks = (symbols[start:start + chunk_size] for start in range(0, len(symbols), chunk_size))
+        processed = 0
+
+        def on_result(chunk, _):
+            nonlocal processed
+            processed += len(chunk)
+            self.stdout.write(f"Processed {processed}/{len(symbols)} symbols")
+
+        def on_error(chunk, error):
+            logger.error(f"Failed to download chunk starting at {chunk[0]}: {str(error)}")
+            if journal:
+                journal.mark_failed(chunk, error)
+
+        engine = IngestionEngine(
+            lambda chunk: self.fetch_and_update_chunk(chunk, writer, stored, journal),
+            limiter=self.limiter,
+            max_in_flight=self.max_in_flight
         )
+        return engine.run(chunks, on_result, on_error)
+
+    def fetch_and_update_chunk(self, chunk, writer, stored, journal=None):
+        """Download one chunk of symbols and queue the update for each of them"""
+        # Symbols with stored bars only need recent sessions; the rest
+        # need a full year to seed their history
+        warm = [symbol for symbol in chunk if symbol in stored]
+        cold = [symbol for symbol in chunk if symbol not in stored]
+        histories = {}
+        if warm:
+            since = min(fetch_start(stored[symbol]) for symbol in warm)
+            histories.update(self.fetch_history_batch(warm, since))
+        if cold:
+            histories.update(self.fetch_history_batch(cold))
 
-        # Calculate sector performance using weighted averages
-        sectors_data = {}
-        for stock in stocks:
-            sector = stock.sector.strip()
-            if not sector:
+        # Price metrics for the whole chunk in one vectorized pass
+        metrics = metrics_by_symbol(compute_metrics(histories, stored))
+        for symbol in chunk:
+            hist = histories.get(symbol)
+            if hist is None:
+                logger.warning(f"{symbol}: No history in batch download, skipping.")
+                if journal:
+                    journal.mark_failed([symbol], "No history in batch download")
                 continue
+            try:
+                writer.put_bars(bars_from_history(symbol, hist))
+                info = {}
+                fundamentals = symbol in self.stale
+                if fundamentals:
+                    self.limiter.acquire_sync()
+                    info = self.guard.call(self.provider.get_info, symbol)
+                update_data = self.build_update_data(
+                    symbol, info, metrics.get(symbol, {}), fundamentals
+                )
+                if update_data:
+                    writer.put(symbol, update_data)
+                elif journal:
+                    journal.mark_done([symbol])
+            except Exception as e:
+                logger.error(f"Error updating symbol {symbol}: {str(e)}")
+                if journal:
+                    journal.mark_failed([symbol], e)
 
-            if sector not in sectors_data:
-                sectors_data[sector] = {
-                    'total_weighted_change': 0,
-                    'total_weight': 0,
-                    'count': 0
-                }
-
-            # Use market cap as weight, fallback to price * 1M if not available
-            weight = float(stock.market_cap if stock.market_cap else (stock.current_price * 1000000))
-            change = float(stock.change_percentage)
-
-            sectors_data[sector]['total_weighted_change'] += change * weight
-            sectors_data[sector]['total_weight'] += weight
-            sectors_data[sector]['count'] += 1
-
-        # Convert to list and calculate final performance
-        sectors = []
-        for sector, data in sectors_data.items():
-            if data['count'] >= 2:  # Only include sectors with at least 2 stocks
-                avg_performance = data['total_weighted_change'] / data['total_weight']
-                sectors.append({
-                    'name': sector,
-                    'performance': round(avg_performance, 2),
-                    'change_percentage': round(avg_performance, 2),
-                    'stocks_count': data['count']
-                })
+    def report_throughput(self, label, count, elapsed):
+        """Print elapsed time and symbols per second for a refresh step"""
+        rate = count / elapsed if elapsed > 0 else 0.0
+        self.stdout.write(f"{label}: {count} symbols in {elapsed:.1f}s ({rate:.1f} symbols/s)")
 
-        # Sort by absolute performance and take top 5
-        top_sectors = sorted(sectors, key=lambda x: abs(x['performance']), reverse=True)[:5]
+    def report_upstream(self):
+        """Show whether the refresh was held back by the provider or by our own limits."""
+        stats = self.guard.stats()
+        self.stdout.write(
+            f"Upstream guard: concurrency {stats['concurrency']}/{stats['max_concurrency']} "
+            f"({stats['decreases']} decreases), {stats['throttled']} throttled responses, "
+            f"breaker {stats['breaker']} ({stats['breaker_trips']} trips, {stats['rejections']} rejections)"
+        )
+        self.stdout.write(f"Rate limiter held requests back for {self.limiter.waited:.1f}s in total")
 
-        # Bulk delete old sector data
-        TopSector.objects.all().delete()
+    def report_batch(self, rows, elapsed):
+        """Print the size and duration of a flushed write batch"""
+        self.stdout.write(f"Wrote batch of {rows} rows in {elapsed * 1000:.0f}ms")
 
-        # Bulk create new sector entries
-        sector_entries = [
-            TopSector(
-                name=sector['name'],
-                performance=sector['performance'],
-                change_percentage=sector['change_percentage'],
-                stocks_count=sector['stocks_count']
-            )
-            for sector in top_sectors
-        ]
+    def update_financial_data(self, symbols, writer, stored, journal=None):
+        """Fetch financial data on the ingestion engine and queue the updates on the writer"""
+        def on_error(symbol, error):
+            logger.error(f"Failed to update {symbol}: {str(error)}")
+            if journal:
+                journal.mark_failed([symbol], error)
+
+        engine = IngestionEngine(
+            lambda symbol: self.fetch_and_update_symbol(symbol, writer, stored.get(symbol), journal),
+            limiter=self.limiter,
+            max_in_flight=self.max_in_flight
+        )
+        return engine.run(symbols, on_error=on_error)
 
-        TopSector.objects.bulk_create(sector_entries)
\ No newline at end of file
+    def fetch_and_update_symbol(self, symbol, writer, stored=None, journal=None):
+        """Fetch the stock data for a single symbol and queue its update"""
+        fundamentals = symbol in self.stale
+        info, hist = self.fetch_financial_data(symbol, fetch_start(stored), fundamentals)
+        metrics = metrics_by_symbol(compute_metrics({symbol: hist}, {symbol: stored} if stored else None))
+
+        writer.put_bars(bars_from_history(symbol, hist))
+        update_data = self.build_update_data(symbol, info, metrics.get(symbol, {}), fundamentals)
+        if update_data:
+            writer.put(symbol, update_data)
+        elif journal:
+            # Nothing to write (delisted or no price), but the symbol is finished
+            journal.mark_done([symbol])
+
+    def build_update_data(self, symbol, info, metrics, fundamentals=False):
+        """Build the Stock field updates from ticker info and computed price metrics.
+
+        ``metrics`` comes from ``stocks.metrics.compute_metrics`` (52-week
+        values already merged with the stored history). Prices in ``info``
+        win over the history-derived ones when the info call was made.
+        Fundamentals (market cap, P/E) are only written, and their refresh
+        time stamped, when ``fundamentals`` is True; price-only cycles leave
+        them alone.
+
+        Returns:
+            dict: Field updates, or None if the stock is delisted or has no price
+        """
+        # Safely get values with fallbacks
+        current_price = info.get('currentPrice') or \
+                          info.get('regularMarketPrice') or \
+                          metrics.get('current_price') or \
+                          0.00
+        previous_close = info.get('regularMarketPreviousClose') or \
+                          metrics.get('previous_close') or \
+                          current_price
+        
+        # Check if the stock has no price data or delisted
+        if current_price == 0.00 or 'delisted' in info.get('longName', '').lower():
+            logger.warning(f"{symbol}: Delisted or missing data, skipping.")
+            return None  # Skip this stock if no price data or it is delisted
+        
+        if current_price == metrics.get('current_price') and previous_close == metrics.get('previous_close'):
+            change_percentage = metrics['change_percentage']
+        else:
+            change_percentage = ((current_price - previous_close) / previous_close * 100) if previous_close else 0.00
+        
+        now = timezone.now()
+        # Fall back to the current price when there is no history at all
+        high_52w = metrics.get('high_52w', current_price)
+        update_data = {
+            'current_price': current_price,
+            'high_52w': high_52w,
+            'low_52w': metrics.get('low_52w', current_price),
+            'distance_from_high': distance_from_high(current_price, high_52w),
+            'change_percentage': change_percentage,
+            'price_updated_at': now,
+            'last_updated': now
+        }
+        if fundamentals:
+            update_data['market_cap'] = info.get('marketCap')
+            update_data['pe_ratio'] = info.get('trailingPE')
+            update_data['fundamentals_updated_at'] = now
+        
+        # Remove None values to prevent null assignments
+        return {k: v for k, v in update_data.items() if v is not None}
+    
+    def update_sector_performance(self):
+        """Recompute and store market-cap weighted sector performance"""
+        sectors = refresh_sector_performance()
+        self.stdout.write(f"Stored performance of {len(sectors)} sectors")
\ No newline at end of file
@@ -0,0 +1,111 @@
+"""Vectorized price metrics for many symbols at once.
+
+Fetched histories are aligned into wide frames (one column per symbol) so
+52-week extremes, previous close and change percentage are computed with a
+handful of NumPy operations per batch instead of a Python loop per symbol.
+"""
+
+import numpy as np
+import pandas as pd
+
+METRIC_COLUMNS = ['current_price', 'previous_close', 'change_percentage', 'high_52w', 'low_52w', 'volume']
+
+
+def wide_frames(histories):
+    """Align per-symbol history frames on a shared date index.
+
+    Args:
+        histories (dict): symbol -> yfinance-style history frame
+
+    Returns:
+        dict: ``'High'``, ``'Low'``, ``'Close'`` and ``'Volume'`` -> DataFrame
+            indexed by date with one column per symbol
+    """
+    frames = {
+        symbol: hist.reindex(columns=['High', 'Low', 'Close', 'Volume'])
+        for symbol, hist in histories.items()
+        if hist is not None and not hist.empty
+    }
+    if not frames:
+        return {}
+    wide = pd.concat(frames, axis=1).sort_index()
+    return {field: wide.xs(field, axis=1, level=1).astype(float) for field in ('High', 'Low', 'Close', 'Volume')}
+
+
+def compute_metrics(histories, stored=None):
+    """Compute price metrics for every symbol in one pass.
+
+    Args:
+        histories (dict): symbol -> fetched history frame
+        stored (dict): symbol -> StoredHistory; stored 52-week extremes are
+            merged with the fetched bars
+
+    Returns:
+        DataFrame: One row per symbol with a last close, indexed by symbol,
+            with METRIC_COLUMNS (NaN where unknown)
+    """
+    wide = wide_frames(histories)
+    if not wide:
+        return pd.DataFrame(columns=METRIC_COLUMNS)
+    stored = stored or {}
+
+    close = wide['Close'].to_numpy()
+    symbols = wide['Close'].columns
+    valid = ~np.isnan(close)
+    has_close = valid.any(axis=0)
+    columns = np.arange(close.shape[1])
+
+    # Row of the last and second-to-last valid close in each column
+    last_row = close.shape[0] - 1 - np.argmax(valid[::-1], axis=0)
+    current = close[last_row, columns]
+    before_last = valid & (np.arange(close.shape[0])[:, None] < last_row)
+    has_previous = before_last.any(axis=0)
+    previous_row = close.shape[0] - 1 - np.argmax(before_last[::-1], axis=0)
+    previous = np.where(has_previous, close[previous_row, columns], current)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = np.where(previous > 0, (current - previous) / previous * 100, 0.0)
+
+    stored_high = np.array([_extreme(stored.get(symbol), 'high_52w') for symbol in symbols], dtype=float)
+    stored_low = np.array([_extreme(stored.get(symbol), 'low_52w') for symbol in symbols], dtype=float)
+    with np.errstate(invalid='ignore'):
+        high = np.fmax(np.nanmax(wide['High'].to_numpy(), axis=0, initial=-np.inf), stored_high)
+        low = np.fmin(np.nanmin(wide['Low'].to_numpy(), axis=0, initial=np.inf), stored_low)
+    high[np.isinf(high)] = np.nan
+    low[np.isinf(low)] = np.nan
+
+    volume = wide['Volume'].to_numpy()[last_row, columns]
+
+    metrics = pd.DataFrame({
+        'current_price': current,
+        'previous_close': previous,
+        'change_percentage': change,
+        'high_52w': high,
+        'low_52w': low,
+        'volume': volume,
+    }, index=symbols)
+    return metrics[has_close].round(2)
+
+
+def distance_from_high(price, high):
+    """Fraction ``price`` sits below the 52-week high: 0 at the high, 0.3 at 30% below.
+
+    Returns:
+        float: Distance rounded to 4 places, or None when either value is unknown
+    """
+    if price is None or high is None or float(high) <= 0:
+        return None
+    return round(1 - float(price) / float(high), 4)
+
+
+def metrics_by_symbol(metrics):
+    """Turn a metrics frame into ``{symbol: {column: float}}`` without NaNs."""
+    return {
+        symbol: {key: value for key, value in row.items() if not pd.isna(value)}
+        for symbol, row in metrics.to_dict('index').items()
+    }
+
+
+def _extreme(stored, field):
+    value = getattr(stored, field, None) if stored else None
+    return np.nan if value is None else float(value)
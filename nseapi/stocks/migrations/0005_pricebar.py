@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0004_chatmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceBar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(max_length=20)),
+                ('date', models.DateField()),
+                ('open', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('high', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('low', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('close', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('volume', models.BigIntegerField(null=True)),
+            ],
+            options={
+                'ordering': ['symbol', 'date'],
+                'unique_together': {('symbol', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0005_pricebar'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stock',
+            name='fundamentals_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='price_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0008_ingestion_job'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(fields=['change_percentage'], name='stocks_stoc_change__85feb1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(fields=['market_cap'], name='stocks_stoc_market__c2c37a_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:46
+
+from django.db import migrations, models
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Cast
+
+
+def backfill_distance(apps, schema_editor):
+    # Same formula as stocks.metrics.distance_from_high; floats avoid
+    # integer division on backends that store whole prices as integers
+    Stock = apps.get_model('stocks', 'Stock')
+    Stock.objects.filter(current_price__isnull=False, high_52w__gt=0).update(
+        distance_from_high=Value(1.0) - Cast(F('current_price'), FloatField()) / Cast(F('high_52w'), FloatField())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0010_data_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stock',
+            name='distance_from_high',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=10, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(fields=['distance_from_high'], name='stocks_stoc_distanc_5687fc_idx'),
+        ),
+        migrations.RunPython(backfill_distance, migrations.RunPython.noop),
+    ]
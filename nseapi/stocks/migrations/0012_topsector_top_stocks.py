@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0011_stock_distance_from_high'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='topsector',
+            name='top_stocks',
+            field=models.JSONField(blank=True, default=list, help_text='Largest movers in this sector: symbol, name and change_percentage'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 from django.utils.translation import gettext_lazy as _
 from decimal import Decimal
@@ -60,13 +61,25 @@ class Stock(models.Model):
     low_52w = models.DecimalField(max_digits=10, decimal_places=2, null=True, verbose_name='52 Week Low')
     market_cap = models.DecimalField(max_digits=20, decimal_places=2, null=True)
     pe_ratio = models.DecimalField(max_digits=10, decimal_places=2, null=True, verbose_name='P/E Ratio')
+    # 1 - current_price / high_52w, maintained by ingestion for the
+    # "near 52-week high" screen (see stocks.metrics.distance_from_high)
+    distance_from_high = models.DecimalField(max_digits=10, decimal_places=4, null=True, blank=True)
     last_updated = models.DateTimeField(auto_now=True)
+    # Prices are refreshed every cycle, fundamentals on settings.FUNDAMENTALS_TTL
+    price_updated_at = models.DateTimeField(null=True, blank=True)
+    fundamentals_updated_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.symbol} - {self.name}"
 
     class Meta:
         ordering = ['symbol']
+        # Dashboard top-N lists sort on these (see stocks/dashboard.py)
+        indexes = [
+            models.Index(fields=['change_percentage']),
+            models.Index(fields=['market_cap']),
+            models.Index(fields=['distance_from_high']),
+        ]
 
 class TopSector(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -86,6 +99,11 @@ class TopSector(models.Model):
         default=0,
         help_text="Number of stocks in this sector"
     )
+    top_stocks = models.JSONField(
+        default=list,
+        blank=True,
+        help_text="Largest movers in this sector: symbol, name and change_percentage"
+    )
     last_updated = models.DateTimeField(auto_now=True)
 
     def __str__(self):
@@ -126,3 +144,157 @@ class ChatMessage(models.Model):
     def __str__(self):
         return f"{self.username}: {self.message[:30]}..."
 
+
+class PriceBar(models.Model):
+    """Daily OHLCV bar stored locally so refreshes only fetch new sessions"""
+    symbol = models.CharField(max_length=20)
+    date = models.DateField()
+    open = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    high = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    low = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    close = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    volume = models.BigIntegerField(null=True)
+
+    class Meta:
+        unique_together = ('symbol', 'date')
+        ordering = ['symbol', 'date']
+
+    def __str__(self):
+        return f"{self.symbol} {self.date}: {self.close}"
+
+class IngestionRun(models.Model):
+    """Journal of one update_nse_data run, used to resume interrupted refreshes"""
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_RUNNING)
+    provider = models.CharField(max_length=50, blank=True)
+    options = models.JSONField(default=dict, blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"Run {self.pk} ({self.status})"
+
+    def counts(self):
+        """Number of symbols in each status for this run."""
+        rows = self.symbols.values('status').annotate(total=models.Count('id'))
+        return {row['status']: row['total'] for row in rows}
+
+    def throughput(self):
+        """Completed symbols per second over the run's wall-clock time."""
+        end = self.finished_at
+        if not end:
+            return None
+        elapsed = (end - self.started_at).total_seconds()
+        done = self.symbols.filter(status=IngestionSymbol.STATUS_DONE).count()
+        return done / elapsed if elapsed > 0 else None
+
+
+class IngestionSymbol(models.Model):
+    """Per-symbol progress of an IngestionRun"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    run = models.ForeignKey('IngestionRun', on_delete=models.CASCADE, related_name='symbols')
+    symbol = models.CharField(max_length=20)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    claimed_by = models.CharField(max_length=64, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('run', 'symbol')
+        indexes = [models.Index(fields=['run', 'status'])]
+        ordering = ['symbol']
+
+    def __str__(self):
+        return f"{self.symbol} ({self.status})"
+
+
+class IngestionJob(models.Model):
+    """A background refresh queued through the API and run by a job worker"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    ACTIVE_STATUSES = [STATUS_QUEUED, STATUS_RUNNING]
+
+    kind = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    params = models.JSONField(default=dict, blank=True)
+    processed = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    message = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+        constraints = [
+            # At most one queued or running job of each kind; duplicate
+            # submissions attach to it instead
+            models.UniqueConstraint(
+                fields=['kind'],
+                condition=models.Q(status__in=['queued', 'running']),
+                name='one_active_job_per_kind'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.kind} job {self.pk} ({self.status})"
+
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+    def queued_seconds(self):
+        """Time the job waited for a worker."""
+        end = self.started_at or (timezone.now() if self.is_active else None)
+        return (end - self.created_at).total_seconds() if end else None
+
+    def run_seconds(self):
+        """Time the job has been (or was) running."""
+        if not self.started_at:
+            return None
+        end = self.finished_at or timezone.now()
+        return (end - self.started_at).total_seconds()
+
+
+class DataVersion(models.Model):
+    """Monotonic version of a dataset, bumped whenever ingestion changes it"""
+    name = models.CharField(max_length=50, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
@@ -0,0 +1,33 @@
+"""Pagination classes for the stock endpoints."""
+
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+# Query parameter that asks a listing endpoint for every row in one response
+FULL_DUMP_PARAM = 'all'
+
+
+class StockScreenPagination(PageNumberPagination):
+    """Pages of screen results (``?page=2&page_size=50``)."""
+
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class StockCursorPagination(CursorPagination):
+    """Keyset pages of the stock universe ordered by symbol.
+
+    Symbols are unique, so each cursor is a position in the symbol index and
+    a page is a range scan from it; pages stay stable while rows are added
+    or removed and cost the same at the end of the list as at the start.
+    """
+
+    ordering = 'symbol'
+    page_size = 200
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+def wants_full_dump(request):
+    """True when ``request`` asks for the unpaginated listing (``?all=1``)."""
+    return request.GET.get(FULL_DUMP_PARAM, '').lower() in ('1', 'true', 'yes')
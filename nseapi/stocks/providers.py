@@ -0,0 +1,308 @@
+"""Market data providers used by the ingestion pipeline.
+
+Ingestion code talks to a MarketDataProvider instead of calling yfinance
+directly. YFinanceProvider is the live implementation; LocalProvider serves
+quotes and history from files on disk so a full refresh can be run and
+benchmarked without network access.
+"""
+
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+from django.conf import settings
+
+from .cache import CachedResponse, HttpCache
+
+logger = logging.getLogger(__name__)
+
+NSE_LISTING_URL = "https://archives.nseindia.com/content/equities/EQUITY_L.csv"
+
+
+class ProviderError(Exception):
+    """Raised when a provider cannot serve a request."""
+
+
+class ThrottledError(ProviderError):
+    """Raised when the provider rejects a request because we are sending too many."""
+
+
+class MarketDataProvider:
+    """Interface for upstream market data.
+
+    Symbols are plain NSE symbols (``TCS``); providers add any exchange
+    suffix they need. History frames use the yfinance layout: a date index
+    and ``Open``/``High``/``Low``/``Close``/``Volume`` columns.
+    """
+
+    name = None
+
+    def listing_csv(self):
+        """Return the NSE equity listing (EQUITY_L.csv) as text."""
+        raise NotImplementedError
+
+    def fetch_listing(self, force=False):
+        """Return the listing as a CachedResponse.
+
+        ``not_modified`` is True when the provider knows the listing has not
+        changed since it was last fetched. The default implementation always
+        downloads the listing.
+        """
+        content = self.listing_csv().encode()
+        return CachedResponse(content, hashlib.sha256(content).hexdigest(), False)
+
+    def commit_listing(self, listing):
+        """Record that ``listing`` (from ``fetch_listing``) has been synced.
+
+        Providers that revalidate the listing only remember it from here, so
+        a failed sync is retried with a full download. The default does
+        nothing.
+        """
+
+    def get_info(self, symbol):
+        """Return a quote/fundamentals dict with yfinance ``info`` keys."""
+        raise NotImplementedError
+
+    def get_history(self, symbol, start=None):
+        """Return daily bars from ``start``, or for the last year if not given."""
+        raise NotImplementedError
+
+    def download(self, symbols, start=None):
+        """Return ``{symbol: history}`` for several symbols.
+
+        Providers that support multi-symbol requests override this; the
+        default falls back to one ``get_history`` call per symbol.
+        """
+        histories = {}
+        for symbol in symbols:
+            hist = self.get_history(symbol, start)
+            if hist is not None and not hist.empty:
+                histories[symbol] = hist
+        return histories
+
+
+class YFinanceProvider(MarketDataProvider):
+    """Live provider backed by Yahoo Finance and the NSE archives."""
+
+    name = 'yfinance'
+    suffix = '.NS'
+
+    def listing_csv(self):
+        return self.fetch_listing().content.decode()
+
+    def fetch_listing(self, force=False):
+        # The listing rarely changes, so revalidate the cached copy instead
+        # of downloading it on every run
+        return HttpCache(settings.HTTP_CACHE_DIR).get(NSE_LISTING_URL, force=force)
+
+    def commit_listing(self, listing):
+        HttpCache(settings.HTTP_CACHE_DIR).commit(NSE_LISTING_URL, listing)
+
+    def get_info(self, symbol):
+        return yf.Ticker(f"{symbol}{self.suffix}").info
+
+    def get_history(self, symbol, start=None):
+        ticker = yf.Ticker(f"{symbol}{self.suffix}")
+        return ticker.history(start=start) if start else ticker.history(period="1y")
+
+    def download(self, symbols, start=None):
+        tickers = [f"{symbol}{self.suffix}" for symbol in symbols]
+        period = {'start': start} if start else {'period': "1y"}
+        data = yf.download(
+            tickers,
+            group_by='ticker',
+            auto_adjust=False,
+            threads=True,
+            progress=False,
+            **period
+        )
+
+        histories = {}
+        if data is None or data.empty:
+            return histories
+
+        for symbol, ticker in zip(symbols, tickers):
+            if isinstance(data.columns, pd.MultiIndex):
+                if ticker not in data.columns.get_level_values(0):
+                    continue
+                hist = data[ticker]
+            else:
+                # A single ticker download comes back with flat columns
+                hist = data
+            hist = hist.dropna(how='all')
+            if not hist.empty:
+                histories[symbol] = hist
+        return histories
+
+
+class LocalProvider(MarketDataProvider):
+    """Offline provider that replays quotes and bars from a directory.
+
+    The directory holds ``listing.csv``, ``quotes.json`` and one
+    ``bars/<SYMBOL>.csv`` per symbol; ``LocalProvider.seed`` generates it.
+    Every request can be delayed and made to fail at random so refresh
+    throughput can be measured under realistic upstream behaviour.
+
+    Args:
+        root (str): Directory with the replay files
+        latency (float): Mean delay per request in seconds
+        error_rate (float): Probability (0-1) that a request raises ProviderError
+        capacity (int): Concurrent requests served before the provider starts
+            answering with ThrottledError, like a rate-limited upstream
+        seed (int): Seed for latency jitter and error injection
+    """
+
+    name = 'local'
+
+    def __init__(self, root=None, latency=0.0, error_rate=0.0, capacity=None, seed=None):
+        self.root = Path(root or settings.MARKET_DATA_REPLAY_DIR)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.capacity = capacity
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._quotes = None
+
+    def listing_csv(self):
+        self._simulate()
+        return (self.root / 'listing.csv').read_text()
+
+    def get_info(self, symbol):
+        self._simulate()
+        info = self._load_quotes().get(symbol)
+        if info is None:
+            raise ProviderError(f"No quote for {symbol}")
+        return dict(info)
+
+    def get_history(self, symbol, start=None):
+        self._simulate()
+        return self._read_bars(symbol, start)
+
+    def download(self, symbols, start=None):
+        # One simulated round trip for the whole chunk, like a real batch call
+        self._simulate()
+        histories = {}
+        for symbol in symbols:
+            hist = self._read_bars(symbol, start)
+            if not hist.empty:
+                histories[symbol] = hist
+        return histories
+
+    def _simulate(self):
+        with self._lock:
+            delay = self._random.uniform(0.5, 1.5) * self.latency if self.latency else 0.0
+            fail = self.error_rate and self._random.random() < self.error_rate
+            throttled = self.capacity and self._active >= self.capacity
+            self._active += 1
+        try:
+            if delay:
+                time.sleep(delay)
+            if throttled:
+                raise ThrottledError(f"More than {self.capacity} concurrent requests")
+            if fail:
+                raise ProviderError("Injected provider error")
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _load_quotes(self):
+        if self._quotes is None:
+            with open(self.root / 'quotes.json') as f:
+                self._quotes = json.load(f)
+        return self._quotes
+
+    def _read_bars(self, symbol, start=None):
+        path = self.root / 'bars' / f"{symbol}.csv"
+        if not path.exists():
+            return pd.DataFrame(columns=['Open', 'High', 'Low', 'Close', 'Volume'])
+        hist = pd.read_csv(path, index_col='Date', parse_dates=True)
+        if start:
+            hist = hist[hist.index >= pd.Timestamp(start)]
+        return hist
+
+    @classmethod
+    def seed(cls, root, listing_path, days=260, end=None):
+        """Generate replay files for every EQ symbol in a listing CSV.
+
+        Bars are a deterministic random walk per symbol, so reseeding the
+        same listing produces the same data.
+
+        Returns:
+            int: Number of symbols written
+        """
+        root = Path(root)
+        (root / 'bars').mkdir(parents=True, exist_ok=True)
+        listing = Path(listing_path).read_text()
+        (root / 'listing.csv').write_text(listing)
+
+        frame = pd.read_csv(listing_path, skipinitialspace=True)
+        frame.columns = [column.strip() for column in frame.columns]
+        frame = frame[frame['SERIES'] == 'EQ']
+        dates = pd.bdate_range(end=pd.Timestamp(end) if end else pd.Timestamp.today().normalize(), periods=days)
+
+        quotes = {}
+        for symbol, name in zip(frame['SYMBOL'], frame['NAME OF COMPANY']):
+            rng = np.random.default_rng(zlib.crc32(symbol.encode()))
+            start_price = rng.uniform(20, 4000)
+            closes = start_price * np.exp(np.cumsum(rng.normal(0, 0.02, days)))
+            opens = closes * (1 + rng.normal(0, 0.005, days))
+            highs = np.maximum(opens, closes) * (1 + rng.uniform(0, 0.02, days))
+            lows = np.minimum(opens, closes) * (1 - rng.uniform(0, 0.02, days))
+            volumes = rng.integers(1_000, 5_000_000, days)
+
+            bars = pd.DataFrame({
+                'Open': opens.round(2),
+                'High': highs.round(2),
+                'Low': lows.round(2),
+                'Close': closes.round(2),
+                'Volume': volumes
+            }, index=pd.Index(dates, name='Date'))
+            bars.to_csv(root / 'bars' / f"{symbol}.csv")
+
+            shares = rng.integers(10_000_000, 5_000_000_000)
+            quotes[symbol] = {
+                'longName': name,
+                'currentPrice': float(bars['Close'].iloc[-1]),
+                'regularMarketPreviousClose': float(bars['Close'].iloc[-2]),
+                'marketCap': float(round(bars['Close'].iloc[-1] * shares, 2)),
+                'trailingPE': float(round(rng.uniform(5, 80), 2)),
+                'sector': 'Unknown'
+            }
+
+        with open(root / 'quotes.json', 'w') as f:
+            json.dump(quotes, f)
+        return len(quotes)
+
+
+PROVIDERS = {
+    YFinanceProvider.name: YFinanceProvider,
+    LocalProvider.name: LocalProvider,
+}
+
+
+def get_provider(name=None, **options):
+    """Build the configured market data provider.
+
+    Args:
+        name (str): Provider name; defaults to settings.MARKET_DATA_PROVIDER
+        **options: Extra keyword arguments for the provider, merged over
+            settings.MARKET_DATA_PROVIDER_OPTIONS
+
+    Raises:
+        ValueError: If the provider name is unknown
+    """
+    name = name or settings.MARKET_DATA_PROVIDER
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown market data provider: {name}")
+    kwargs = dict(settings.MARKET_DATA_PROVIDER_OPTIONS.get(name, {}))
+    kwargs.update(options)
+    return PROVIDERS[name](**kwargs)
@@ -0,0 +1,62 @@
+"""Response renderers for the stock endpoints."""
+
+from rest_framework.renderers import BaseRenderer, BrowsableAPIRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # in requirements.txt; without it JSONRenderer does the encoding
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # in requirements.txt; without it MessagePack is not offered
+    msgpack = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer that encodes with orjson when it is installed.
+
+    The output is byte for byte what JSONRenderer produces for the payloads
+    these endpoints return (compact separators, UTF-8, U+2028/U+2029
+    escaped). Anything orjson cannot encode the same way (Decimals, dates,
+    lazy strings, indented output) goes through JSONRenderer. Floats are
+    written in shortest form by both and only differ in exponent notation
+    (1e+16 vs 1e16), which 2-decimal prices and market caps do not reach.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            # Dates and dataclasses are left to JSONRenderer's encoder, which
+            # formats them differently from orjson
+            ret = orjson.dumps(data, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same escapes JSONRenderer applies for JavaScript compatibility
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Renders responses as MessagePack.
+
+    The bulk endpoints encode their own columnar bodies (stocks/encodings.py);
+    this renderer lets ``Accept: application/msgpack`` and
+    ``?format=msgpack`` through DRF's content negotiation.
+    """
+
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data)
+
+
+# Renderers for the stock endpoints: JSON first so it stays the default
+STOCK_RENDERERS = [FastJSONRenderer, BrowsableAPIRenderer] + ([MessagePackRenderer] if msgpack else [])
@@ -0,0 +1,206 @@
+"""In-memory search index for stock autocomplete.
+
+Symbols and company names are held in a prefix trie (symbols and every word
+of the name) and a trigram posting list, so a keystroke is answered from
+memory without a ``LIKE '%...%'`` scan. Matches are ranked in tiers:
+
+1. exact symbol
+2. symbol prefix, then name word prefix
+3. substring of the symbol or name
+4. fuzzy: enough shared trigrams to survive a typo
+
+The index belongs to the ``LISTINGS`` snapshot (see stocks/snapshot.py), so
+each process rebuilds it once after a listing sync.
+"""
+
+import re
+import threading
+import time
+
+from .models import Stock
+from .snapshot import LISTINGS, get_snapshot
+
+MATCH_EXACT = 'exact'
+MATCH_PREFIX = 'prefix'
+MATCH_SUBSTRING = 'substring'
+MATCH_FUZZY = 'fuzzy'
+
+# Share of the query's trigrams a stock must contain to be a fuzzy candidate
+FUZZY_MIN_SCORE = 0.5
+
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+
+
+def normalize(text):
+    """Lowercase ``text`` and collapse punctuation to single spaces."""
+    return _NON_WORD.sub(' ', (text or '').lower()).strip()
+
+
+def symbol_key(symbol):
+    """Normalize a symbol the way queries are compared with it (M&M -> mm)."""
+    return normalize(symbol).replace(' ', '')
+
+
+def trigrams(text, pad=True):
+    """Return the set of 3-character grams of ``text``.
+
+    Padding with spaces adds grams for the start and end of each word, which
+    makes short typos score better; substring lookups use unpadded grams.
+    """
+    if pad:
+        text = f" {text} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """Prefix trie and trigram postings over a list of stocks.
+
+    Args:
+        entries: Iterable of ``(symbol, name, sector)`` tuples
+    """
+
+    def __init__(self, entries):
+        self.entries = []
+        self._symbols = []
+        self._names = []
+        self._symbol_trie = {}
+        self._word_trie = {}
+        self._grams = {}
+        # Per stock: trigram sets of the symbol, each name word and the whole name.
+        # Symbols are keyed without punctuation, like queries; entries keep the display symbol
+        self._tokens = []
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.total_us = 0.0
+        self.max_us = 0.0
+
+        for doc, (symbol, name, sector) in enumerate(entries):
+            self.entries.append({'symbol': symbol, 'name': name, 'sector': sector})
+            key, name_key = symbol_key(symbol), normalize(name)
+            self._symbols.append(key)
+            self._names.append(name_key)
+
+            self._insert(self._symbol_trie, key, doc)
+            for word in set(name_key.split()):
+                self._insert(self._word_trie, word, doc)
+            tokens = [trigrams(token) for token in {key, name_key, *name_key.split()}]
+            self._tokens.append(tokens)
+            for gram in set().union(*tokens):
+                self._grams.setdefault(gram, []).append(doc)
+
+    @classmethod
+    def from_db(cls):
+        """Build the index from every Stock row (one query)."""
+        return cls(Stock.objects.order_by('symbol').values_list('symbol', 'name', 'sector'))
+
+    @staticmethod
+    def _insert(trie, key, doc):
+        # Every node keeps the documents below it, so a prefix lookup is a
+        # walk of len(prefix) steps with no subtree traversal
+        node = trie
+        for char in key:
+            node = node.setdefault(char, {})
+            node.setdefault(None, []).append(doc)
+
+    @staticmethod
+    def _lookup(trie, prefix):
+        node = trie
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+        return node.get(None, [])
+
+    def search(self, query, limit=10):
+        """Return up to ``limit`` ranked matches for ``query``.
+
+        Returns:
+            tuple: (list of dicts with ``symbol``, ``name``, ``sector`` and
+                ``match`` (exact, prefix, substring or fuzzy), microseconds taken)
+        """
+        started = time.perf_counter()
+        results = self._search(normalize(query), limit)
+        elapsed_us = (time.perf_counter() - started) * 1_000_000
+        with self._lock:
+            self.queries += 1
+            self.total_us += elapsed_us
+            self.max_us = max(self.max_us, elapsed_us)
+        return results, elapsed_us
+
+    def _search(self, query, limit):
+        if not query:
+            return []
+        seen = set()
+        ranked = []
+
+        def take(docs, match, key=None):
+            fresh = [doc for doc in docs if doc not in seen]
+            fresh.sort(key=key or (lambda doc: (len(self._symbols[doc]), self._symbols[doc])))
+            for doc in fresh[:limit - len(ranked)]:
+                seen.add(doc)
+                ranked.append({**self.entries[doc], 'match': match})
+            return len(ranked) >= limit
+
+        compact = query.replace(' ', '')
+        exact = [doc for doc in self._lookup(self._symbol_trie, compact) if self._symbols[doc] == compact]
+        if take(exact, MATCH_EXACT):
+            return ranked
+        if take(self._lookup(self._symbol_trie, compact), MATCH_PREFIX):
+            return ranked
+        words = query.split()
+        name_prefix = set(self._lookup(self._word_trie, words[0]))
+        for word in words[1:]:
+            name_prefix &= set(self._lookup(self._word_trie, word))
+        if take(name_prefix, MATCH_PREFIX):
+            return ranked
+
+        if len(query) < 3:
+            return ranked
+
+        # Substring: every unpadded gram of the query must appear, then the
+        # candidates are confirmed against the text
+        postings = sorted((self._grams.get(gram, []) for gram in trigrams(query, pad=False)), key=len)
+        candidates = set(postings[0]).intersection(*postings[1:]) if postings else set()
+        substring = [
+            doc for doc in candidates
+            if query in self._names[doc] or compact in self._symbols[doc]
+        ]
+        if take(substring, MATCH_SUBSTRING):
+            return ranked
+
+        grams = trigrams(query)
+        hits = {}
+        for gram in grams:
+            for doc in self._grams.get(gram, ()):
+                hits[doc] = hits.get(doc, 0) + 1
+        word_grams = [trigrams(word) for word in words]
+        fuzzy = {
+            doc: self._similarity(doc, word_grams)
+            for doc, count in hits.items() if count / len(grams) >= FUZZY_MIN_SCORE
+        }
+        take(fuzzy, MATCH_FUZZY, key=lambda doc: (-fuzzy[doc], self._symbols[doc]))
+        return ranked
+
+    def _similarity(self, doc, word_grams):
+        # Each query word is compared with its closest token (Jaccard), so a
+        # misspelt word is scored against the word it was meant to be
+        return sum(
+            max(len(grams & token) / len(grams | token) for token in self._tokens[doc])
+            for grams in word_grams
+        ) / len(word_grams)
+
+    def stats(self):
+        """Return the index size and query latency counters."""
+        with self._lock:
+            return {
+                'stocks': len(self.entries),
+                'trigrams': len(self._grams),
+                'queries': self.queries,
+                'mean_us': round(self.total_us / self.queries, 1) if self.queries else 0.0,
+                'max_us': round(self.max_us, 1),
+            }
+
+
+def get_search_index():
+    """Return the search index for the current listings version."""
+    return get_snapshot(LISTINGS).view('search_index', SearchIndex.from_db)
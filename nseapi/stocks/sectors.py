@@ -0,0 +1,130 @@
+"""Market-cap weighted sector performance.
+
+Ingestion calls ``refresh_sector_performance()`` once it has finished
+writing prices; the sector endpoints only read the persisted ``TopSector``
+rows. The aggregation runs as one SQL query: window functions partitioned
+by sector give every stock its sector's weighted change and stock count,
+and the rows are limited to each sector's top movers, so only
+``TOP_STOCKS`` rows per sector come back to Python.
+
+A stock's weight is its market cap, or ``current_price * 1M`` when the
+market cap is missing or zero. Sectors with fewer than
+``MIN_SECTOR_STOCKS`` priced stocks are left out.
+"""
+
+import logging
+
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Q, Sum, Value, Window
+from django.db.models.functions import Abs, Cast, Coalesce, NullIf, RowNumber, Trim
+
+from .models import Stock, TopSector
+from .snapshot import bump_data_version
+
+logger = logging.getLogger(__name__)
+
+MIN_SECTOR_STOCKS = 2
+# Movers kept per sector, largest absolute change first
+TOP_STOCKS = 5
+PRICE_WEIGHT = 1_000_000
+
+
+def _weight():
+    market_cap = NullIf(Cast('market_cap', FloatField()), Value(0.0))
+    return Coalesce(market_cap, Cast('current_price', FloatField()) * PRICE_WEIGHT)
+
+
+def compute_sector_performance():
+    """Aggregate weighted change, stock counts and top movers per sector.
+
+    Returns:
+        list: Sector dicts with ``name``, ``performance``, ``stocks_count``
+            and ``top_stocks`` (symbol, name, change_percentage), sorted by
+            absolute performance
+    """
+    by_sector = {'partition_by': [F('sector_name')]}
+    rows = Stock.objects.filter(
+        sector__isnull=False,
+        change_percentage__isnull=False,
+        current_price__gt=0
+    ).annotate(
+        sector_name=Trim('sector'),
+        weight=_weight(),
+    ).exclude(
+        Q(sector_name='') | Q(sector_name__iexact='unknown')
+    ).annotate(
+        total_weight=Window(Sum('weight'), **by_sector),
+        weighted_change=Window(Sum(Cast('change_percentage', FloatField()) * F('weight')), **by_sector),
+        sector_count=Window(Count('id'), **by_sector),
+        rank=Window(
+            RowNumber(),
+            order_by=[Abs('change_percentage').desc(), F('symbol').asc()],
+            **by_sector
+        ),
+    ).filter(
+        rank__lte=TOP_STOCKS
+    ).order_by('sector_name', 'rank').values_list(
+        'sector_name', 'symbol', 'name', 'change_percentage',
+        'total_weight', 'weighted_change', 'sector_count'
+    )
+
+    sectors = {}
+    for name, symbol, stock_name, change, total_weight, weighted_change, count in rows:
+        if count < MIN_SECTOR_STOCKS or not total_weight:
+            continue
+        sector = sectors.setdefault(name, {
+            'name': name,
+            'performance': round(weighted_change / total_weight, 2),
+            'stocks_count': count,
+            'top_stocks': [],
+        })
+        sector['top_stocks'].append({
+            'symbol': symbol,
+            'name': stock_name,
+            'change_percentage': float(change),
+        })
+    return sorted(sectors.values(), key=lambda s: abs(s['performance']), reverse=True)
+
+
+def refresh_sector_performance():
+    """Recompute sector performance and replace the stored TopSector rows.
+
+    Returns:
+        list: The computed sectors (see ``compute_sector_performance``)
+    """
+    sectors = compute_sector_performance()
+    rows = [
+        TopSector(
+            name=sector['name'],
+            performance=sector['performance'],
+            change_percentage=sector['performance'],
+            stocks_count=sector['stocks_count'],
+            top_stocks=sector['top_stocks'],
+        )
+        for sector in sectors
+    ]
+    with transaction.atomic():
+        TopSector.objects.exclude(name__in=[sector['name'] for sector in sectors]).delete()
+        TopSector.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['name'],
+            update_fields=['performance', 'change_percentage', 'stocks_count', 'top_stocks', 'last_updated'],
+        )
+    bump_data_version()
+    logger.info(f"Stored performance of {len(sectors)} sectors")
+    return sectors
+
+
+def stored_sectors(limit=None):
+    """Read the persisted sectors, largest absolute performance first.
+
+    Returns:
+        list: Sector dicts shaped like ``compute_sector_performance`` results
+    """
+    rows = TopSector.objects.order_by(Abs('performance').desc(), 'name').values(
+        'name', 'performance', 'stocks_count', 'top_stocks'
+    )
+    if limit is not None:
+        rows = rows[:limit]
+    return [{**row, 'performance': float(row['performance'])} for row in rows]
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Stock, TopSector, User, ChatMessage
+from .models import Stock, TopSector, User, ChatMessage, IngestionJob
 from decimal import Decimal
 
 class StockSerializer(serializers.ModelSerializer):
@@ -58,6 +58,46 @@ class TopSectorSerializer(serializers.ModelSerializer):
                     ret[field] = None
         return ret
 
+STOCK_DECIMAL_FIELDS = ['current_price', 'change_percentage', 'high_52w', 'low_52w', 'market_cap', 'pe_ratio']
+SECTOR_DECIMAL_FIELDS = ['performance', 'change_percentage']
+
+
+def stock_values(queryset):
+    """``values()`` queryset with the StockSerializer fields, in the same order."""
+    return queryset.values(*StockSerializer.Meta.fields)
+
+
+def typed_stocks(rows):
+    """Turn ``stock_values`` rows into StockSerializer output, in place.
+
+    The database already returns Decimals quantized to the field's decimal
+    places, so converting them straight to float gives the same numbers as
+    StockSerializer without formatting them as strings first.
+    """
+    for row in rows:
+        for field in STOCK_DECIMAL_FIELDS:
+            if row[field] is not None:
+                row[field] = float(row[field])
+    return rows
+
+
+def stock_rows(queryset):
+    """Fast equivalent of ``StockSerializer(queryset, many=True).data`` for read-only payloads."""
+    return typed_stocks(list(stock_values(queryset)))
+
+
+def sector_rows(queryset):
+    """Fast equivalent of ``TopSectorSerializer(queryset, many=True).data``."""
+    last_updated = serializers.DateTimeField()
+    rows = list(queryset.values(*TopSectorSerializer.Meta.fields))
+    for row in rows:
+        for field in SECTOR_DECIMAL_FIELDS:
+            if row[field] is not None:
+                row[field] = float(row[field])
+        row['last_updated'] = last_updated.to_representation(row['last_updated'])
+    return rows
+
+
 class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -68,4 +108,26 @@ class ChatMessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ChatMessage
         fields = ['id', 'user_id', 'username', 'message', 'timestamp']
-        read_only_fields = ['id', 'timestamp']
\ No newline at end of file
+        read_only_fields = ['id', 'timestamp']
+
+
+class IngestionJobSerializer(serializers.ModelSerializer):
+    """Status of a background job, with progress and timings."""
+    progress = serializers.SerializerMethodField()
+    timings = serializers.SerializerMethodField()
+
+    class Meta:
+        model = IngestionJob
+        fields = [
+            'id', 'kind', 'status', 'progress', 'message', 'error',
+            'created_at', 'started_at', 'finished_at', 'timings'
+        ]
+
+    def get_progress(self, obj):
+        percent = None
+        if obj.total:
+            percent = round(obj.processed * 100 / obj.total, 1)
+        return {'processed': obj.processed, 'total': obj.total, 'percent': percent}
+
+    def get_timings(self, obj):
+        return {'queued_seconds': obj.queued_seconds(), 'run_seconds': obj.run_seconds()}
@@ -1,13 +1,24 @@
-import yfinance as yf
-import pandas as pd
-from datetime import datetime, timedelta
-from .models import TopSector, Stock
+from django.conf import settings
+from django.utils import timezone
+from .models import Stock
+from .cache import QuoteCache
+from .freshness import fresh_fundamentals
+from .ingestion import CircuitOpenError, IngestionEngine, is_throttled, upstream_guard, upstream_limiter
+from .providers import get_provider
+from .heatmap import warm_heatmap
+from .history import bars_from_history, fetch_start, save_bars, stored_history
+from .metrics import compute_metrics, distance_from_high, metrics_by_symbol
+from .sectors import refresh_sector_performance
+from .snapshot import LISTINGS, bump_data_version
 import time
 
 class NseService:
-    def __init__(self):
-        # NSE stock symbols end with .NS
-        self.suffix = ".NS"
+    def __init__(self, provider=None):
+        # Upstream market data; the provider adds the .NS suffix for NSE stocks
+        self.provider = provider or get_provider()
+        # Quotes fetched during this service's refresh cycle, so each symbol
+        # is downloaded once no matter how many steps ask for it
+        self.quotes = QuoteCache(ttl=settings.QUOTE_CACHE_TTL, maxsize=settings.QUOTE_CACHE_SIZE)
         # Get list of NSE stocks - you might want to maintain a list of NSE symbols
         self.all_stocks = self._get_nse_symbols()
     
@@ -28,59 +39,162 @@ class NseService:
         }
     
     def get_stock_data(self, symbol, retries=3):
+        data = self.quotes.get(symbol)
+        if data is not None:
+            return data
+
+        stored = stored_history([symbol])
+        fundamentals = fresh_fundamentals([symbol]).get(symbol)
+        hist, fundamentals = self._download_stock_data(symbol, stored.get(symbol), retries, fundamentals)
+        if hist is None:
+            return None
+
+        results, bars = self._build_stock_data({symbol: (hist, fundamentals)}, stored)
+        save_bars(bars)
+        data = results.get(symbol)
+        if data:
+            self.quotes.set(symbol, data)
+        return data
+
+    def fetch_many(self, symbols):
+        """Fetch several symbols on the shared ingestion engine.
+
+        Symbols already in the quote cache are served from it, and stored
+        fundamentals are reused while they are within FUNDAMENTALS_TTL.
+        Stored history is read and new bars are saved on the calling thread,
+        so the engine's worker threads only talk to the upstream provider;
+        price metrics are then computed for all fetched symbols in one pass.
+
+        Returns:
+            dict: symbol -> stock data for every symbol that could be fetched
+        """
+        cached = {}
+        missing = []
+        for symbol in symbols:
+            data = self.quotes.get(symbol)
+            if data is not None:
+                cached[symbol] = data
+            else:
+                missing.append(symbol)
+        if not missing:
+            return cached
+
+        stored = stored_history(missing)
+        fundamentals = fresh_fundamentals(missing)
+        downloads = {}
+
+        def on_result(symbol, result):
+            if result[0] is not None:
+                downloads[symbol] = result
+
+        IngestionEngine(
+            lambda symbol: self._download_stock_data(
+                symbol, stored.get(symbol), fundamentals=fundamentals.get(symbol), token_taken=True
+            )
+        ).run(missing, on_result)
+
+        results, bars = self._build_stock_data(downloads, stored)
+        save_bars(bars)
+        for symbol, data in results.items():
+            self.quotes.set(symbol, data)
+            cached[symbol] = data
+        return cached
+
+    def _build_stock_data(self, downloads, stored):
+        """Turn downloaded histories into stock data with one vectorized metrics pass.
+
+        Args:
+            downloads (dict): symbol -> (history frame, fundamentals dict)
+            stored (dict): symbol -> StoredHistory
+
+        Returns:
+            tuple: (dict of symbol -> stock data, list of unsaved PriceBar objects)
+        """
+        metrics = metrics_by_symbol(
+            compute_metrics({symbol: hist for symbol, (hist, _) in downloads.items()}, stored)
+        )
+        results = {}
+        bars = []
+        for symbol, (hist, fundamentals) in downloads.items():
+            row = metrics.get(symbol)
+            if row is None:
+                print(f"⚠️ Warning: No closing prices for {symbol}")
+                continue
+            high_52w = row.get('high_52w', row['current_price'])
+            results[symbol] = {
+                'current_price': row['current_price'],
+                'high_52w': high_52w,
+                'low_52w': row.get('low_52w', row['current_price']),
+                'distance_from_high': distance_from_high(row['current_price'], high_52w),
+                'change_percentage': row['change_percentage'],
+                **fundamentals
+            }
+            bars.extend(bars_from_history(symbol, hist))
+        return results, bars
+
+    def _download_stock_data(self, symbol, stored=None, retries=3, fundamentals=None, token_taken=False):
+        """Download recent history and fundamentals for a symbol without touching the database.
+
+        ``fundamentals`` holds still-fresh stored values (see
+        ``freshness.fresh_fundamentals``); the ``info`` request is only made
+        when it is None. Price metrics are computed later, in bulk, by
+        ``_build_stock_data``. Only errors that are not throttling are
+        retried; throttling is left to the upstream guard.
+
+        Every provider call takes a token from the shared rate limiter.
+        ``token_taken`` means the caller (the ingestion engine) already took
+        the one for the first history request.
+
+        Returns:
+            tuple: (history frame, fundamentals dict), or (None, None) on failure
+        """
         attempt = 0
         backoff_time = 2
 
         while attempt < retries:
             try:
-                # Add .NS suffix for NSE stocks
-                ticker = yf.Ticker(f"{symbol}{self.suffix}")
-            
-                # Get current data
-                current_data = ticker.history(period='1d')
-                if current_data.empty:
-                  print(f"⚠️ Warning: No current data for {symbol}")
-                  return None
-            
-                # Get historical data for 52-week high/low
-                hist = ticker.history(period="1y")
+                if attempt or not token_taken:
+                    upstream_limiter.acquire_sync()
+                # Only fetch the sessions newer than the stored history;
+                # a full year is needed the first time a symbol is seen
+                hist = upstream_guard.call(self.provider.get_history, symbol, fetch_start(stored), block=False)
                 if hist.empty:
                     print(f"⚠️ Warning: No historical data for {symbol}")
-                    return None
+                    return None, None
 
-                # Calculate current price from the latest close
-                current_price = current_data['Close'].iloc[-1]
-            
-                # Calculate change percentage
-                prev_close = current_data['Close'].iloc[-2] if len(current_data) > 1 else hist['Close'].iloc[-2]
-                change_percentage = ((current_price - prev_close) / prev_close) * 100
-
-                return {
-                    'current_price': current_price,
-                    'high_52w': hist['High'].max(),
-                    'low_52w': hist['Low'].min(),
-                    'market_cap': ticker.info.get('marketCap', 0),
-                    'pe_ratio': ticker.info.get('trailingPE', 0),
-                    'sector': ticker.info.get('sector', 'Unknown'),
-                    'change_percentage': change_percentage,
-                    'name': ticker.info.get('longName', symbol)
-                }
+                if fundamentals is None:
+                    # A second upstream request, so it needs its own token
+                    upstream_limiter.acquire_sync()
+                    info = upstream_guard.call(self.provider.get_info, symbol, block=False)
+                    fundamentals = {
+                        'market_cap': info.get('marketCap', 0),
+                        'pe_ratio': info.get('trailingPE', 0),
+                        'sector': info.get('sector', 'Unknown'),
+                        'name': info.get('longName', symbol),
+                        'fundamentals_updated_at': timezone.now()
+                    }
+
+                return hist, fundamentals
 
+            except CircuitOpenError as e:
+                # The provider is throttling every caller; fail fast instead of queueing up
+                print(f"⛔ Skipping {symbol}: {e}")
+                return None, None
             except Exception as e:
                 print(f"🚨 Error fetching data for {symbol}: {e}")
+                if is_throttled(e):
+                    # The upstream guard has already lowered concurrency for every
+                    # caller; retrying here would only add to the throttled traffic
+                    return None, None
                 time.sleep(backoff_time)
                 attempt += 1
                 backoff_time *= 2
 
-        return None
+        return None, None
 
     def get_top_sectors(self, threshold=0.3):
         sectors = {}
-        for symbol in self.all_stocks:
-            data = self.get_stock_data(symbol)
-            if not data:
-                continue
-                
+        for symbol, data in self.fetch_many(self.all_stocks).items():
             sector = data['sector']
             if sector not in sectors:
                 sectors[sector] = {
@@ -103,28 +217,23 @@ class NseService:
             reverse=True
         )[:5]
 
-    def update_stock_data(self):
+    def update_stock_data(self, progress=None):
+        """Refresh the top sectors and their stocks.
+
+        Args:
+            progress (callable): Optional ``progress(processed, total, message)``
+                callback, called once the sectors are known and after each one
+        """
         print("Fetching Top Sectors...")
         top_sectors = self.get_top_sectors()
         print(f"Top Sectors: {top_sectors}")
+        if progress:
+            progress(0, len(top_sectors), "Fetched top sectors")
 
-        for sector, data in top_sectors:
+        for done, (sector, data) in enumerate(top_sectors, start=1):
             print(f"Updating sector: {sector} with {len(data['stocks'])} stocks")
             
-            sector_obj, _ = TopSector.objects.update_or_create(
-                name=sector,
-                defaults={
-                    'stocks_count': len(data['stocks']),
-                    'performance': data['performance']
-                }
-            )
-            
-            for symbol in data['stocks']:
-                time.sleep(1)  # Rate limiting
-                stock_data = self.get_stock_data(symbol)
-                
-                if not stock_data:
-                    continue
+            for symbol, stock_data in self.fetch_many(data['stocks']).items():
 
                 print(f"✅ Saving data for {symbol}")
                 
@@ -136,12 +245,33 @@ class NseService:
                         'current_price': stock_data['current_price'],
                         'high_52w': stock_data['high_52w'],
                         'low_52w': stock_data['low_52w'],
+                        'distance_from_high': stock_data['distance_from_high'],
                         'pe_ratio': stock_data['pe_ratio'],
                         'market_cap': stock_data['market_cap'],
-                        'change_percentage': stock_data['change_percentage']
+                        'change_percentage': stock_data['change_percentage'],
+                        'price_updated_at': timezone.now(),
+                        'fundamentals_updated_at': stock_data['fundamentals_updated_at']
                     }
                 )
 
+            if progress:
+                progress(done, len(top_sectors), f"Updated {sector}")
+
+        # Sector performance is recomputed from the stored prices; this bumps the market version
+        sectors = refresh_sector_performance()
+        print(f"Stored performance of {len(sectors)} sectors")
+        # Stocks may have been created or renamed
+        bump_data_version(LISTINGS)
+        # Jobs run in the web process, so viewers get the new heatmap from memory
+        tiles = warm_heatmap()
+        print(f"Laid out {len(tiles)} heatmap tiles")
+        stats = self.quotes.stats()
+        print(f"Quote cache: {stats['hits']} hits, {stats['misses']} misses, "
+              f"{stats['evictions']} evictions")
+        guard = upstream_guard.stats()
+        print(f"Upstream: concurrency {guard['concurrency']}/{guard['max_concurrency']}, "
+              f"{guard['throttled']} throttled, breaker {guard['breaker']}, "
+              f"{guard['rejections']} rejections")
         print("Stock data update complete!")
 
     def test_stock_data(self, symbol):
@@ -0,0 +1,203 @@
+"""Versioned in-memory market snapshot for the read endpoints.
+
+Market data only changes when ingestion writes it, so read endpoints serve
+views computed once per data version instead of querying and serializing
+every Stock row on each request. Writers call ``bump_data_version`` after
+changing stocks or sectors; the bump is a DB row, so web processes notice
+changes made by management commands and job workers too. Each process
+checks the version at most every ``settings.MARKET_SNAPSHOT_POLL_INTERVAL``
+seconds (one single-row query) and swaps in a fresh, empty snapshot when
+it has moved on; views are then rebuilt lazily on first use. Views that
+only depend on symbols and names (the search index) hang off the separate
+``LISTINGS`` version so price updates do not throw them away.
+
+Writes through the stocks API bump both versions themselves; writes that
+bypass ingestion and the API (e.g. the admin) show up after the next bump.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .models import DataVersion, Stock
+from .renderers import FastJSONRenderer
+from .serializers import stock_rows
+
+MARKET = 'market'
+# Symbols and company names; bumped by listing sync
+LISTINGS = 'listings'
+
+# Queries a read endpoint makes to check the version when its poll interval has passed
+VERSION_QUERIES = 1
+# Queries for the Last-Modified date, made once per data version
+VALIDATOR_QUERIES = 1
+
+
+def bump_data_version(name=MARKET):
+    """Advance the version of a dataset after writing to it.
+
+    Returns:
+        int: The new version
+    """
+    now = timezone.now()
+    if not DataVersion.objects.filter(name=name).update(version=F('version') + 1, updated_at=now):
+        try:
+            with transaction.atomic():
+                DataVersion.objects.create(name=name, version=1)
+        except IntegrityError:
+            # Created by a concurrent writer in the meantime
+            DataVersion.objects.filter(name=name).update(version=F('version') + 1, updated_at=now)
+    # Make this process pick up the change on its next read
+    _states.get(name, {})['checked_at'] = None
+    return current_version(name)
+
+
+def current_version(name=MARKET):
+    version = DataVersion.objects.filter(name=name).values_list('version', flat=True).first()
+    return version or 0
+
+
+class MarketSnapshot:
+    """Views of the market data at one version, each built at most once.
+
+    Snapshots are never mutated after a view is stored, so readers can use
+    them without locking; a newer version gets a new snapshot object.
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self.built_at = timezone.now()
+        self._views = {}
+        # Reentrant: a view may be built from other views of the same snapshot
+        self._lock = threading.RLock()
+
+    def view(self, name, build):
+        """Return the view called ``name``, building it with ``build()`` on first use."""
+        try:
+            return self._views[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._views:
+                self._views[name] = build()
+            return self._views[name]
+
+    def stocks(self):
+        """All Stock rows ordered by symbol, loaded with one query."""
+        return self.view('stocks', lambda: list(Stock.objects.order_by('symbol')))
+
+    def last_modified(self):
+        """Latest ``Stock.last_updated`` at this version, or None without stocks."""
+        return self.view('last_modified', lambda: Stock.objects.aggregate(latest=Max('last_updated'))['latest'])
+
+    def stock_rows(self):
+        """StockSerializer output for every stock ordered by symbol (see serializers.stock_rows)."""
+        return self.view('stock_rows', lambda: stock_rows(Stock.objects.order_by('symbol')))
+
+
+# Dataset name -> {'snapshot': MarketSnapshot, 'checked_at': monotonic time}
+_states = {}
+_state_lock = threading.Lock()
+
+
+def get_snapshot(name=MARKET):
+    """Return the snapshot for the current version of dataset ``name``."""
+    state = _states.get(name) or {}
+    snapshot, checked_at = state.get('snapshot'), state.get('checked_at')
+    now = time.monotonic()
+    if snapshot is not None and checked_at is not None \
+            and now - checked_at < settings.MARKET_SNAPSHOT_POLL_INTERVAL:
+        return snapshot
+
+    version = current_version(name)
+    with _state_lock:
+        state = _states.setdefault(name, {'snapshot': None, 'checked_at': None})
+        if state['snapshot'] is None or state['snapshot'].version != version:
+            state['snapshot'] = MarketSnapshot(version)
+        state['checked_at'] = now
+        return state['snapshot']
+
+
+def request_snapshot(request):
+    """Return the market snapshot for ``request``, looked up once per request.
+
+    Conditional views validate and build their response from the same
+    snapshot, so a version bump between the two cannot mismatch them.
+    """
+    market = getattr(request, '_market_snapshot', None)
+    if market is None:
+        market = request._market_snapshot = get_snapshot()
+    return market
+
+
+def market_conditional(extra=None):
+    """Decorator answering conditional GETs from the market snapshot.
+
+    The strong ETag is the data version plus a hash of the path, query
+    string, Accept and Accept-Encoding headers (each identifies a different
+    body, see stocks/encodings.py); the
+    Last-Modified date is the latest stock update. A client that is current
+    gets a 304 before the view runs, costing at most the version check.
+    Responses carry ``Cache-Control: no-cache`` so browsers revalidate on
+    every poll instead of guessing a freshness lifetime from Last-Modified.
+
+    Args:
+        extra (callable): Returns a string for request-time state that also
+            changes the body, such as the market status
+    """
+    def etag(request, *args, **kwargs):
+        key = '\n'.join([
+            request.path,
+            request.META.get('QUERY_STRING', ''),
+            request.META.get('HTTP_ACCEPT', ''),
+            request.META.get('HTTP_ACCEPT_ENCODING', ''),
+            extra() if extra else ''
+        ])
+        return f"{request_snapshot(request).version}-{hashlib.sha1(key.encode()).hexdigest()[:16]}"
+
+    def last_modified(request, *args, **kwargs):
+        return request_snapshot(request).last_modified()
+
+    def decorator(view):
+        conditional = condition(etag_func=etag, last_modified_func=last_modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional(request, *args, **kwargs)
+            patch_cache_control(response, no_cache=True)
+            return response
+        return wrapper
+
+    return decorator
+
+
+def reset():
+    """Drop the snapshots of this process (used by tests)."""
+    with _state_lock:
+        _states.clear()
+
+
+def drf_json(data):
+    """Serialize ``data`` exactly as a DRF ``Response`` would."""
+    return FastJSONRenderer().render(data)
+
+
+def django_json(data):
+    """Serialize ``data`` exactly as ``JsonResponse`` would."""
+    return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+
+def json_response(body):
+    """Return pre-serialized JSON bytes."""
+    return HttpResponse(body, content_type='application/json')
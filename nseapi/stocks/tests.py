@@ -1,3 +1,1134 @@
-from django.test import TestCase
+import gzip
+import math
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import pandas as pd
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+
+from . import dashboard, encodings, heatmap, jobs, snapshot, views
+from .cache import HttpCache, QuoteCache
+from .freshness import fresh_fundamentals, stale_fundamentals
+from .history import (
+    OVERLAP_DAYS, StoredHistory, bars_from_history, fetch_start, prune_bars, save_bars, stored_history, window_start
+)
+from .ingestion import (
+    AdaptiveConcurrency, CircuitBreaker, CircuitOpenError, IngestionEngine, TokenBucket, UpstreamGuard
+)
+from .journal import CLAIM_TIMEOUT, MAX_ATTEMPTS, RunJournal
+from .management.commands.run_scheduler import Command as SchedulerCommand
+from .management.commands.update_nse_data import Command as UpdateCommand
+from .metrics import compute_metrics, distance_from_high, metrics_by_symbol
+from .models import IngestionJob, IngestionRun, IngestionSymbol, PriceBar, Stock, TopSector, User, Watchlist
+from .providers import ProviderError, ThrottledError
+from .renderers import FastJSONRenderer
+from .search import SearchIndex
+from .sectors import compute_sector_performance, refresh_sector_performance
+from .serializers import StockSerializer, TopSectorSerializer, sector_rows, stock_rows
+from .services import NseService
+from .snapshot import current_version
+from .writers import StockBatchWriter, changed_update
+
+
+@override_settings(MARKET_SNAPSHOT_POLL_INTERVAL=0)
+class DashboardQueryBudgetTests(TestCase):
+    """The dashboard endpoints must stay within the budgets in stocks/dashboard.py.
+
+    Read endpoints serve from the market snapshot, so a cold request pays the
+    version check plus the build and a warm one only the version check.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        changes = [Decimal('2.50'), Decimal('1.25'), Decimal('-0.75'), Decimal('-3.00'), Decimal('0.00')]
+        for i in range(25):
+            Stock.objects.create(
+                symbol=f"SYM{i:02d}",
+                name=f"Company {i}",
+                sector='Technology' if i % 2 else 'Financials',
+                current_price=Decimal('100.00') + i,
+                change_percentage=changes[i % len(changes)],
+                high_52w=Decimal('150.00'),
+                low_52w=Decimal('50.00'),
+                market_cap=Decimal('1000000.00') * (i + 1) if i % 3 else None,
+                pe_ratio=Decimal('20.00')
+            )
+        TopSector.objects.create(name='Technology', performance=Decimal('1.20'), change_percentage=Decimal('1.20'), stocks_count=12)
+        TopSector.objects.create(name='Financials', performance=Decimal('-0.40'), change_percentage=Decimal('-0.40'), stocks_count=13)
+
+    def setUp(self):
+        snapshot.reset()
+
+    def test_market_breadth_is_one_query(self):
+        with self.assertNumQueries(dashboard.BREADTH_QUERIES):
+            breadth = dashboard.market_breadth()
+        self.assertEqual(breadth, {'total_stocks': 25, 'gainers_count': 10, 'losers_count': 10})
+
+    def test_viewset_dashboard_data(self):
+        with self.assertNumQueries(snapshot.VERSION_QUERIES + snapshot.VALIDATOR_QUERIES + dashboard.DASHBOARD_QUERIES):
+            response = self.client.get('/api/stocks/dashboard-data/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['stats']['total_stocks'], 25)
+        self.assertEqual(data['stats']['gainers_count'], 10)
+        self.assertEqual(data['stats']['losers_count'], 10)
+        self.assertEqual(len(data['top_gainers']), 5)
+        self.assertEqual(data['top_gainers'][0]['change_percentage'], 2.5)
+        self.assertEqual(data['top_losers'][0]['change_percentage'], -3.0)
+        self.assertEqual(data['most_active'][0]['symbol'], 'SYM23')
+        self.assertEqual([sector['name'] for sector in data['sector_performance']], ['Technology', 'Financials'])
+
+    def test_dashboard_data_api(self):
+        request = APIRequestFactory().get('/dashboard/')
+        with self.assertNumQueries(snapshot.VERSION_QUERIES + dashboard.BREADTH_QUERIES):
+            response = views.DashboardDataAPI.as_view()(request)
+        self.assertEqual(response.data['total_stocks'], 25)
+        self.assertEqual(response.data['gainers_count'], 10)
+        self.assertEqual(response.data['losers_count'], 10)
+
+    def test_function_dashboard_data(self):
+        request = RequestFactory().get('/dashboard/')
+        with self.assertNumQueries(snapshot.VERSION_QUERIES + dashboard.BREADTH_QUERIES):
+            response = views.dashboard_data(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertJSONEqual(response.content, {
+            'totalStocks': 25,
+            'marketStatus': 'Open' if views.is_market_open() else 'Closed',
+            'gainersCount': 10,
+            'losersCount': 10
+        })
+
+    def test_budget_does_not_grow_with_listing_size(self):
+        Stock.objects.bulk_create([
+            Stock(symbol=f"EXTRA{i:03d}", name=f"Extra {i}", change_percentage=Decimal('1.00'))
+            for i in range(200)
+        ])
+        snapshot.bump_data_version()
+        with self.assertNumQueries(snapshot.VERSION_QUERIES + snapshot.VALIDATOR_QUERIES + dashboard.DASHBOARD_QUERIES):
+            self.client.get('/api/stocks/dashboard-data/')
+
+    def test_warm_snapshot_only_checks_version(self):
+        self.client.get('/api/stocks/dashboard-data/')
+        with self.assertNumQueries(snapshot.VERSION_QUERIES):
+            response = self.client.get('/api/stocks/dashboard-data/')
+        self.assertEqual(response.json()['stats']['total_stocks'], 25)
+
+    def test_current_client_gets_not_modified(self):
+        response = self.client.get('/api/stocks/dashboard-data/')
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        with self.assertNumQueries(snapshot.VERSION_QUERIES):
+            response = self.client.get('/api/stocks/dashboard-data/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        snapshot.bump_data_version()
+        response = self.client.get('/api/stocks/dashboard-data/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_differs_per_representation(self):
+        first = self.client.get('/api/stocks/?page_size=10')
+        full = self.client.get('/api/stocks/?all=1')
+        self.assertNotEqual(first['ETag'], full['ETag'])
+        response = self.client.get('/api/stocks/?all=1', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/api/stocks/top_performers/')
+        self.assertEqual(
+            self.client.get('/api/stocks/top_performers/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304
+        )
+
+    def test_api_write_invalidates_the_etag(self):
+        response = self.client.get('/api/stocks/?all=1')
+        etag = response['ETag']
+        stock = Stock.objects.get(symbol='SYM00')
+        self.client.patch(f'/api/stocks/{stock.pk}/', {'current_price': '999.00'}, content_type='application/json')
+
+        response = self.client.get('/api/stocks/?all=1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()[0]['current_price'], 999.0)
+
+        self.client.delete(f'/api/stocks/{stock.pk}/')
+        self.assertEqual(len(self.client.get('/api/stocks/?all=1').json()), 24)
+
+    def test_snapshot_rebuilds_after_bump(self):
+        before = self.client.get('/api/stocks/all_stocks_az/?all=1').json()
+        self.assertEqual(len(before), 25)
+        Stock.objects.filter(symbol='SYM00').update(current_price=Decimal('999.00'))
+        self.assertEqual(self.client.get('/api/stocks/all_stocks_az/?all=1').json(), before)
+
+        snapshot.bump_data_version()
+        after = self.client.get('/api/stocks/all_stocks_az/?all=1').json()
+        self.assertEqual(after[0]['current_price'], 999.0)
+
+
+class FastSerializerTests(TestCase):
+    """The values() fast path and FastJSONRenderer must match DRF byte for byte."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Stock.objects.create(
+            symbol='ABC', name='Ábc Industries\u2028Limited', sector='Metal',
+            current_price=Decimal('1234.50'), change_percentage=Decimal('-0.05'),
+            high_52w=Decimal('1500.00'), low_52w=Decimal('900.10'),
+            market_cap=Decimal('987654321012.34'), pe_ratio=Decimal('18.20')
+        )
+        Stock.objects.create(symbol='NUL', name='No Prices Limited')
+        TopSector.objects.create(name='Metal', performance=Decimal('1.25'), change_percentage=Decimal('1.25'), stocks_count=1)
+
+    def test_stock_rows_match_serializer(self):
+        stocks = Stock.objects.order_by('symbol')
+        expected = JSONRenderer().render(StockSerializer(stocks, many=True).data)
+        self.assertEqual(FastJSONRenderer().render(stock_rows(stocks)), expected)
+
+    def test_sector_rows_match_serializer(self):
+        sectors = TopSector.objects.all()
+        expected = JSONRenderer().render(TopSectorSerializer(sectors, many=True).data)
+        self.assertEqual(FastJSONRenderer().render(sector_rows(sectors)), expected)
+
+
+class BulkEncodingTests(TestCase):
+    """Bulk endpoints negotiate columnar MessagePack and compression."""
+
+    url = '/api/stocks/all_stocks_az/?all=1'
+
+    @classmethod
+    def setUpTestData(cls):
+        Stock.objects.create(symbol='AAA', name='Aaa Limited', current_price=Decimal('10.50'))
+        Stock.objects.create(symbol='BBB', name='Bbb Limited', change_percentage=Decimal('-1.25'))
+
+    def setUp(self):
+        snapshot.reset()
+
+    def test_gzip_json(self):
+        plain = self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertNotEqual(response['ETag'], plain['ETag'])
+
+    def test_brotli_preferred(self):
+        self.assertIsNotNone(encodings.brotli, 'brotli from requirements.txt is not installed')
+        plain = self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(encodings.brotli.decompress(response.content), plain.content)
+
+    def test_accept_q_values_pick_the_format(self):
+        cases = [
+            ('application/msgpack;q=0, application/json', 'application/json'),
+            ('application/json, application/msgpack;q=0.9', 'application/json'),
+            ('application/json;q=0.5, application/msgpack', 'application/msgpack'),
+            ('text/html, application/x-msgpack', 'application/msgpack'),
+        ]
+        for accept, content_type in cases:
+            with self.subTest(accept=accept):
+                response = self.client.get(self.url, HTTP_ACCEPT=accept)
+                self.assertEqual(response['Content-Type'], content_type)
+
+    def test_refused_coding_is_not_used(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_columnar_msgpack(self):
+        # msgpack is in requirements.txt, so a missing install is a failure, not a skip
+        self.assertIsNotNone(encodings.msgpack, 'msgpack from requirements.txt is not installed')
+        response = self.client.get(self.url, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        data = encodings.msgpack.unpackb(response.content)
+        self.assertEqual(data['symbol'], ['AAA', 'BBB'])
+        self.assertEqual(data['current_price'], [10.5, None])
+        self.assertEqual(data['change_percentage'], [None, -1.25])
+
+
+class StockCursorPaginationTests(TestCase):
+    """Listing endpoints page through the universe by symbol."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Stock.objects.bulk_create([Stock(symbol=f"S{i:03d}", name=f"Stock {i}") for i in range(25)])
+
+    def walk(self, url):
+        symbols = []
+        while url:
+            data = self.client.get(url).json()
+            symbols.extend(stock['symbol'] for stock in data['results'])
+            url = data['next']
+        return symbols
+
+    def test_pages_cover_universe_in_order(self):
+        expected = [f"S{i:03d}" for i in range(25)]
+        self.assertEqual(self.walk('/api/stocks/?page_size=10'), expected)
+        self.assertEqual(self.walk('/api/stocks/all_stocks_az/?page_size=7'), expected)
+
+    def test_cursor_is_stable_when_rows_are_added(self):
+        data = self.client.get('/api/stocks/?page_size=10').json()
+        Stock.objects.create(symbol='S000A', name='Inserted before the cursor')
+        following = self.client.get(data['next']).json()
+        self.assertEqual(following['results'][0]['symbol'], 'S010')
+
+    def test_full_dump_keeps_list_shape(self):
+        data = self.client.get('/api/stocks/?all=1').json()
+        self.assertIsInstance(data, list)
+        self.assertEqual(len(data), 25)
+
+
+class HistoryStoreTests(TestCase):
+    """Stored bars give the 52-week extremes and where the next fetch starts."""
+
+    def setUp(self):
+        self.today = timezone.localdate()
+
+    def history(self, days_ago, closes, volumes=None):
+        index = pd.DatetimeIndex([pd.Timestamp(self.today - timedelta(days=days)) for days in days_ago])
+        return pd.DataFrame({
+            'Open': closes,
+            'High': [close + 1 for close in closes],
+            'Low': [close - 1 for close in closes],
+            'Close': closes,
+            'Volume': volumes or [1000.0] * len(closes),
+        }, index=index)
+
+    def test_bars_skip_sessions_without_a_close(self):
+        bars = bars_from_history('TCS', self.history([2, 1, 0], [100.456, math.nan, 101.0], [500.0, 600.0, math.nan]))
+        self.assertEqual([bar.close for bar in bars], [100.46, 101.0])
+        self.assertEqual([bar.volume for bar in bars], [500, None])
+        self.assertEqual(bars_from_history('TCS', None), [])
+
+    def test_saving_a_stored_session_overwrites_it(self):
+        save_bars(bars_from_history('TCS', self.history([1, 0], [100.0, 101.0])))
+        # The last session was still trading when it was stored
+        save_bars(bars_from_history('TCS', self.history([0], [105.0])))
+        self.assertEqual(PriceBar.objects.filter(symbol='TCS').count(), 2)
+        self.assertEqual(PriceBar.objects.get(symbol='TCS', date=self.today).close, Decimal('105.00'))
+
+    def test_stored_history_covers_the_window_only(self):
+        old = (self.today - window_start(self.today)).days + 10
+        save_bars(bars_from_history('TCS', self.history([old, 30, 3], [900.0, 120.0, 100.0])))
+        stored = stored_history(['TCS', 'INFY'])
+        self.assertEqual(list(stored), ['TCS'])
+        self.assertEqual(stored['TCS'].last_date, self.today - timedelta(days=3))
+        self.assertEqual((stored['TCS'].high_52w, stored['TCS'].low_52w), (Decimal('121.00'), Decimal('99.00')))
+
+        # Only recent sessions are fetched, with some overlap; a full year without bars
+        self.assertEqual(fetch_start(stored['TCS']), self.today - timedelta(days=3 + OVERLAP_DAYS))
+        self.assertIsNone(fetch_start(stored.get('INFY')))
+
+        self.assertEqual(prune_bars(), 1)
+        self.assertEqual(PriceBar.objects.filter(symbol='TCS').count(), 2)
+
+
+class PriceMetricsTests(SimpleTestCase):
+    """Vectorized metrics handle gaps, short histories and stored extremes."""
+
+    def history(self, closes, start='2024-01-01', tz=None):
+        index = pd.date_range(start, periods=len(closes), freq='D', tz=tz)
+        return pd.DataFrame({
+            'High': [close + 1 if close == close else math.nan for close in closes],
+            'Low': [close - 1 if close == close else math.nan for close in closes],
+            'Close': closes,
+            'Volume': [1000.0] * len(closes),
+        }, index=index)
+
+    def test_trailing_nan_closes_are_skipped(self):
+        metrics = metrics_by_symbol(compute_metrics({'TCS': self.history([100.0, 110.0, math.nan])}))
+        self.assertEqual(metrics['TCS']['current_price'], 110.0)
+        self.assertEqual(metrics['TCS']['previous_close'], 100.0)
+        self.assertEqual(metrics['TCS']['change_percentage'], 10.0)
+        self.assertEqual((metrics['TCS']['high_52w'], metrics['TCS']['low_52w']), (111.0, 99.0))
+
+    def test_single_bar_has_no_change(self):
+        metrics = metrics_by_symbol(compute_metrics({'TCS': self.history([100.0])}))
+        self.assertEqual(metrics['TCS']['previous_close'], 100.0)
+        self.assertEqual(metrics['TCS']['change_percentage'], 0.0)
+
+    def test_symbols_without_closes_are_left_out(self):
+        metrics = compute_metrics({
+            'TCS': self.history([100.0, 101.0]),
+            'EMPTY': self.history([]),
+            'GAPS': self.history([math.nan, math.nan]),
+            'NONE': None,
+        })
+        self.assertEqual(list(metrics.index), ['TCS'])
+        self.assertTrue(compute_metrics({}).empty)
+
+    def test_tz_aware_histories_are_aligned(self):
+        metrics = metrics_by_symbol(compute_metrics({
+            'TCS': self.history([100.0, 102.0], tz='Asia/Kolkata'),
+            'INFY': self.history([50.0, 49.0, 48.0], start='2023-12-31', tz='Asia/Kolkata'),
+        }))
+        self.assertEqual(metrics['TCS']['change_percentage'], 2.0)
+        self.assertEqual(metrics['INFY']['current_price'], 48.0)
+        self.assertEqual(metrics['INFY']['change_percentage'], -2.04)
+
+    def test_stored_extremes_are_merged(self):
+        stored = {'TCS': StoredHistory(None, Decimal('150.00'), Decimal('80.50'))}
+        metrics = metrics_by_symbol(compute_metrics({'TCS': self.history([100.0, 101.0])}, stored))
+        self.assertEqual((metrics['TCS']['high_52w'], metrics['TCS']['low_52w']), (150.0, 80.5))
+
+        # Fetched bars beyond the stored range win
+        stored = {'TCS': StoredHistory(None, Decimal('101.00'), Decimal('100.50'))}
+        metrics = metrics_by_symbol(compute_metrics({'TCS': self.history([100.0, 105.0])}, stored))
+        self.assertEqual((metrics['TCS']['high_52w'], metrics['TCS']['low_52w']), (106.0, 99.0))
+
+
+class FilteredStocksTests(TestCase):
+    """The 52-week-high screen runs on the indexed distance_from_high column."""
+
+    @classmethod
+    def setUpTestData(cls):
+        rows = [
+            ('AAA', Decimal('95.00'), Decimal('100.00')),
+            ('BBB', Decimal('99.00'), Decimal('100.00')),
+            ('CCC', Decimal('60.00'), Decimal('100.00')),
+            ('DDD', None, Decimal('100.00')),
+            ('EEE', Decimal('50.00'), None),
+        ]
+        for symbol, price, high in rows:
+            Stock.objects.create(
+                symbol=symbol,
+                name=symbol,
+                sector='Energy' if symbol == 'BBB' else 'Metal',
+                current_price=price,
+                high_52w=high,
+                distance_from_high=distance_from_high(price, high)
+            )
+
+    def test_threshold_excludes_missing_prices(self):
+        response = self.client.get('/api/stocks/filtered_stocks/?threshold=0.1')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual([stock['symbol'] for stock in data['results']], ['AAA', 'BBB'])
+
+    def test_proximity_sort_and_pages(self):
+        response = self.client.get('/api/stocks/filtered_stocks/?threshold=0.5&sort=proximity&page_size=2')
+        data = response.json()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual([stock['symbol'] for stock in data['results']], ['BBB', 'AAA'])
+        self.assertIsNotNone(data['next'])
+
+    def test_sector_filter(self):
+        data = self.client.get('/api/stocks/filtered_stocks/?threshold=0.5&sectors=Metal').json()
+        self.assertEqual([stock['symbol'] for stock in data['results']], ['AAA', 'CCC'])
+
+
+@override_settings(MARKET_SNAPSHOT_POLL_INTERVAL=0)
+class SectorPerformanceTests(TestCase):
+    """Ingestion stores sector performance; the sector endpoints only read it."""
+
+    @classmethod
+    def setUpTestData(cls):
+        rows = [
+            # Weights: market cap, or price * 1M when it is missing or zero
+            ('AAA', 'Energy', Decimal('10.00'), Decimal('3000000.00'), Decimal('2.00')),
+            ('BBB', 'Energy', Decimal('1.00'), None, Decimal('-2.00')),
+            ('CCC', ' Energy ', Decimal('2.00'), Decimal('0.00'), Decimal('1.00')),
+            ('DDD', 'IT', Decimal('5.00'), Decimal('1000000.00'), Decimal('-3.00')),
+            ('EEE', 'IT', Decimal('5.00'), Decimal('1000000.00'), Decimal('-3.00')),
+            ('FFF', 'Solo', Decimal('5.00'), Decimal('1000000.00'), Decimal('9.00')),
+            ('GGG', 'unknown', Decimal('5.00'), Decimal('1000000.00'), Decimal('9.00')),
+            ('HHH', 'unknown', Decimal('5.00'), Decimal('1000000.00'), Decimal('9.00')),
+            ('III', 'Energy', None, None, Decimal('9.00')),
+        ]
+        for symbol, sector, price, market_cap, change in rows:
+            Stock.objects.create(
+                symbol=symbol,
+                name=symbol,
+                sector=sector,
+                current_price=price,
+                market_cap=market_cap,
+                change_percentage=change
+            )
+
+    def setUp(self):
+        snapshot.reset()
+
+    def test_weighted_performance_in_one_query(self):
+        with self.assertNumQueries(1):
+            sectors = compute_sector_performance()
+        self.assertEqual(
+            [(sector['name'], sector['performance'], sector['stocks_count']) for sector in sectors],
+            [('IT', -3.0, 2), ('Energy', 1.0, 3)]
+        )
+        self.assertEqual([stock['symbol'] for stock in sectors[1]['top_stocks']], ['AAA', 'BBB', 'CCC'])
+
+    def test_refresh_replaces_stored_sectors(self):
+        TopSector.objects.create(name='Stale', performance=Decimal('5.00'), stocks_count=4)
+        refresh_sector_performance()
+        stored = {sector.name: sector for sector in TopSector.objects.all()}
+        self.assertEqual(set(stored), {'IT', 'Energy'})
+        self.assertEqual(stored['Energy'].change_percentage, Decimal('1.00'))
+        self.assertEqual(stored['Energy'].top_stocks[0], {'symbol': 'AAA', 'name': 'AAA', 'change_percentage': 2.0})
+
+    def test_sector_endpoints_are_read_only(self):
+        refresh_sector_performance()
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get('/api/stocks/sectors/').json()
+            self.client.get('/api/sectors/')
+        self.assertEqual(data['total_sectors'], 2)
+        self.assertEqual(data['sectors'][0]['name'], 'IT')
+        writes = [query['sql'] for query in queries if not query['sql'].lstrip().upper().startswith('SELECT')]
+        self.assertEqual(writes, [])
+
+
+@override_settings(MARKET_SNAPSHOT_POLL_INTERVAL=0)
+class HeatmapTests(TestCase):
+    """The heatmap is a treemap laid out on the server once per data version."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(12):
+            Stock.objects.create(
+                symbol=f"H{i:02d}",
+                name=f"Heat {i}",
+                sector=['Energy', 'IT', None][i % 3],
+                current_price=Decimal('10.00') + i,
+                market_cap=Decimal('1000000.00') * (i + 1) if i % 4 else None,
+                change_percentage=Decimal('1.50') if i % 2 else None
+            )
+        Stock.objects.create(symbol='NOPRICE', name='No Price', sector='Energy')
+        cls.user = User.objects.create_user(username='viewer', password='secret')
+
+    def setUp(self):
+        snapshot.reset()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_squarify_fills_the_rectangle(self):
+        rects = heatmap.squarify([6, 6, 4, 3, 2, 2, 1], 0, 0, 6, 4)
+        self.assertEqual(len(rects), 7)
+        self.assertAlmostEqual(sum(w * h for _, _, w, h in rects), 24)
+        for x, y, w, h in rects:
+            self.assertTrue(x >= 0 and y >= 0 and x + w <= 6 + 1e-9 and y + h <= 4 + 1e-9)
+        # First row of the worked example in the squarified treemap paper
+        self.assertEqual([round(value, 6) for value in rects[0]], [0, 0, 3, 2])
+
+    def test_tiles_are_sized_by_weight_and_grouped_by_sector(self):
+        tiles = heatmap.build_heatmap(snapshot.get_snapshot().stock_rows())
+        self.assertEqual(len(tiles), 12)
+        self.assertNotIn('NOPRICE', [tile['symbol'] for tile in tiles])
+        self.assertAlmostEqual(sum(tile['w'] * tile['h'] for tile in tiles), 1, places=3)
+        sectors = [tile['sector'] for tile in tiles]
+        self.assertEqual(sectors, sorted(sectors, key=sectors.index))
+        self.assertIn(heatmap.UNKNOWN_SECTOR, sectors)
+        by_symbol = {tile['symbol']: tile for tile in tiles}
+        self.assertIsNone(by_symbol['H00']['percent_change'])
+        # H07 (8M market cap) gets four times the area of H01 (2M) in the same sector
+        area = lambda symbol: by_symbol[symbol]['w'] * by_symbol[symbol]['h']
+        self.assertAlmostEqual(area('H07') / area('H01'), 4, places=2)
+
+    def test_filters_are_cached_per_version(self):
+        with self.assertNumQueries(snapshot.VERSION_QUERIES + snapshot.VALIDATOR_QUERIES + 1):
+            data = self.client.get('/api/stocks/heatmap/?sectors=IT&size=large').json()
+        self.assertEqual({tile['sector'] for tile in data}, {'IT'})
+        self.assertAlmostEqual(sum(tile['w'] * tile['h'] for tile in data), 1, places=3)
+        with self.assertNumQueries(snapshot.VERSION_QUERIES):
+            self.client.get('/api/stocks/heatmap/?sectors=IT&size=large')
+        response = self.client.get('/api/stocks/heatmap/?size=huge')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/stocks/heatmap/?sectors=IT,Nope')
+        self.assertEqual(response.status_code, 400)
+
+    def test_filtered_views_are_bounded(self):
+        market = snapshot.get_snapshot()
+        self.assertEqual(
+            heatmap.parse_filters({'sectors': ' IT,Energy,IT'}, heatmap.known_sectors(market)),
+            (('Energy', 'IT'), None)
+        )
+        with mock.patch.object(heatmap, 'MAX_FILTERED_VIEWS', 1):
+            self.assertEqual(len(self.client.get('/api/stocks/heatmap/?sectors=IT').json()), 4)
+            # Over the cap: still served, laid out per request
+            self.assertEqual(len(self.client.get('/api/stocks/heatmap/?sectors=Energy').json()), 4)
+            self.assertTrue(heatmap.cacheable(market, ('IT',)))
+            self.assertFalse(heatmap.cacheable(market, ('Energy',)))
+            self.assertTrue(heatmap.cacheable(market))
+
+    def test_refresh_job_warms_the_layout(self):
+        # Jobs run in the web process, so its snapshot gets the new layout
+        with mock.patch('stocks.services.get_provider'), \
+                mock.patch.object(NseService, 'get_top_sectors', return_value=[]):
+            jobs.run_nse_update(IngestionJob(kind='nse_update'), progress=None)
+        with self.assertNumQueries(snapshot.VERSION_QUERIES):
+            response = self.client.get('/api/stocks/heatmap/')
+        self.assertEqual(len(response.json()), 12)
+
+
+class SearchIndexTests(TestCase):
+    """Autocomplete ranking and rebuilds of the in-memory search index."""
+
+    index = SearchIndex([
+        ('TCS', 'Tata Consultancy Services Limited', 'Information Technology'),
+        ('TATAMOTORS', 'Tata Motors Limited', 'Automobile'),
+        ('INFY', 'Infosys Limited', 'Information Technology'),
+        ('WSTCSTPAPR', 'West Coast Paper Mills Limited', 'Paper'),
+        ('HDFCBANK', 'HDFC Bank Limited', 'Financials'),
+    ])
+
+    def search(self, query, limit=10):
+        results, _ = self.index.search(query, limit)
+        return [(result['symbol'], result['match']) for result in results]
+
+    def test_ranking_tiers(self):
+        self.assertEqual(self.search('tcs'), [('TCS', 'exact'), ('WSTCSTPAPR', 'substring')])
+        self.assertEqual(self.search('tata', limit=2), [('TATAMOTORS', 'prefix'), ('TCS', 'prefix')])
+        self.assertEqual(self.search('motors'), [('TATAMOTORS', 'prefix')])
+        self.assertEqual(self.search('hdfc bank'), [('HDFCBANK', 'exact')])
+
+    def test_fuzzy_matches_typos(self):
+        self.assertEqual(self.search('infosis')[0], ('INFY', 'fuzzy'))
+        self.assertEqual(self.search('tata moters')[0], ('TATAMOTORS', 'fuzzy'))
+        self.assertEqual(self.search('zzzz'), [])
+        self.assertEqual(self.index.stats()['stocks'], 5)
+
+    def test_punctuated_symbols_match_exactly(self):
+        index = SearchIndex([
+            ('M&M', 'Mahindra & Mahindra Limited', 'Automobile'),
+            ('MMFL', 'MM Forgings Limited', 'Automobile'),
+            ('MMTC', 'MMTC Limited', 'Trading'),
+            ('BAJAJ-AUTO', 'Bajaj Auto Limited', 'Automobile'),
+            ('BAJAJFINSV', 'Bajaj Finserv Limited', 'Financials'),
+        ])
+        results = [(result['symbol'], result['match']) for result in index.search('M&M')[0]]
+        self.assertEqual(results[0], ('M&M', 'exact'))
+        self.assertEqual([symbol for symbol, match in results[1:]], ['MMFL', 'MMTC'])
+        results = index.search('bajaj-auto')[0]
+        self.assertEqual((results[0]['symbol'], results[0]['match']), ('BAJAJ-AUTO', 'exact'))
+
+    @override_settings(MARKET_SNAPSHOT_POLL_INTERVAL=0)
+    def test_endpoint_rebuilds_after_listing_sync(self):
+        snapshot.reset()
+        Stock.objects.create(symbol='TCS', name='Tata Consultancy Services Limited')
+        self.assertEqual(self.client.get('/api/stocks/autocomplete/?q=wipro').json()['results'], [])
+
+        Stock.objects.create(symbol='WIPRO', name='Wipro Limited')
+        snapshot.bump_data_version(snapshot.LISTINGS)
+        data = self.client.get('/api/stocks/autocomplete/?q=wipro').json()
+        self.assertEqual([result['symbol'] for result in data['results']], ['WIPRO'])
+        self.assertIn('took_us', data)
+
+
+class StockBatchWriterTests(TestCase):
+    """Fetched values equal to the stored ones are not written."""
+
+    def setUp(self):
+        self.stock = Stock.objects.create(
+            symbol='TCS', name='Tata Consultancy Services', current_price=Decimal('3500.10'),
+            pe_ratio=Decimal('28.40')
+        )
+        self.stored = {'current_price': Decimal('3500.10'), 'pe_ratio': Decimal('28.40')}
+
+    def test_unchanged_floats_are_not_an_update(self):
+        now = timezone.now()
+        self.assertIsNone(changed_update(self.stored, {'current_price': 3500.1, 'pe_ratio': 28.4000001}))
+        # Rechecked values only move their check timestamps
+        self.assertEqual(
+            changed_update(self.stored, {'current_price': 3500.1, 'price_updated_at': now}),
+            {'price_updated_at': now}
+        )
+        self.assertEqual(
+            changed_update(self.stored, {'pe_ratio': 28.4, 'fundamentals_updated_at': now}),
+            {'fundamentals_updated_at': now}
+        )
+
+    def test_changed_field_returns_the_whole_update(self):
+        update_data = {'current_price': 3512.0, 'pe_ratio': 28.4, 'price_updated_at': timezone.now()}
+        self.assertEqual(changed_update(self.stored, update_data), update_data)
+
+    def test_unchanged_rows_only_move_their_check_timestamp(self):
+        version = current_version()
+        last_updated = self.stock.last_updated
+        checked_at = timezone.now()
+        writer = StockBatchWriter()
+        writer._flush({'TCS': {'current_price': 3500.1, 'price_updated_at': checked_at}}, [])
+        self.assertEqual((writer.rows_written, writer.rows_skipped, writer.rows_changed), (1, 1, 0))
+        self.assertEqual(current_version(), version)
+        stock = Stock.objects.get(pk=self.stock.pk)
+        self.assertEqual(stock.price_updated_at, checked_at)
+        self.assertEqual(stock.last_updated, last_updated)
+
+        writer._flush({'TCS': {'current_price': 3512.0, 'price_updated_at': timezone.now()}}, [])
+        self.assertEqual((writer.rows_written, writer.rows_changed), (2, 1))
+        self.assertGreater(current_version(), version)
+        self.assertEqual(Stock.objects.get(pk=self.stock.pk).current_price, Decimal('3512.00'))
+
+
+@override_settings(JOB_RUN_IN_PROCESS=False)
+class NseUpdateJobTests(TestCase):
+    """Refreshes are queued as jobs by staff users, and a pending job is reused."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(
+            username='operator', email='operator@example.com', password='secret', is_staff=True
+        )
+        cls.user = User.objects.create_user(username='viewer', email='viewer@example.com', password='secret')
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_only_staff_can_start_or_poll_an_update(self):
+        job = IngestionJob.objects.create(kind='nse_update')
+        self.assertEqual(self.client.post('/api/stocks/update/').status_code, 401)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.post('/api/stocks/update/').status_code, 403)
+        self.assertEqual(self.client.get(f'/api/jobs/{job.pk}/').status_code, 403)
+
+    def test_update_is_queued_once(self):
+        self.client.force_authenticate(self.staff)
+        first = self.client.post('/api/stocks/update/')
+        self.assertEqual(first.status_code, 202)
+        self.assertTrue(first.json()['created'])
+        self.assertEqual(first.json()['status'], IngestionJob.STATUS_QUEUED)
+
+        second = self.client.post('/api/stocks/update/')
+        self.assertEqual(second.status_code, 202)
+        self.assertFalse(second.json()['created'])
+        self.assertEqual(second.json()['job_id'], first.json()['job_id'])
+        self.assertEqual(IngestionJob.objects.count(), 1)
+
+    def test_status_reports_progress(self):
+        self.client.force_authenticate(self.staff)
+        job_id = self.client.post('/api/stocks/update/').json()['job_id']
+        IngestionJob.objects.filter(pk=job_id).update(
+            status=IngestionJob.STATUS_RUNNING, processed=50, total=200, started_at=timezone.now()
+        )
+        data = self.client.get(f'/api/jobs/{job_id}/').json()
+        self.assertEqual(data['status'], IngestionJob.STATUS_RUNNING)
+        self.assertEqual(data['progress']['processed'], 50)
+        self.assertEqual(data['progress']['percent'], 25.0)
+        self.assertEqual(self.client.get(f'/api/jobs/{job_id + 1}/').status_code, 404)
+
+
+class HttpCacheTests(TestCase):
+    """Validators are only stored once the caller commits the download."""
+
+    url = 'https://example.com/EQUITY_L.csv'
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.cache = HttpCache(self.directory.name)
+
+    def upstream(self, request_headers):
+        # Answers 304 to a matching If-None-Match, like the NSE archive
+        if request_headers.get('If-None-Match') == '"v1"':
+            return mock.Mock(status_code=304)
+        return mock.Mock(status_code=200, content=b'SYMBOL\nTCS\n', headers={'ETag': '"v1"'})
+
+    def get(self):
+        with mock.patch('stocks.cache.requests.get') as get:
+            get.side_effect = lambda url, headers, timeout: self.upstream(headers)
+            return self.cache.get(self.url), get.call_args.kwargs['headers']
+
+    def test_failed_sync_downloads_again(self):
+        first, _ = self.get()
+        self.assertFalse(first.not_modified)
+        # The sync failed, so nothing was committed
+        second, headers = self.get()
+        self.assertNotIn('If-None-Match', headers)
+        self.assertFalse(second.not_modified)
+
+    def test_committed_download_is_revalidated(self):
+        first, _ = self.get()
+        self.cache.commit(self.url, first)
+        second, headers = self.get()
+        self.assertEqual(headers['If-None-Match'], '"v1"')
+        self.assertTrue(second.not_modified)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second.sha256, first.sha256)
+
+
+class RunJournalTests(TestCase):
+    """Symbols of a run are claimed once and picked up again on resume."""
+
+    symbols = ['AAA', 'BBB', 'CCC', 'DDD', 'EEE']
+
+    def setUp(self):
+        self.journal = RunJournal.start(self.symbols, provider='local')
+
+    def status(self, symbol):
+        return self.journal.run.symbols.get(symbol=symbol).status
+
+    def test_symbols_are_claimed_once(self):
+        first = self.journal.claim(3)
+        second = RunJournal(self.journal.run).claim(10)
+        self.assertEqual(len(first), 3)
+        self.assertEqual(sorted(first + second), self.symbols)
+        self.assertEqual(RunJournal(self.journal.run).claim(10), [])
+
+    def test_outcomes_are_flushed_and_run_finishes(self):
+        claimed = self.journal.claim(5)
+        self.journal.mark_done(claimed[:4])
+        self.journal.mark_failed(claimed[4:], ValueError('boom'))
+        counts = self.journal.finish()
+        self.assertEqual(counts, {IngestionSymbol.STATUS_DONE: 4, IngestionSymbol.STATUS_FAILED: 1})
+        self.assertEqual(self.journal.run.status, IngestionRun.STATUS_FAILED)
+
+        # The failed symbol has attempts left, so resume queues it again
+        resumed = RunJournal.resume(self.journal.run.pk)
+        self.assertEqual(resumed.claim(5), claimed[4:])
+
+    def test_failed_symbols_stop_after_max_attempts(self):
+        self.journal.run.symbols.filter(symbol='AAA').update(
+            status=IngestionSymbol.STATUS_FAILED, attempts=MAX_ATTEMPTS
+        )
+        RunJournal.resume(self.journal.run.pk)
+        self.assertEqual(self.status('AAA'), IngestionSymbol.STATUS_FAILED)
+
+    def test_stale_claims_are_taken_over(self):
+        self.journal.claim(2)
+        other = RunJournal(self.journal.run)
+        self.assertEqual(len(other.claim(5)), 3)
+        self.journal.run.symbols.update(updated_at=timezone.now() - CLAIM_TIMEOUT * 2)
+        self.assertEqual(len(RunJournal(self.journal.run).claim(5)), 5)
+
+    def test_resuming_a_crashed_run_releases_its_claims(self):
+        crashed = self.journal.claim(2)
+        # Without knowing the run is dead its claims are left alone
+        self.assertNotIn(crashed[0], RunJournal.resume().claim(5))
+
+        journal = RunJournal.start(self.symbols)
+        crashed = journal.claim(2)
+        resumed = RunJournal.resume(journal.run.pk, release_claims=True)
+        self.assertEqual(sorted(resumed.claim(5)), self.symbols)
+        self.assertEqual(journal.run.symbols.filter(claimed_by=journal.worker).count(), 0)
+
+
+class UpstreamGuardTests(SimpleTestCase):
+    """Throttling lowers concurrency for every worker; persistent throttling opens the breaker."""
+
+    def test_throttle_halves_the_limit_once_per_burst(self):
+        concurrency = AdaptiveConcurrency(8)
+        tokens = [concurrency.acquire() for _ in range(4)]
+        for token in tokens:
+            concurrency.release(token, throttled=True)
+        # Requests already in flight when the limit was cut do not cut it again
+        self.assertEqual(concurrency.limit, 4)
+        self.assertEqual(concurrency.decreases, 1)
+        concurrency.release(concurrency.acquire(), throttled=True)
+        self.assertEqual(concurrency.limit, 2)
+
+    def test_success_recovers_additively_up_to_the_maximum(self):
+        concurrency = AdaptiveConcurrency(4, minimum=2)
+        concurrency.release(concurrency.acquire(), throttled=True)
+        concurrency.release(concurrency.acquire(), throttled=True)
+        self.assertTrue(concurrency.at_minimum())
+        concurrency.release(concurrency.acquire())
+        self.assertEqual(concurrency.limit, 2.5)
+        for _ in range(20):
+            concurrency.release(concurrency.acquire())
+        self.assertEqual(concurrency.limit, 4)
+
+    def test_breaker_opens_then_probes_half_open(self):
+        breaker = CircuitBreaker(threshold=2, reset_timeout=30)
+        with mock.patch('stocks.ingestion.time.monotonic', return_value=100.0):
+            breaker.record_failure()
+            self.assertTrue(breaker.allow())
+            breaker.record_failure()
+            self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+            self.assertFalse(breaker.allow())
+            self.assertEqual(breaker.retry_after(), 30)
+        with mock.patch('stocks.ingestion.time.monotonic', return_value=131.0):
+            # One probe goes through; everyone else waits for its outcome
+            self.assertTrue(breaker.allow())
+            self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+            self.assertFalse(breaker.allow())
+            breaker.record_failure()
+            self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        with mock.patch('stocks.ingestion.time.monotonic', return_value=162.0):
+            self.assertTrue(breaker.allow())
+            breaker.record_success()
+            self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.trips, 2)
+
+    def test_guard_fails_fast_when_not_blocking(self):
+        guard = UpstreamGuard(AdaptiveConcurrency(1), CircuitBreaker(threshold=1, reset_timeout=60))
+
+        def throttled():
+            raise ThrottledError('429')
+
+        with self.assertRaises(ThrottledError):
+            guard.call(throttled)
+        self.assertEqual(guard.breaker.state, CircuitBreaker.OPEN)
+        fetch = mock.Mock()
+        with self.assertRaises(CircuitOpenError) as raised:
+            guard.call(fetch, block=False)
+        fetch.assert_not_called()
+        self.assertGreater(raised.exception.retry_after, 0)
+        self.assertEqual(guard.stats()['throttled'], 1)
+
+    def test_other_errors_do_not_count_as_throttling(self):
+        guard = UpstreamGuard(AdaptiveConcurrency(4), CircuitBreaker(threshold=1))
+
+        def broken():
+            raise ProviderError('no data for symbol')
+
+        with self.assertRaises(ProviderError):
+            guard.call(broken)
+        self.assertEqual(guard.concurrency.limit, 4)
+        self.assertEqual(guard.breaker.state, CircuitBreaker.CLOSED)
+
+
+class IngestionEngineTests(SimpleTestCase):
+    """The engine spaces requests with the token bucket and isolates per-item failures."""
+
+    def test_bucket_spaces_requests_after_the_burst(self):
+        with mock.patch('stocks.ingestion.time.monotonic', return_value=100.0) as monotonic:
+            bucket = TokenBucket(10, capacity=2)
+            delays = [bucket._reserve() for _ in range(4)]
+            self.assertEqual(delays[:2], [0.0, 0.0])
+            self.assertAlmostEqual(delays[2], 0.1)
+            self.assertAlmostEqual(delays[3], 0.2)
+            self.assertAlmostEqual(bucket.waited, 0.3)
+
+            # Refills at the rate, but never beyond the capacity
+            monotonic.return_value = 110.0
+            self.assertEqual([bucket._reserve() for _ in range(2)], [0.0, 0.0])
+            self.assertGreater(bucket._reserve(), 0)
+
+    def test_failures_are_counted_per_item(self):
+        results, errors = [], []
+
+        def fetch(item):
+            if item == 'BAD':
+                raise ProviderError('no data')
+            return item.lower()
+
+        def on_result(item, result):
+            if item == 'OOPS':
+                raise ValueError('cannot store')
+            results.append(result)
+
+        engine = IngestionEngine(fetch, limiter=TokenBucket(1000), max_in_flight=2).run(
+            ['AAA', 'BAD', 'OOPS', 'BBB', 'CCC'], on_result, lambda item, error: errors.append(item)
+        )
+        self.assertEqual(sorted(results), ['aaa', 'bbb', 'ccc'])
+        self.assertEqual(sorted(errors), ['BAD', 'OOPS'])
+        self.assertEqual((engine.completed, engine.failed), (3, 2))
+
+    def test_errors_without_handler_are_logged(self):
+        engine = IngestionEngine(lambda item: item, limiter=TokenBucket(1000), max_in_flight=2)
+        with self.assertLogs('stocks.ingestion', 'ERROR'):
+            engine.run(['AAA', 'BBB'], on_result=lambda item, result: 1 / 0)
+        self.assertEqual((engine.completed, engine.failed), (0, 2))
+
+    def test_fetches_stay_within_max_in_flight(self):
+        lock = threading.Lock()
+        in_flight = peak = 0
+
+        def fetch(item):
+            nonlocal in_flight, peak
+            with lock:
+                in_flight += 1
+                peak = max(peak, in_flight)
+            time.sleep(0.01)
+            with lock:
+                in_flight -= 1
+
+        engine = IngestionEngine(fetch, limiter=TokenBucket(1000), max_in_flight=3).run(range(12))
+        self.assertEqual(engine.completed, 12)
+        self.assertLessEqual(peak, 3)
+
+
+class QuoteCacheTests(SimpleTestCase):
+    """Quotes expire after the TTL and the least recently used one is evicted."""
+
+    def test_entries_expire(self):
+        cache = QuoteCache(ttl=60)
+        with mock.patch('stocks.cache.time.monotonic', return_value=100.0) as monotonic:
+            cache.set('TCS', {'current_price': 3500.0})
+            monotonic.return_value = 159.0
+            self.assertEqual(cache.get('TCS'), {'current_price': 3500.0})
+            monotonic.return_value = 161.0
+            self.assertIsNone(cache.get('TCS'))
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (1, 1, 0))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = QuoteCache(maxsize=2)
+        cache.set('TCS', 1)
+        cache.set('INFY', 2)
+        cache.get('TCS')
+        cache.set('WIPRO', 3)
+        self.assertIsNone(cache.get('INFY'))
+        self.assertEqual((cache.get('TCS'), cache.get('WIPRO')), (1, 3))
+        self.assertEqual(cache.evictions, 1)
+
+
+@override_settings(FUNDAMENTALS_TTL=timedelta(hours=24))
+class FundamentalsTTLTests(TestCase):
+    """Fundamentals are only refetched once they are older than FUNDAMENTALS_TTL."""
+
+    def setUp(self):
+        now = timezone.now()
+        Stock.objects.create(
+            symbol='FRESH', name='Fresh Limited', market_cap=Decimal('5000.00'),
+            fundamentals_updated_at=now - timedelta(hours=2)
+        )
+        Stock.objects.create(symbol='OLD', name='Old Limited', fundamentals_updated_at=now - timedelta(hours=30))
+        Stock.objects.create(symbol='NEVER', name='Never Limited')
+
+    def test_stale_symbols(self):
+        self.assertEqual(stale_fundamentals(['FRESH', 'OLD', 'NEVER', 'NEW']), {'OLD', 'NEVER', 'NEW'})
+        fresh = fresh_fundamentals(['FRESH', 'OLD'])
+        self.assertEqual(list(fresh), ['FRESH'])
+        self.assertEqual(fresh['FRESH']['market_cap'], Decimal('5000.00'))
+
+    def test_price_only_update_leaves_fundamentals_alone(self):
+        command = UpdateCommand()
+        info = {'currentPrice': 100.0, 'regularMarketPreviousClose': 98.0, 'marketCap': 1000, 'trailingPE': 20.0}
+        prices = command.build_update_data('OLD', info, {}, fundamentals=False)
+        self.assertNotIn('market_cap', prices)
+        self.assertNotIn('fundamentals_updated_at', prices)
+        full = command.build_update_data('OLD', info, {}, fundamentals=True)
+        self.assertEqual((full['market_cap'], full['pe_ratio']), (1000, 20.0))
+        self.assertIn('fundamentals_updated_at', full)
+
+    def test_fresh_fundamentals_skip_the_info_request(self):
+        provider = mock.Mock()
+        provider.get_history.return_value = mock.Mock(empty=False)
+        service = NseService(provider=provider)
+        stored = fresh_fundamentals(['FRESH'])['FRESH']
+        _, fundamentals = service._download_stock_data('FRESH', fundamentals=stored)
+        provider.get_info.assert_not_called()
+        self.assertEqual(fundamentals, stored)
+
+
+class NseServiceFetchTests(TestCase):
+    """Request-path fetches leave throttling to the shared upstream guard."""
+
+    def setUp(self):
+        self.guard = UpstreamGuard(AdaptiveConcurrency(4), CircuitBreaker(threshold=3))
+        self.provider = mock.Mock()
+        self.service = NseService(provider=self.provider)
+        patchers = [
+            mock.patch('stocks.services.upstream_guard', self.guard),
+            mock.patch('stocks.services.upstream_limiter'),
+            mock.patch('stocks.services.time.sleep'),
+        ]
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+        _, self.limiter, self.sleep = [patcher.start() for patcher in patchers]
+
+    def test_every_provider_call_takes_a_token(self):
+        self.provider.get_history.return_value = mock.Mock(empty=False)
+        self.provider.get_info.return_value = {'longName': 'Tata Consultancy Services'}
+        hist, fundamentals = self.service._download_stock_data('TCS')
+        self.assertEqual(fundamentals['name'], 'Tata Consultancy Services')
+        self.assertEqual(self.limiter.acquire_sync.call_count, 2)
+
+        # The ingestion engine takes the history token itself
+        self.limiter.reset_mock()
+        self.service._download_stock_data('TCS', token_taken=True)
+        self.assertEqual(self.limiter.acquire_sync.call_count, 1)
+
+    def test_quotes_are_fetched_once_per_cycle(self):
+        index = pd.DatetimeIndex([pd.Timestamp(timezone.localdate() - timedelta(days=days)) for days in (1, 0)])
+        self.provider.get_history.return_value = pd.DataFrame({
+            'Open': [100.0, 101.0], 'High': [101.0, 103.0], 'Low': [99.0, 100.0],
+            'Close': [100.0, 102.0], 'Volume': [1000.0, 1200.0]
+        }, index=index)
+        self.provider.get_info.return_value = {'marketCap': 1000000, 'sector': 'Technology'}
+
+        first = self.service.fetch_many(['TCS'])
+        self.assertEqual(first['TCS']['change_percentage'], 2.0)
+        self.assertEqual(self.service.get_stock_data('TCS'), first['TCS'])
+        self.assertEqual(self.service.fetch_many(['TCS']), first)
+        self.assertEqual(self.provider.get_history.call_count, 1)
+        self.assertEqual(self.service.quotes.stats()['hits'], 2)
+
+    def test_throttled_fetch_is_not_retried(self):
+        self.provider.get_history.side_effect = ThrottledError('429')
+        self.assertEqual(self.service._download_stock_data('TCS'), (None, None))
+        self.assertEqual(self.provider.get_history.call_count, 1)
+        self.sleep.assert_not_called()
+        self.assertEqual(self.guard.stats()['throttled'], 1)
+
+    def test_other_errors_are_retried(self):
+        self.provider.get_history.side_effect = ProviderError('bad response')
+        self.assertEqual(self.service._download_stock_data('TCS', retries=3), (None, None))
+        self.assertEqual(self.provider.get_history.call_count, 3)
+        self.assertEqual(self.guard.stats()['throttled'], 0)
+
+
+class SchedulerTests(TestCase):
+    """The scheduler refreshes due symbols by tier and keeps sector performance current."""
+
+    def scheduler(self, **options):
+        command = SchedulerCommand()
+        command.options = {
+            'hot_size': 2, 'hot_interval': 5, 'cold_interval': 300, 'cold_batch': 2, 'sector_interval': 60,
+            **options
+        }
+        command.updater = mock.Mock()
+        command.queued_at = {}
+        command.sectors_at = None
+        command.sectors_changed = 0
+        return command
+
+    def test_due_symbols_by_tier(self):
+        now = timezone.now()
+
+        def stock(symbol, seconds_ago, market_cap=None):
+            updated = now - timedelta(seconds=seconds_ago) if seconds_ago is not None else None
+            return Stock.objects.create(symbol=symbol, name=symbol, market_cap=market_cap, price_updated_at=updated)
+
+        stock('BIG1', 10, Decimal('9000.00'))
+        stock('BIG2', 1, Decimal('8000.00'))
+        watched = stock('WATCH', None, Decimal('10.00'))
+        user = User.objects.create_user(username='watcher', email='watcher@example.com', password='secret')
+        Watchlist.objects.create(user=user, stock=watched)
+        stock('C1', None)
+        stock('C2', 600)
+        stock('C3', 400)
+        stock('C4', 10)
+
+        scheduler = self.scheduler()
+        hot, cold = scheduler.due_symbols(now)
+        self.assertEqual(sorted(hot), ['BIG1', 'WATCH'])
+        # The long tail goes oldest first, at most --cold-batch per tick
+        self.assertEqual(cold, ['C1', 'C2'])
+
+        # Symbols queued on an earlier tick are not queued again before their interval
+        scheduler.queued_at['C1'] = time.monotonic()
+        scheduler.queued_at['BIG1'] = time.monotonic()
+        hot, cold = scheduler.due_symbols(now)
+        self.assertEqual(hot, ['WATCH'])
+        self.assertEqual(cold, ['C2', 'C3'])
+
+    def test_sectors_are_recomputed_while_prices_change(self):
+        scheduler = self.scheduler()
+        writer = mock.Mock(rows_changed=0)
+        with mock.patch('stocks.management.commands.run_scheduler.time.monotonic') as monotonic:
+            monotonic.return_value = 1000.0
+            scheduler.refresh_sectors(writer)
+            scheduler.updater.update_sector_performance.assert_not_called()
+
+            writer.rows_changed = 3
+            scheduler.refresh_sectors(writer)
+            self.assertEqual(scheduler.updater.update_sector_performance.call_count, 1)
+
+            # At most once per interval
+            writer.rows_changed = 5
+            monotonic.return_value = 1030.0
+            scheduler.refresh_sectors(writer)
+            self.assertEqual(scheduler.updater.update_sector_performance.call_count, 1)
+            monotonic.return_value = 1061.0
+            scheduler.refresh_sectors(writer)
+            self.assertEqual(scheduler.updater.update_sector_performance.call_count, 2)
+
+            # Nothing changed since the last update
+            monotonic.return_value = 1200.0
+            scheduler.refresh_sectors(writer)
+            self.assertEqual(scheduler.updater.update_sector_performance.call_count, 2)
@@ -22,6 +22,8 @@ auth_urls = [
 stock_urls = [
     path('stocks/dashboard-data/', views.StockViewSet.as_view({'get': 'dashboard_data'}), name='dashboard-data'),
     path('stocks/heatmap/', views.get_heatmap_data, name='stock_heatmap'),
+    path('stocks/update/', views.NseUpdateView.as_view(), name='nse-update'),
+    path('jobs/<int:job_id>/', views.JobStatusView.as_view(), name='job-status'),
 ]
 
 # Watchlist URLs
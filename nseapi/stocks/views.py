@@ -8,26 +8,40 @@ This module contains views for handling stock-related operations including:
 """
 
 import logging
-import random
 from datetime import timedelta, time
 import pytz
 from django.shortcuts import render
 from django.utils import timezone
 from django.views import View
 from rest_framework import status, viewsets
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes, renderer_classes
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
+from rest_framework.request import Request
 from rest_framework.views import APIView
 from django.http import JsonResponse
-from django.db import models
 from django.db.models import Q
-from django.core.exceptions import ObjectDoesNotExist
-import decimal
-from rest_framework.permissions import IsAuthenticated
-
-from .models import Stock, TopSector, Watchlist, ChatMessage
-from .serializers import StockSerializer, TopSectorSerializer, ChatMessageSerializer
-from .services import NseService
+from django.utils.decorators import method_decorator
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+
+from rest_framework.reverse import reverse
+
+from . import dashboard, heatmap
+from .snapshot import (
+    LISTINGS, bump_data_version, django_json, drf_json, get_snapshot, json_response, market_conditional,
+    request_snapshot
+)
+from .encodings import bulk_response
+from .jobs import dispatch, enqueue
+from .models import Stock, TopSector, Watchlist, ChatMessage, IngestionJob
+from .pagination import StockCursorPagination, StockScreenPagination, wants_full_dump
+from .search import get_search_index
+from .sectors import stored_sectors
+from .renderers import STOCK_RENDERERS, FastJSONRenderer
+from .serializers import (
+    StockSerializer, TopSectorSerializer, ChatMessageSerializer, IngestionJobSerializer,
+    sector_rows, stock_values, typed_stocks
+)
 
 
 logger = logging.getLogger(__name__)
@@ -77,19 +91,38 @@ def stock_dashboard(request):
     last_24h = now - timedelta(hours=24)
     recent_stocks = Stock.objects.filter(last_updated__gte=last_24h).order_by('-last_updated')[:10]
     top_sectors = TopSector.objects.all().order_by('-performance')[:3]
+    breadth = dashboard.market_breadth()
     
     context = {
-        'total_stocks': Stock.objects.count(),
+        'total_stocks': breadth['total_stocks'],
         'top_stocks': top_stocks,
         'top_sectors': top_sectors,
         'market_status': market_status,
         'recent_stocks': recent_stocks,
-        'gainer_count': Stock.objects.filter(change_percentage__gt=0).count(),
-        'loser_count': Stock.objects.filter(change_percentage__lt=0).count(),
+        'gainer_count': breadth['gainers_count'],
+        'loser_count': breadth['losers_count'],
     }
     return render(request, 'stocks/dashboard.html', context)
 
 
+def build_dashboard_payload():
+    """Dashboard lists and breadth counts; market status is added per request."""
+    # Top gainers, top losers and most active stocks (by market cap)
+    lists = dashboard.top_lists(limit=5)
+    sectors = dashboard.top_sectors(limit=5)
+    logger.info(
+        f"Found {len(lists['top_gainers'])} top gainers, {len(lists['top_losers'])} top losers, "
+        f"{len(lists['most_active'])} most active stocks and {len(sectors)} sector performances"
+    )
+    return {
+        'top_gainers': StockSerializer(lists['top_gainers'], many=True).data,
+        'top_losers': StockSerializer(lists['top_losers'], many=True).data,
+        'most_active': StockSerializer(lists['most_active'], many=True).data,
+        'sector_performance': TopSectorSerializer(sectors, many=True).data,
+        'stats': dashboard.market_breadth()
+    }
+
+
 class StockViewSet(viewsets.ModelViewSet):
     """ViewSet for managing stock-related operations.
 
@@ -101,6 +134,8 @@ class StockViewSet(viewsets.ModelViewSet):
 
     queryset = Stock.objects.all()
     serializer_class = StockSerializer
+    pagination_class = StockCursorPagination
+    renderer_classes = STOCK_RENDERERS
 
     def get_queryset(self):
         """Get alphabetically sorted stocks.
@@ -110,6 +145,51 @@ class StockViewSet(viewsets.ModelViewSet):
         """
         return Stock.objects.all().order_by('symbol')
 
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        self.stocks_changed()
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.stocks_changed()
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        self.stocks_changed()
+
+    def stocks_changed(self):
+        """Invalidate the snapshots after a write through the API.
+
+        Symbols and names may have changed too, so the listings version
+        (the search index) is bumped along with the market one.
+        """
+        bump_data_version()
+        bump_data_version(LISTINGS)
+
+    @method_decorator(market_conditional())
+    def list(self, request, *args, **kwargs):
+        """List stocks by symbol, one cursor page at a time.
+
+        ``?all=1`` returns every stock as a plain list, the shape this
+        endpoint had before it was paginated.
+        """
+        if wants_full_dump(request):
+            return self.full_dump()
+        return self.stock_page()
+
+    def stock_page(self):
+        """One cursor page of stocks, serialized from ``values()`` rows."""
+        page = self.paginate_queryset(stock_values(self.get_queryset()))
+        return self.get_paginated_response(typed_stocks(page))
+
+    def full_dump(self):
+        """Every stock ordered by symbol, encoded once per data version.
+
+        Columnar MessagePack and gzip/brotli are negotiated, see stocks/encodings.py.
+        """
+        market = request_snapshot(self.request)
+        return bulk_response(self.request, market, 'all_stocks_az', market.stock_rows)
+
     @action(detail=False, methods=['get'])
     def search_stocks(self, request):
         """Search stocks by symbol or name."""
@@ -146,97 +226,116 @@ class StockViewSet(viewsets.ModelViewSet):
             )
 
     @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """Suggest stocks for a partially typed symbol or company name.
+
+        Served from the in-memory index in stocks/search.py; ranked exact
+        symbol, prefix, substring, then fuzzy matches.
+
+        Query params:
+            q (str): Text typed so far
+            limit (int): Maximum suggestions, default 10, at most 50
+        """
+        query = request.query_params.get('q', '')
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            return Response({"error": "Invalid limit value"}, status=status.HTTP_400_BAD_REQUEST)
+
+        results, took_us = get_search_index().search(query, limit)
+        response = Response({'query': query, 'results': results, 'took_us': round(took_us, 1)})
+        response['Server-Timing'] = f"search;dur={took_us / 1000:.3f}"
+        return response
+
+    @action(detail=False, methods=['get'])
+    @method_decorator(market_conditional())
     def top_performers(self, request):
         """Retrieve top performing stocks.
 
         Returns:
             Response: Serialized data of top 20 stocks by change percentage
         """
-        top_stocks = Stock.objects.all().order_by('-change_percentage')[:20]
-        serializer = self.get_serializer(top_stocks, many=True)
-        return Response(serializer.data)
+        market = request_snapshot(request)
+
+        def build():
+            ranked = sorted(
+                (stock for stock in market.stock_rows() if stock['change_percentage'] is not None),
+                key=lambda stock: stock['change_percentage'],
+                reverse=True
+            )
+            return drf_json(ranked[:20])
+
+        return json_response(market.view('top_performers', build))
 
     @action(detail=False, methods=['get'])
+    @method_decorator(market_conditional())
     def sectors(self, request):
-        """Calculate and retrieve sector performance data.
+        """Retrieve sector performance data.
 
-        Filters out invalid sectors and calculates weighted performance
-        based on market capitalization.
+        Sector performance is computed and stored by ingestion
+        (see stocks/sectors.py); this only reads it.
 
         Returns:
-            Response: Top 10 sectors with performance metrics
-                     or error response if calculation fails
-
-        Raises:
-            HTTP 500: If sector calculation fails
+            Response: Top 10 sectors by absolute market-cap weighted
+                     performance, with their largest movers
         """
-        try:
-            stocks = Stock.objects.filter(
-                sector__isnull=False,
-                change_percentage__isnull=False,
-                current_price__gt=0
-            ).exclude(
-                sector__in=['', 'Unknown', 'unknown']
-            ).select_related()
-            
-            top_sectors = calculate_sector_performance(stocks)[:10]
-            
-            for sector_data in top_sectors:
-                TopSector.objects.update_or_create(
-                    name=sector_data['name'],
-                    defaults={
-                        'change_percentage': sector_data['performance'],
-                        'performance': sector_data['performance'],
-                        'stocks_count': sector_data['stocks_count']
-                    }
-                )
-            
-            return Response({
-                'sectors': top_sectors,
-                'total_sectors': len(top_sectors)
-            })
-            
-        except Exception as e:
-            logger.error(f"Error calculating sector performance: {str(e)}")
-            return Response(
-                {"error": "Failed to calculate sector performance"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+        market = request_snapshot(request)
+
+        def build():
+            top_sectors = stored_sectors(limit=10)
+            return drf_json({'sectors': top_sectors, 'total_sectors': len(top_sectors)})
+
+        return json_response(market.view('sectors', build))
 
     @action(detail=False, methods=['get'])
+    @method_decorator(market_conditional())
     def all_stocks_az(self, request):
-        """Get all stocks sorted alphabetically by symbol."""
-        stocks = Stock.objects.all().order_by('symbol')
-        serializer = self.get_serializer(stocks, many=True)
-        return Response(serializer.data)
+        """Get all stocks sorted alphabetically by symbol.
+
+        Paginated like ``list``; ``?all=1`` returns the full list.
+        """
+        if wants_full_dump(request):
+            return self.full_dump()
+        return self.stock_page()
 
     @action(detail=False, methods=['get'])
     def filtered_stocks(self, request):
-        """Retrieve stocks filtered by threshold and sector."""
+        """Retrieve stocks trading within ``threshold`` of their 52-week high.
+
+        ``current_price >= high_52w * (1 - threshold)`` is the same as
+        ``distance_from_high <= threshold``, so the screen is a range scan on
+        the indexed column ingestion maintains. Stocks without a price or
+        52-week high have no distance and are left out.
+
+        Query params:
+            threshold (float): Maximum distance below the high, default 0.3
+            sectors (str): Comma separated sectors to include
+            sort (str): ``proximity`` for closest to the high first; by symbol otherwise
+            page, page_size (int): See StockScreenPagination
+        """
         try:
             threshold = float(request.query_params.get('threshold', 0.3))
         except ValueError:
             return Response({"error": "Invalid threshold value"}, status=status.HTTP_400_BAD_REQUEST)
 
+        queryset = Stock.objects.filter(distance_from_high__lte=threshold)
+
         sectors = request.query_params.get('sectors', '')
-        queryset = Stock.objects.all()
-        
         if sectors:
-            sector_list = sectors.split(',')
-            queryset = queryset.filter(sector__in=sector_list)
-        
-        # First filter by sector, then sort by symbol
-        queryset = queryset.order_by('symbol')
-        
-        filtered_stocks = [
-            stock for stock in queryset
-            if stock.current_price >= stock.high_52w * (1 - threshold)
-        ]
-        
-        serializer = self.get_serializer(filtered_stocks, many=True)
-        return Response(serializer.data)
+            queryset = queryset.filter(sector__in=sectors.split(','))
+
+        if request.query_params.get('sort') == 'proximity':
+            queryset = queryset.order_by('distance_from_high', 'symbol')
+        else:
+            queryset = queryset.order_by('symbol')
+
+        paginator = StockScreenPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     @action(detail=False, methods=['get'], url_path='dashboard-data')
+    @method_decorator(market_conditional(extra=lambda: 'open' if is_market_open() else 'closed'))
     def dashboard_data(self, request):
         """Get aggregated data for the dashboard.
         
@@ -247,46 +346,19 @@ class StockViewSet(viewsets.ModelViewSet):
                 - Most active stocks
                 - Sector performance
                 - Market statistics
+
+        Query budget: ``dashboard.DASHBOARD_QUERIES`` (5) plus
+        ``snapshot.VALIDATOR_QUERIES`` (1) once per data version; other
+        requests are served from the market snapshot, and clients sending a
+        current ETag get a 304.
         """
         try:
             logger.info("Fetching dashboard data")
-            
-            # Get top gainers (stocks with highest positive change)
-            top_gainers = Stock.objects.filter(
-                change_percentage__gt=0
-            ).order_by('-change_percentage')[:5]
-            logger.info(f"Found {top_gainers.count()} top gainers")
-
-            # Get top losers (stocks with lowest negative change)
-            top_losers = Stock.objects.filter(
-                change_percentage__lt=0
-            ).order_by('change_percentage')[:5]
-            logger.info(f"Found {top_losers.count()} top losers")
-
-            # Get most active stocks (by market cap)
-            most_active = Stock.objects.exclude(
-                market_cap__isnull=True
-            ).order_by('-market_cap')[:5]
-            logger.info(f"Found {most_active.count()} most active stocks")
-
-            # Get sector performance
-            sectors = TopSector.objects.all().order_by('-change_percentage')[:5]
-            logger.info(f"Found {sectors.count()} sector performances")
-
-            # Calculate market statistics
-            total_stocks = Stock.objects.count()
-            gainers_count = Stock.objects.filter(change_percentage__gt=0).count()
-            losers_count = Stock.objects.filter(change_percentage__lt=0).count()
-
+            payload = request_snapshot(request).view('dashboard', build_dashboard_payload)
             response_data = {
-                'top_gainers': StockSerializer(top_gainers, many=True).data,
-                'top_losers': StockSerializer(top_losers, many=True).data,
-                'most_active': StockSerializer(most_active, many=True).data,
-                'sector_performance': TopSectorSerializer(sectors, many=True).data,
+                **payload,
                 'stats': {
-                    'total_stocks': total_stocks,
-                    'gainers_count': gainers_count,
-                    'losers_count': losers_count,
+                    **payload['stats'],
                     'market_status': 'Open' if is_market_open() else 'Closed'
                 }
             }
@@ -304,8 +376,7 @@ class StockViewSet(viewsets.ModelViewSet):
 class TopSectorViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet for retrieving top performing sectors.
 
-    Provides read-only access to sector performance data with automatic
-    creation of 'Other' sector if no sectors exist.
+    Provides read-only access to the sector performance stored by ingestion.
 
     Attributes:
         queryset: All TopSector objects
@@ -314,51 +385,47 @@ class TopSectorViewSet(viewsets.ReadOnlyModelViewSet):
 
     queryset = TopSector.objects.all()
     serializer_class = TopSectorSerializer
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
 
-    def get_queryset(self):
-        """Get all sectors, ensuring 'Other' sector exists.
-
-        Creates an 'Other' sector with default values if no sectors exist
-        in the database.
-
-        Returns:
-            QuerySet: All TopSector objects
-        """
-        if not TopSector.objects.exists():
-            TopSector.objects.get_or_create(
-                name="Other",
-                defaults={"performance": 0.0, "stocks_count": 0}
-            )
-        return TopSector.objects.all()
+    def list(self, request, *args, **kwargs):
+        return Response(sector_rows(self.get_queryset()))
 
 class NseUpdateView(APIView):
     """API View for updating stock data from NSE.
 
     Provides an endpoint to trigger manual updates of stock data
-    from the National Stock Exchange.
+    from the National Stock Exchange. Only staff users may start one.
     """
 
+    permission_classes = [IsAdminUser]
+
     def post(self, request):
         """Handle POST request to update stock data.
 
-        Triggers the NSE service to fetch and update stock data
-        in the database.
+        Queues a background job that fetches and updates stock data. If an
+        update is already queued or running, the request attaches to it
+        instead of starting a second one.
 
         Args:
             request: HTTP request object
 
         Returns:
-            Response: Success message or error details
+            Response: 202 with the job id and the URL to poll for its status
 
         Raises:
-            HTTP 500: If update process fails
+            HTTP 500: If the job cannot be queued
         """
         try:
-            service = NseService()
-            service.update_stock_data()
+            job, created = enqueue('nse_update')
+            dispatch()
             return Response(
-                {"status": "Data updated successfully"},
-                status=status.HTTP_200_OK
+                {
+                    "job_id": job.pk,
+                    "status": job.status,
+                    "created": created,
+                    "status_url": reverse('job-status', args=[job.pk], request=request)
+                },
+                status=status.HTTP_202_ACCEPTED
             )
         except Exception as e:
             logger.error(f"NSE Update failed: {str(e)}")
@@ -367,6 +434,19 @@ class NseUpdateView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+
+class JobStatusView(APIView):
+    """API View reporting the progress and timings of a background job."""
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, job_id):
+        try:
+            job = IngestionJob.objects.get(pk=job_id)
+        except IngestionJob.DoesNotExist:
+            return Response({"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(IngestionJobSerializer(job).data)
+
 class StockDataView(View):
     """Django View for rendering stock data on the dashboard."""
     def get(self, request):
@@ -408,41 +488,61 @@ class StockDataView(View):
         return sorted({v['sector'] for v in symbols.values()})
 
 class DashboardDataAPI(APIView):
-    """API View to retrieve dashboard stock statistics."""
+    """API View to retrieve dashboard stock statistics.
+
+    Query budget: ``dashboard.BREADTH_QUERIES`` (1) once per data version.
+    """
     def get(self, request):
         market_status = "Open" if is_market_open() else "Closed"
-        gainers_count = Stock.objects.filter(change_percentage__gt=0).count()
-        losers_count = Stock.objects.filter(change_percentage__lt=0).count()
+        breadth = get_snapshot().view('breadth', dashboard.market_breadth)
 
         data = {
-            "total_stocks": Stock.objects.count(),
+            "total_stocks": breadth['total_stocks'],
             "market_status": market_status,
-            "gainers_count": gainers_count,
-            "losers_count": losers_count,
+            "gainers_count": breadth['gainers_count'],
+            "losers_count": breadth['losers_count'],
         }
         return Response(data)
 
+@market_conditional()
 def stock_list(request):
+    """Stock summaries by symbol in cursor pages, or all of them with ``?all=1``."""
+    def summary(stock):
+        return {
+            'symbol': stock.symbol,
+            'name': stock.name,
+            'sector': stock.sector,
+            'current_price': stock.current_price,
+            'change_percentage': stock.change_percentage
+        }
+
     try:
-        stocks = list(Stock.objects.values(
-            'symbol', 'name', 'sector', 'current_price', 'change_percentage'
-        ))
-        return JsonResponse(stocks, safe=False)
+        if wants_full_dump(request):
+            market = request_snapshot(request)
+            body = market.view('stock_list', lambda: django_json([summary(stock) for stock in market.stocks()]))
+            return json_response(body)
+
+        paginator = StockCursorPagination()
+        page = paginator.paginate_queryset(Stock.objects.all(), Request(request))
+        return json_response(django_json({
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
+            'results': [summary(stock) for stock in page]
+        }))
     except Exception as e:
         logger.error(f"Error in stock_list view: {str(e)}")
         return JsonResponse({'error': 'Internal server error'}, status=500)
 
 def dashboard_data(request):
+    # Query budget: dashboard.BREADTH_QUERIES (1) once per data version
     try:
-        total_stocks = Stock.objects.count()
-        gainers = Stock.objects.filter(change_percentage__gt=0)
-        losers = Stock.objects.filter(change_percentage__lt=0)
+        breadth = get_snapshot().view('breadth', dashboard.market_breadth)
         
         data = {
-            'totalStocks': total_stocks,
+            'totalStocks': breadth['total_stocks'],
             'marketStatus': 'Open' if is_market_open() else 'Closed',  # Use is_market_open() function
-            'gainersCount': gainers.count(),
-            'losersCount': losers.count()
+            'gainersCount': breadth['gainers_count'],
+            'losersCount': breadth['losers_count']
         }
         return JsonResponse(data)
     except Exception as e:
@@ -451,93 +551,34 @@ def dashboard_data(request):
 
 def top_performers(request):
     try:
-        # Get top 10 stocks with positive change percentage
-        top_stocks = list(Stock.objects.filter(
-            change_percentage__gt=0
-        ).order_by('-change_percentage')[:10].values(
-            'symbol', 'name', 'current_price', 'change_percentage'
-        ))
-        
-        # Format the data
-        formatted_stocks = [{
-            'symbol': stock['symbol'],
-            'name': stock['name'],
-            'current_price': float(stock['current_price']),
-            'change_percentage': float(stock['change_percentage'])
-        } for stock in top_stocks]
-        
-        return JsonResponse(formatted_stocks, safe=False)
+        market = get_snapshot()
+
+        def build():
+            # Get top 10 stocks with positive change percentage
+            top_stocks = sorted(
+                (stock for stock in market.stocks()
+                 if stock.change_percentage is not None and stock.change_percentage > 0),
+                key=lambda stock: stock.change_percentage,
+                reverse=True
+            )[:10]
+
+            # Format the data
+            return django_json([{
+                'symbol': stock.symbol,
+                'name': stock.name,
+                'current_price': float(stock.current_price),
+                'change_percentage': float(stock.change_percentage)
+            } for stock in top_stocks])
+
+        return json_response(market.view('top_performers_function', build))
     except Exception as e:
         logger.error(f"Error in top_performers view: {str(e)}")
         return JsonResponse({'error': 'Internal server error'}, status=500)
 
-def calculate_sector_performance(stocks_queryset):
-    """Calculate weighted performance metrics for each sector.
-
-    Processes stock data to calculate sector-wise performance using
-    market capitalization as weights. Includes top performing stocks
-    within each sector.
-
-    Args:
-        stocks_queryset (QuerySet): Filtered queryset of Stock objects
-
-    Returns:
-        list: Sorted list of sector dictionaries containing:
-            - name (str): Sector name
-            - performance (float): Weighted average performance
-            - stocks_count (int): Number of stocks in sector
-            - top_stocks (list): Top 5 performing stocks in sector
-
-    Notes:
-        - Excludes sectors with less than 2 stocks
-        - Uses market cap as weight, falls back to price * 1M if unavailable
-        - Sorts sectors by absolute performance value
-    """
-    sectors_data = {}
-    
-    for stock in stocks_queryset:
-        sector = stock.sector.strip()
-        if not sector or sector.lower() == 'unknown':
-            continue
-            
-        if sector not in sectors_data:
-            sectors_data[sector] = {
-                'total_weighted_change': 0,
-                'total_weight': 0,
-                'count': 0,
-                'stocks': []
-            }
-        
-        weight = float(stock.market_cap if stock.market_cap else (stock.current_price * 1000000))
-        
-        sectors_data[sector]['total_weighted_change'] += float(stock.change_percentage) * weight
-        sectors_data[sector]['total_weight'] += weight
-        sectors_data[sector]['count'] += 1
-        sectors_data[sector]['stocks'].append({
-            'symbol': stock.symbol,
-            'name': stock.name,
-            'change_percentage': float(stock.change_percentage)
-        })
-    
-    sectors_list = []
-    for sector, data in sectors_data.items():
-        if data['count'] >= 2:
-            avg_performance = data['total_weighted_change'] / data['total_weight']
-            sectors_list.append({
-                'name': sector,
-                'performance': round(avg_performance, 2),
-                'stocks_count': data['count'],
-                'top_stocks': sorted(data['stocks'], 
-                                  key=lambda x: abs(x['change_percentage']), 
-                                  reverse=True)[:5]
-            })
-    
-    return sorted(sectors_list, key=lambda x: abs(x['performance']), reverse=True)
-
 def sectors(request):
     """Retrieve top performing sectors.
 
-    A standalone view that uses the same sector calculation logic
+    A standalone view that reads the same stored sector performance
     as the ViewSet but returns only top 5 sectors.
 
     Args:
@@ -547,20 +588,10 @@ def sectors(request):
         JsonResponse: Top 5 sectors data or error response
 
     Raises:
-        HTTP 500: If sector calculation fails
+        HTTP 500: If the sectors cannot be read
     """
     try:
-        stocks = Stock.objects.filter(
-            sector__isnull=False,
-            change_percentage__isnull=False,
-            current_price__gt=0
-        ).exclude(
-            sector__in=['', 'Unknown', 'unknown']
-        ).select_related()
-        
-        top_sectors = calculate_sector_performance(stocks)[:5]
-        
-        return JsonResponse(top_sectors, safe=False)
+        return JsonResponse(stored_sectors(limit=5), safe=False)
     except Exception as e:
         logger.error(f"Error in sectors view: {str(e)}")
         return JsonResponse({'error': 'Internal server error'}, status=500)
@@ -639,42 +670,41 @@ def remove_from_watchlist(request, item_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes(STOCK_RENDERERS)
+@market_conditional()
 def get_heatmap_data(request):
     """
-    Get stock data for the heatmap visualization
-    Returns a list of stocks with price and percentage change for heatmap display
+    Get the stock heatmap as a sector-grouped treemap
+    Returns one tile per priced stock with its price, percentage change and
+    rectangle (see stocks/heatmap.py), as JSON or columnar MessagePack,
+    optionally compressed (see stocks/encodings.py)
+
+    Query Parameters:
+        sectors (str): Comma separated sectors to include
+        size (str): Market cap band to include: large, mid or small
     """
+    market = request_snapshot(request)
     try:
-        # Get all stocks with price and change data
-        stocks = Stock.objects.all()
-        
-        # Transform to dict for heatmap
-        heatmap_data = []
-        for stock in stocks:
-            # Use actual change_percentage if available, otherwise generate random
-            percent_change = stock.change_percentage if stock.change_percentage is not None else round(random.uniform(-8.0, 8.0), 2)
-            
-            heatmap_data.append({
-                'symbol': stock.symbol,
-                'name': stock.name,
-                'sector': stock.sector,
-                'price': float(stock.current_price) if hasattr(stock, 'current_price') and stock.current_price else 0.0,
-                'percent_change': float(percent_change),
-            })
-        
-        # Sort by sector and then by percentage change
-        heatmap_data.sort(key=lambda x: (x['sector'] or 'Unknown', -x['percent_change']))
-        
-        return Response(heatmap_data)
-    
+        sectors, size = heatmap.parse_filters(request.query_params, heatmap.known_sectors(market))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        cache = heatmap.cacheable(market, sectors, size)
+        return bulk_response(
+            request, market, heatmap.view_name(sectors, size),
+            lambda: heatmap.heatmap_rows(market, sectors, size, cache),
+            cache=cache
+        )
+
     except Exception as e:
-        import traceback
-        print(traceback.format_exc())
+        logger.exception(f"Error building heatmap: {str(e)}")
         return Response(
             {'error': str(e)},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+
 @api_view(['GET'])
 def get_chat_messages(request):
     """
@@ -0,0 +1,208 @@
+import logging
+import queue
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import connection, models
+
+from .history import save_bars
+from .models import Stock
+from .snapshot import bump_data_version
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+# Bookkeeping fields that change on every refresh; they are written along
+# with a real change but never count as one
+TIMESTAMP_FIELDS = {'last_updated', 'price_updated_at', 'fundamentals_updated_at'}
+# When fields were last checked upstream; written even when nothing changed,
+# because refresh scheduling is based on them
+CHECKED_FIELDS = {'price_updated_at', 'fundamentals_updated_at'}
+
+
+def normalize(field_name, value):
+    """Return ``value`` as the database would store it in ``field_name``.
+
+    Decimal fields are converted and rounded the way Django saves them
+    (floats go through ``max_digits`` significant digits first), so a
+    fetched float compares equal to the Decimal stored for it.
+    """
+    if value is None:
+        return None
+    field = Stock._meta.get_field(field_name)
+    if isinstance(field, models.DecimalField):
+        try:
+            return field.to_python(value).quantize(
+                Decimal(1).scaleb(-field.decimal_places), context=field.context
+            )
+        except (InvalidOperation, ValidationError):
+            return value
+    return value
+
+
+def changed_update(stored, update_data):
+    """Reduce an update to what actually needs writing.
+
+    Args:
+        stored (dict): Current values of the row, keyed by field name
+        update_data (dict): Fetched field values for the row
+
+    Returns:
+        dict: ``update_data`` if any value differs from the stored row; only
+            its CHECKED_FIELDS if the values were rechecked but unchanged (so
+            they are not refetched every cycle); otherwise None
+    """
+    for field_name, value in update_data.items():
+        if field_name in TIMESTAMP_FIELDS:
+            continue
+        if normalize(field_name, value) != normalize(field_name, stored[field_name]):
+            return update_data
+    checked = {field_name: value for field_name, value in update_data.items() if field_name in CHECKED_FIELDS}
+    return checked or None
+
+
+class StockBatchWriter:
+    """Write-behind writer for per-symbol Stock updates.
+
+    Fetch workers call ``put(symbol, update_data)`` and ``put_bars(bars)``
+    from any thread. A single writer thread drains the queue and applies the
+    updates with ``bulk_update`` (and the price bars with one upsert) in
+    batches, so only that thread holds a database connection no matter how
+    many fetch workers are running. Rows whose fetched values match the
+    stored ones only get their check timestamps (CHECKED_FIELDS) written,
+    which keeps ``last_updated`` and the data version stable for unchanged
+    stocks while the scheduler still sees them as refreshed.
+
+    Args:
+        batch_size (int): Maximum number of rows per bulk update
+        flush_interval (float): Seconds to wait for more rows before flushing
+            a partial batch
+        on_batch (callable): Optional ``on_batch(rows, elapsed)`` callback
+            invoked after every batch is written
+        journal (RunJournal): Optional run journal; written symbols are marked
+            done and buffered outcomes flushed after every batch
+    """
+
+    def __init__(self, batch_size=200, flush_interval=1.0, on_batch=None, journal=None):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.on_batch = on_batch
+        self.journal = journal
+        self.rows_written = 0
+        self.rows_changed = 0
+        self.rows_skipped = 0
+        self.batches_written = 0
+        self.write_seconds = 0.0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='stock-batch-writer', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def put(self, symbol, update_data):
+        """Queue field updates for a symbol; safe to call from any thread."""
+        self._queue.put((symbol, update_data))
+
+    def put_bars(self, bars):
+        """Queue unsaved PriceBar objects; safe to call from any thread."""
+        if bars:
+            self._queue.put((None, bars))
+
+    def close(self):
+        """Flush everything still queued and stop the writer thread."""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _run(self):
+        pending = {}
+        bars = []
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    if pending or bars:
+                        self._flush(pending, bars)
+                        pending, bars = {}, []
+                    continue
+
+                if item is _STOP:
+                    break
+
+                symbol, payload = item
+                if symbol is None:
+                    bars.extend(payload)
+                else:
+                    # A later result for the same symbol supersedes the earlier one
+                    pending[symbol] = payload
+                if len(pending) >= self.batch_size:
+                    self._flush(pending, bars)
+                    pending, bars = {}, []
+
+            if pending or bars:
+                self._flush(pending, bars)
+        finally:
+            connection.close()
+
+    def _flush(self, pending, bars):
+        started = time.perf_counter()
+        try:
+            save_bars(bars)
+            compared = set().union(*pending.values()) - TIMESTAMP_FIELDS
+            stored = {
+                row['symbol']: row
+                for row in Stock.objects.filter(symbol__in=list(pending)).values('id', 'symbol', *compared)
+            }
+
+            # bulk_update needs one field list per call, so group rows by the
+            # set of fields they carry
+            groups = {}
+            changed = skipped = 0
+            for symbol, update_data in pending.items():
+                if symbol not in stored:
+                    continue
+                update_data = changed_update(stored[symbol], update_data)
+                if update_data is None or CHECKED_FIELDS.issuperset(update_data):
+                    skipped += 1
+                else:
+                    changed += 1
+                if update_data is None:
+                    continue
+                fields = tuple(sorted(update_data))
+                groups.setdefault(fields, []).append(
+                    Stock(id=stored[symbol]['id'], symbol=symbol, **update_data)
+                )
+
+            rows = 0
+            for fields, stocks in groups.items():
+                rows += Stock.objects.bulk_update(stocks, list(fields), batch_size=self.batch_size)
+            if changed:
+                bump_data_version()
+        except Exception as e:
+            logger.error(f"Failed to write batch of {len(pending)} stocks: {str(e)}")
+            if self.journal:
+                self.journal.mark_failed(pending, e)
+            return
+
+        if self.journal:
+            self.journal.mark_done(pending)
+            self.journal.flush()
+
+        elapsed = time.perf_counter() - started
+        self.rows_written += rows
+        self.rows_changed += changed
+        self.rows_skipped += skipped
+        self.batches_written += 1
+        self.write_seconds += elapsed
+        if self.on_batch:
+            self.on_batch(rows, elapsed)